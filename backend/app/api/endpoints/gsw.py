@@ -1,18 +1,80 @@
-from fastapi import APIRouter, HTTPException, status, Request
-from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, status, Request, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional, Type, Union
 import numpy as np
 
 from app.schemas.gsw import (
     GSWInitRequest, GSWEncryptRequest, GSWDecryptRequest, 
-    GSWOperateRequest, GSWCiphertextErrorRequest, GSWResponse
+    GSWOperateRequest, GSWCiphertextErrorRequest, GSWEvaluateRequest, GSWResponse
 )
 from app.services.gsw_service import GSWService
+from app.services.executor import ServiceOverloaded, ServiceTimeout
+from rns import split_any_frames
+from metrics import timer
 
 # Create a single instance of the service for this API
 gsw_service = GSWService()
 
 router = APIRouter()
 
+# Binary mode: ciphertexts (and the decryption key) travel as back-to-back wire frames
+# from gsw.matrix_to_bytes, or RNS frames (rns.py) in RNS sessions; the remaining fields
+# become query parameters
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+def _is_binary_request(request: Request) -> bool:
+    content_type = request.headers.get("content-type", "")
+    return content_type.split(";")[0].strip().lower() == BINARY_MEDIA_TYPE
+
+def _wants_binary_response(request: Request) -> bool:
+    return BINARY_MEDIA_TYPE in request.headers.get("accept", "").lower()
+
+def _binary_response(content: bytes, message: str, handle: Optional[str] = None) -> Response:
+    headers = {"X-GSW-Message": message}
+    if handle is not None:
+        headers["X-GSW-Handle"] = handle
+    return Response(content=content, media_type=BINARY_MEDIA_TYPE, headers=headers)
+
+def _request_body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI request body for routes that accept JSON or binary frames."""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": model.model_json_schema()},
+                BINARY_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    }
+
+async def _read_body(fastapi_request: Request, model: Type[BaseModel]) -> Union[BaseModel, List[memoryview]]:
+    """Parse a JSON body into the model, or split a binary body into frames."""
+    body = await fastapi_request.body()
+    if _is_binary_request(fastapi_request):
+        try:
+            with timer("http.split_frames"):
+                return split_any_frames(body)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"success": False, "message": str(e)}
+            )
+    try:
+        with timer("http.parse_json"):
+            return model.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+def _expect_frames(frames: List[memoryview], count: int) -> List[memoryview]:
+    if len(frames) != count:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": f"Expected {count} binary frame(s), got {len(frames)}"}
+        )
+    return frames
+
 @router.post("/init", response_model=GSWResponse, status_code=status.HTTP_201_CREATED)
 async def initialize_gsw(request: GSWInitRequest, fastapi_request: Request) -> Dict[str, Any]:
     """
@@ -20,9 +82,10 @@ async def initialize_gsw(request: GSWInitRequest, fastapi_request: Request) -> D
     
     - **n**: Dimension of the lattice (1-10)
     - **q**: Modulus (must be > 1)
+    - **rns**: Represent q as a product of primes, for moduli past 2^15
     """
     try:
-        result = gsw_service.initialize(request.n, request.q, fastapi_request)
+        result = gsw_service.initialize(request.n, request.q, fastapi_request, rns=request.rns)
         return {
             "success": True,
             "message": result["message"],
@@ -31,7 +94,8 @@ async def initialize_gsw(request: GSWInitRequest, fastapi_request: Request) -> D
                 "q": result["q"],
                 "logq": result["logq"],
                 "l": result["l"],
-                "s": result["s"]
+                "s": result["s"],
+                "rns": result["rns"]
             }
         }
     except ValueError as e:
@@ -52,19 +116,30 @@ async def encrypt_plaintext(request: GSWEncryptRequest, fastapi_request: Request
     
     - **plaintext**: 2D array of integers to encrypt
     - **reset**: If True, resets the GSW instance before encryption
+    - **returnCiphertext**: If False, only the handle of the stored ciphertext is returned
+
+    Send `Accept: application/octet-stream` to receive the ciphertext as a binary frame.
     """
     try:
+        binary = _wants_binary_response(fastapi_request)
         # Ensure parameter order matches the service method definition
-        result = gsw_service.encrypt(
+        result = await gsw_service.run(
+            gsw_service.encrypt,
             plaintext=request.plaintext,
             request=fastapi_request,
-            reset=request.reset
+            reset=request.reset,
+            binary=binary,
+            return_ciphertext=request.returnCiphertext
         )
+        if binary:
+            return _binary_response(result["ciphertext"] or b"", result["message"], result["handle"])
         return {
             "success": True,
             "message": result["message"],
             "data": {
-                "ciphertext": result["ciphertext"]
+                "ciphertext": result["ciphertext"],
+                "handle": result["handle"],
+                "noise_budget": result["noise_budget"]
             }
         }
     except ValueError as e:
@@ -72,27 +147,50 @@ async def encrypt_plaintext(request: GSWEncryptRequest, fastapi_request: Request
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"success": False, "message": str(e)}
         )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"success": False, "message": f"An error occurred: {str(e)}"}
         )
 
-@router.post("/decrypt", response_model=GSWResponse)
-async def decrypt_ciphertext(request: GSWDecryptRequest, fastapi_request: Request) -> Dict[str, Any]:
+@router.post("/decrypt", response_model=GSWResponse, openapi_extra=_request_body_schema(GSWDecryptRequest))
+async def decrypt_ciphertext(fastapi_request: Request, reset: bool = Query(False)) -> Dict[str, Any]:
     """
     Decrypt a ciphertext using the provided key.
     
     - **ciphertext**: 2D array of integers to decrypt
+    - **ciphertextHandle**: Handle of a stored ciphertext, instead of `ciphertext`
     - **key**: Secret key for decryption
     - **reset**: If True, resets the GSW instance before decryption
+
+    With `Content-Type: application/octet-stream` the body is the ciphertext frame
+    followed by the key frame, and `reset` is a query parameter.
     """
+    body = await _read_body(fastapi_request, GSWDecryptRequest)
+    handle = None
+    if isinstance(body, GSWDecryptRequest):
+        ciphertext, handle, key, reset = body.ciphertext, body.ciphertextHandle, body.key, body.reset
+    else:
+        ciphertext, key = _expect_frames(body, 2)
     try:
-        result = gsw_service.decrypt(
-            ciphertext=request.ciphertext,
-            key=request.key,
+        result = await gsw_service.run(
+            gsw_service.decrypt,
+            ciphertext=ciphertext,
+            key=key,
             request=fastapi_request,
-            reset=request.reset
+            reset=reset,
+            handle=handle
         )
         return {
             "success": True,
@@ -106,35 +204,80 @@ async def decrypt_ciphertext(request: GSWDecryptRequest, fastapi_request: Reques
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"success": False, "message": str(e)}
         )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"success": False, "message": f"An error occurred: {str(e)}"}
         )
 
-@router.post("/operate", response_model=GSWResponse)
-async def operate_ciphertext(request: GSWOperateRequest, fastapi_request: Request) -> Dict[str, Any]:
+@router.post("/operate", response_model=GSWResponse, openapi_extra=_request_body_schema(GSWOperateRequest))
+async def operate_ciphertext(
+    fastapi_request: Request,
+    operation: Optional[str] = Query(None),
+    reset: bool = Query(False)
+) -> Dict[str, Any]:
     """
     Operate on a ciphertext.
     
-    - **operation**: Operation to perform (Add or Mult)
+    - **operation**: Operation to perform (Add or Mult). Mult is AND. Add is XOR in GSW
+      sessions, but addition in Z in RNS sessions: there a sum only decrypts while it is 0 or 1
     - **ciphertext**: 2D array of integers to operate on
+    - **ciphertextHandle**: Handle of a stored ciphertext, instead of `ciphertext`
     - **inputCiphertext**: 2D array of integers to operate with
+    - **inputCiphertextHandle**: Handle of a stored ciphertext, instead of `inputCiphertext`
     - **reset**: If True, resets the GSW instance before operating
+    - **returnCiphertext**: If False, only the handle of the stored result is returned
+
+    With `Content-Type: application/octet-stream` the body is the two ciphertext frames
+    and `operation`/`reset` are query parameters. Send `Accept: application/octet-stream`
+    to receive the result as a binary frame.
     """
+    body = await _read_body(fastapi_request, GSWOperateRequest)
+    handle, input_handle, return_ciphertext = None, None, True
+    if isinstance(body, GSWOperateRequest):
+        operation, ciphertext, inputCiphertext, reset = body.operation, body.ciphertext, body.inputCiphertext, body.reset
+        handle, input_handle, return_ciphertext = body.ciphertextHandle, body.inputCiphertextHandle, body.returnCiphertext
+    else:
+        ciphertext, inputCiphertext = _expect_frames(body, 2)
+    if operation is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": "Missing operation"}
+        )
     try:
-        result = gsw_service.operate(
-            operation=request.operation,
-            ciphertext=request.ciphertext,
-            inputCiphertext=request.inputCiphertext,
+        binary = _wants_binary_response(fastapi_request)
+        result = await gsw_service.run(
+            gsw_service.operate,
+            operation=operation,
+            ciphertext=ciphertext,
+            inputCiphertext=inputCiphertext,
             request=fastapi_request,
-            reset=request.reset
+            reset=reset,
+            binary=binary,
+            handle=handle,
+            input_handle=input_handle,
+            return_ciphertext=return_ciphertext
         )
+        if binary:
+            return _binary_response(result["ciphertext"] or b"", result["message"], result["handle"])
         return {
             "success": True,
             "message": result["message"],
             "data": {
-                "ciphertext": result["ciphertext"]
+                "ciphertext": result["ciphertext"],
+                "handle": result["handle"],
+                "noise_budget": result["noise_budget"]
             }
         }
     except ValueError as e:
@@ -142,25 +285,48 @@ async def operate_ciphertext(request: GSWOperateRequest, fastapi_request: Reques
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"success": False, "message": str(e)}
         )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"success": False, "message": f"An error occurred: {str(e)}"}
         )
 
-@router.post("/ciphertext_error", response_model=GSWResponse)
-async def get_ciphertext_error(request: GSWCiphertextErrorRequest, fastapi_request: Request) -> Dict[str, Any]:
+@router.post("/ciphertext_error", response_model=GSWResponse, openapi_extra=_request_body_schema(GSWCiphertextErrorRequest))
+async def get_ciphertext_error(fastapi_request: Request, reset: bool = Query(False)) -> Dict[str, Any]:
     """
     Get the error of a ciphertext.
     
     - **ciphertext**: 2D array of integers to check error for
+    - **ciphertextHandle**: Handle of a stored ciphertext, instead of `ciphertext`
     - **reset**: If True, resets the GSW instance before checking
+
+    With `Content-Type: application/octet-stream` the body is the ciphertext frame
+    and `reset` is a query parameter.
     """
+    body = await _read_body(fastapi_request, GSWCiphertextErrorRequest)
+    handle = None
+    if isinstance(body, GSWCiphertextErrorRequest):
+        ciphertext, handle, reset = body.ciphertext, body.ciphertextHandle, body.reset
+    else:
+        (ciphertext,) = _expect_frames(body, 1)
     try:
-        result = gsw_service.get_ciphertext_error(
-            ciphertext=request.ciphertext,
+        result = await gsw_service.run(
+            gsw_service.get_ciphertext_error,
+            ciphertext=ciphertext,
             request=fastapi_request,
-            reset=request.reset
+            reset=reset,
+            handle=handle
         )
         return {
             "success": True,
@@ -168,7 +334,10 @@ async def get_ciphertext_error(request: GSWCiphertextErrorRequest, fastapi_reque
             "data": {
                 "error": result["error"],
                 "max_valid_error": result["max_valid_error"],
-                "is_valid": result["is_valid"]
+                "is_valid": result["is_valid"],
+                "plaintext": result["plaintext"],
+                "noise_bound": result["noise_bound"],
+                "noise_budget": result["noise_budget"]
             }
         }
     except ValueError as e:
@@ -176,12 +345,162 @@ async def get_ciphertext_error(request: GSWCiphertextErrorRequest, fastapi_reque
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"success": False, "message": str(e)}
         )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"success": False, "message": f"An error occurred: {str(e)}"}
         )
 
+@router.post("/evaluate", response_model=GSWResponse)
+async def evaluate_circuit(request: GSWEvaluateRequest, fastapi_request: Request) -> Dict[str, Any]:
+    """
+    Evaluate a circuit of homomorphic gates in a single request.
+
+    - **inputs** / **inputHandles**: Input ciphertexts (matrices or stored handles) by node id
+    - **gates**: `{id, op, inputs}` gates in topological order; `op` is Add, Mult or Not, and
+      Add/Mult may take more than two inputs
+    - **outputs**: Gate ids to return (default: all gates)
+    - **returnCiphertext**: If False, only the handles of the stored outputs are returned
+    - **strict**: Refuse the circuit, before evaluating it, if an output's noise bound is unknown
+      or too large to decrypt
+
+    Independent gates of the same level run as one batched tensor operation.
+    """
+    try:
+        result = await gsw_service.run(
+            gsw_service.evaluate,
+            inputs=request.inputs,
+            input_handles=request.inputHandles,
+            gates=[(gate.id, gate.op, gate.inputs) for gate in request.gates],
+            request=fastapi_request,
+            outputs=request.outputs,
+            reset=request.reset,
+            return_ciphertext=request.returnCiphertext,
+            strict=request.strict
+        )
+        return {
+            "success": True,
+            "message": result["message"],
+            "data": {
+                "outputs": result["outputs"]
+            }
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": str(e)}
+        )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": f"An error occurred: {str(e)}"}
+        )
+
+@router.get("/ciphertext/{handle}", response_model=GSWResponse)
+async def get_stored_ciphertext(handle: str, fastapi_request: Request) -> Dict[str, Any]:
+    """
+    Download a ciphertext kept on the server under a handle.
+
+    Send `Accept: application/octet-stream` to receive it as a binary frame.
+    """
+    try:
+        binary = _wants_binary_response(fastapi_request)
+        result = await gsw_service.run(gsw_service.get_ciphertext, handle, fastapi_request, binary=binary)
+        if binary:
+            return _binary_response(result["ciphertext"], result["message"], handle)
+        return {
+            "success": True,
+            "message": result["message"],
+            "data": {
+                "ciphertext": result["ciphertext"],
+                "handle": handle
+            }
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"success": False, "message": str(e)}
+        )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": f"An error occurred: {str(e)}"}
+        )
+
+@router.delete("/ciphertext/{handle}", response_model=GSWResponse)
+async def delete_stored_ciphertext(handle: str, fastapi_request: Request) -> Dict[str, Any]:
+    """Drop a ciphertext kept on the server."""
+    try:
+        result = await gsw_service.run(gsw_service.delete_ciphertext, handle, fastapi_request)
+        return {
+            "success": True,
+            "message": result["message"],
+            "data": {"handle": handle}
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"success": False, "message": str(e)}
+        )
+    except ServiceOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"success": False, "message": str(e)},
+            headers={"Retry-After": "1"}
+        )
+    except ServiceTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail={"success": False, "message": str(e)}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": f"An error occurred: {str(e)}"}
+        )
+
+@router.get("/session_stats", response_model=GSWResponse)
+async def get_session_stats() -> Dict[str, Any]:
+    """Session table occupancy: live sessions, bytes used against the budget, hits, evictions and expirations."""
+    return {
+        "success": True,
+        "message": "Session statistics retrieved successfully",
+        "data": gsw_service.get_session_stats()
+    }
+
 @router.get("/model_info", response_model=GSWResponse)
 async def get_model_info(fastapi_request: Request) -> Dict[str, Any]:
     """Get information about the current GSW model."""
@@ -17,6 +17,47 @@ class Settings(BaseSettings):
     
     # Application
     DEBUG: bool = True
+
+    # Worker pool for CPU-bound GSW operations
+    GSW_EXECUTOR: str = "thread"  # "thread", "process" or "inline"
+    GSW_MAX_WORKERS: int = os.cpu_count() or 1
+    GSW_MAX_PENDING: int = 32  # queued + running jobs before answering 503
+    GSW_REQUEST_TIMEOUT: float = 60.0  # seconds
+
+    # Session table shared by all users: LRU eviction past the byte budget, expiry after the TTL
+    GSW_SESSION_MAX_BYTES: int = 1024 * 2**20
+    GSW_SESSION_TTL: int = 3600  # seconds since last access
+    GSW_SESSION_SHARDS: int = 16
+    GSW_SESSION_SWEEP_INTERVAL: int = 300  # seconds between expiry sweeps
+
+    # Where session keys are kept: "memory" (this process only) or "sqlite" (shared by all workers)
+    GSW_SESSION_BACKEND: str = "memory"
+    GSW_SESSION_DB_PATH: str = "gsw_sessions.db"
+    GSW_SESSION_TOUCH_INTERVAL: int = 60  # seconds between last-activity writes to the backend
+
+    # Server-side ciphertext store, per session
+    GSW_STORE_MAX_BYTES: int = 256 * 2**20
+
+    # Precomputed encryptions of zero per session key, refilled in the background below the
+    # low-water mark; /encrypt then only adds the message term. 0 disables the pool.
+    GSW_ENC_POOL_SIZE: int = 16
+    GSW_ENC_POOL_LOW_WATER: int = 8
+
+    # Pre-generated keys for /init and resets, per (n, q). Each set keeps as many keys as were
+    # taken in the last window (at most the depth); 0 disables the pool.
+    GSW_KEY_POOL_DEPTH: int = 4
+    GSW_KEY_POOL_WINDOW: float = 60.0  # seconds
+    GSW_KEY_POOL_PARAMS: int = 8  # parameter sets tracked at once
+
+    # Largest ciphertext of an RNS (large q) parameter set accepted by /init
+    GSW_RNS_MAX_CIPHERTEXT_BYTES: int = 16 * 2**20
+
+    # Per-request profiling via the X-GSW-Profile header (cprofile or pyinstrument).
+    # Metrics are switched on separately with GSW_METRICS=1 in the process environment.
+    GSW_PROFILING: bool = False
+
+    # Largest circuit accepted by /evaluate
+    GSW_MAX_CIRCUIT_GATES: int = 1024
     
     class Config:
         case_sensitive = True
@@ -1,19 +1,16 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.middleware.sessions import SessionMiddleware
 from typing import Dict, Any
 import uvicorn
 import os
 import asyncio
+import time
 
 from app.core.config import settings
 from app.api.endpoints import gsw as gsw_endpoints
-from app.services.gsw_service import GSWService
-
-# Create an instance for session cleanup
-gsw_service_instance = GSWService()
-
+import metrics
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="GSW Encryption Service API",
@@ -28,7 +25,7 @@ app.add_middleware(
     SessionMiddleware,
     secret_key=settings.SECRET_KEY,
     session_cookie="gsw_session",
-    max_age=3600  # 1 hour
+    max_age=settings.GSW_SESSION_TTL
 )
 
 # Set up CORS
@@ -47,12 +44,42 @@ app.include_router(
     tags=["gsw"]
 )
 
-# Session cleanup task
+# Opt-in instrumentation: the middleware is only installed when metrics or profiling are on
+PROFILE_HEADER = "X-GSW-Profile"
+
+async def instrument_requests(request: Request, call_next):
+    profiler = request.headers.get(PROFILE_HEADER) if settings.GSW_PROFILING else None
+    profile = metrics.RequestProfile(profiler.lower()) if profiler and profiler.lower() in metrics.PROFILERS else None
+    token = metrics.active_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.active_profile.reset(token)
+
+    if metrics.ENABLED:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.observe(f"http {request.method} {path}", time.perf_counter() - start)
+        metrics.count(f"http {response.status_code}")
+
+    if profile is None:
+        return response
+    # The profile replaces the response body; the route's own status moves to a header
+    return PlainTextResponse(profile.report(), headers={
+        "X-GSW-Profiler": profile.profiler,
+        "X-GSW-Profiled-Status": str(response.status_code)
+    })
+
+if metrics.ENABLED or settings.GSW_PROFILING:
+    app.middleware("http")(instrument_requests)
+
+# Session cleanup task, sweeping the same session table the router serves from
 async def cleanup_sessions_periodically():
     """Periodically clean up expired sessions."""
     while True:
-        await asyncio.sleep(3600)  # Run every hour
-        gsw_service_instance._cleanup_sessions()
+        await asyncio.sleep(settings.GSW_SESSION_SWEEP_INTERVAL)
+        gsw_endpoints.gsw_service._cleanup_sessions()
 
 @app.on_event("startup")
 async def startup_event():
@@ -60,16 +87,42 @@ async def startup_event():
     # Start the session cleanup task
     asyncio.create_task(cleanup_sessions_periodically())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Shutdown event handler to stop the GSW worker pools and the key and encryption pool refills."""
+    gsw_endpoints.gsw_service.executor.shutdown()
+    gsw_endpoints.gsw_service.enc_pool.shutdown()
+    gsw_endpoints.gsw_service.key_pool.shutdown()
+
 @app.get("/api/health", response_model=Dict[str, str])
 async def health_check() -> Dict[str, str]:
     """Health check endpoint."""
     return {"status": "ok"}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    """Per-phase latency histograms, event counters and session gauges in Prometheus text format."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled; set GSW_METRICS=1")
+
+    service = gsw_endpoints.gsw_service
+    sessions = service.sessions.stats()
+    gauges = {
+        "gsw_sessions": sessions['sessions'],
+        "gsw_session_bytes": sessions['bytes_used'],
+        "gsw_session_max_bytes": sessions['max_bytes'],
+        "gsw_executor_pending": service.executor.pending,
+        "gsw_enc_pool_entries": service.enc_pool.stats()['entries'],
+        "gsw_enc_pool_bytes": service.enc_pool.nbytes
+    }
+    return PlainTextResponse(metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     return JSONResponse(
         status_code=exc.status_code,
         content={"success": False, "message": str(exc.detail)},
+        headers=getattr(exc, "headers", None),
     )
 
 @app.exception_handler(Exception)
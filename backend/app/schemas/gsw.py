@@ -1,29 +1,87 @@
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+def _require_one(matrix: Optional[Any], handle: Optional[str], name: str) -> None:
+    if (matrix is None) == (handle is None):
+        raise ValueError(f"Provide exactly one of {name} or {name}Handle")
+
+# Largest q without and with the RNS representation (at most 9 limbs of 30-bit primes)
+MAX_Q = 2**15
+MAX_RNS_Q = 2**240
 
 class GSWInitRequest(BaseModel):
     n: int = Field(..., gt=1, le=512, description="Dimension of the lattice")
-    q: int = Field(..., gt=1, le=2**15, description="Modulus")
+    q: int = Field(..., gt=1, description="Modulus, at most 2^15 (2^240 with rns)")
+    rns: bool = Field(False, description="Hold q as a product of 30-bit primes; q is then the least modulus wanted")
+
+    @model_validator(mode="after")
+    def check_q(self) -> "GSWInitRequest":
+        limit = MAX_RNS_Q if self.rns else MAX_Q
+        if self.q > limit:
+            raise ValueError(f"q must be at most 2^{limit.bit_length() - 1}" + ("" if self.rns else "; larger moduli need rns"))
+        return self
 
 class GSWEncryptRequest(BaseModel):
     plaintext: int = Field(..., description="Plaintext matrix to encrypt")
     reset: bool = Field(False, description="Reset the GSW instance before operation")
+    returnCiphertext: bool = Field(True, description="Include the ciphertext matrix in the response, not only its handle")
 
 class GSWDecryptRequest(BaseModel):
-    ciphertext: List[List[int]] = Field(..., description="Ciphertext to decrypt")
+    ciphertext: Optional[List[List[int]]] = Field(None, description="Ciphertext to decrypt")
+    ciphertextHandle: Optional[str] = Field(None, description="Handle of a stored ciphertext to decrypt")
     key: List[List[int]] = Field(..., description="Secret key for decryption")
     reset: bool = Field(False, description="Reset the GSW instance before operation")
 
+    @model_validator(mode="after")
+    def check_ciphertext(self) -> "GSWDecryptRequest":
+        _require_one(self.ciphertext, self.ciphertextHandle, "ciphertext")
+        return self
+
 class GSWOperateRequest(BaseModel):
     operation: str = Field(..., description="Operation to perform")
-    ciphertext: List[List[int]] = Field(..., description="Ciphertext to operate on")
-    inputCiphertext: List[List[int]] = Field(..., description="Input ciphertext to operate on")
+    ciphertext: Optional[List[List[int]]] = Field(None, description="Ciphertext to operate on")
+    ciphertextHandle: Optional[str] = Field(None, description="Handle of a stored ciphertext to operate on")
+    inputCiphertext: Optional[List[List[int]]] = Field(None, description="Input ciphertext to operate on")
+    inputCiphertextHandle: Optional[str] = Field(None, description="Handle of a stored input ciphertext")
     reset: bool = Field(False, description="Reset the GSW instance before operation")
+    returnCiphertext: bool = Field(True, description="Include the result matrix in the response, not only its handle")
+
+    @model_validator(mode="after")
+    def check_ciphertexts(self) -> "GSWOperateRequest":
+        _require_one(self.ciphertext, self.ciphertextHandle, "ciphertext")
+        _require_one(self.inputCiphertext, self.inputCiphertextHandle, "inputCiphertext")
+        return self
 
 class GSWCiphertextErrorRequest(BaseModel):
-    ciphertext: List[List[int]] = Field(..., description="Ciphertext to check error for")
+    ciphertext: Optional[List[List[int]]] = Field(None, description="Ciphertext to check error for")
+    ciphertextHandle: Optional[str] = Field(None, description="Handle of a stored ciphertext to check")
     reset: bool = Field(False, description="Reset the GSW instance before operation")
 
+    @model_validator(mode="after")
+    def check_ciphertext(self) -> "GSWCiphertextErrorRequest":
+        _require_one(self.ciphertext, self.ciphertextHandle, "ciphertext")
+        return self
+
+class GSWGate(BaseModel):
+    id: str = Field(..., description="Node id of the gate output")
+    op: str = Field(..., description="Add, Mult or Not")
+    inputs: List[str] = Field(..., description="Input or gate ids this gate reads")
+
+class GSWEvaluateRequest(BaseModel):
+    inputs: Dict[str, List[List[int]]] = Field(default_factory=dict, description="Input ciphertexts by node id")
+    inputHandles: Dict[str, str] = Field(default_factory=dict, description="Stored input ciphertexts by node id")
+    gates: List[GSWGate] = Field(..., description="Gates in topological order")
+    outputs: Optional[List[str]] = Field(None, description="Gate ids to return; defaults to every gate")
+    reset: bool = Field(False, description="Reset the GSW instance before operation")
+    returnCiphertext: bool = Field(True, description="Include output matrices in the response, not only their handles")
+    strict: bool = Field(False, description="Refuse the circuit if an output's noise bound is unknown or exceeds the decryption threshold")
+
+    @model_validator(mode="after")
+    def check_inputs(self) -> "GSWEvaluateRequest":
+        if set(self.inputs) & set(self.inputHandles):
+            raise ValueError("An input id appears in both inputs and inputHandles")
+        return self
+
 class GSWResponse(BaseModel):
     success: bool
     message: str
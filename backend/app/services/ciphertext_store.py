@@ -0,0 +1,93 @@
+import copy
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from gsw import GSW_Ciphertext
+
+
+class CiphertextStore:
+    """
+    Per-session store of ciphertexts addressed by short opaque handles.
+
+    Holds at most `max_bytes` of ciphertext matrices and evicts the least
+    recently used entries first, so chained operations can reference earlier
+    results without re-uploading them. `on_resize` is called (outside the lock)
+    whenever `bytes_used` changes. Fresh ciphertexts are kept seed-compressed:
+    `get` hands out a shallow copy, so expanding it for an operation does not
+    grow the stored entry.
+    """
+
+    def __init__(self, max_bytes: int, on_resize: Optional[Callable[[], None]] = None):
+        self.max_bytes = max_bytes
+        self.on_resize = on_resize
+        self.bytes_used = 0
+        self.evictions = 0
+        self._items: "OrderedDict[str, GSW_Ciphertext]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @staticmethod
+    def _size(ciphertext: GSW_Ciphertext) -> int:
+        return ciphertext.nbytes
+
+    def put(self, ciphertext: GSW_Ciphertext, handle: Optional[str] = None) -> str:
+        """Store a ciphertext and return its handle; `handle` re-caches one stored elsewhere."""
+        size = self._size(ciphertext)
+        if size > self.max_bytes:
+            raise ValueError(f"Ciphertext of {size} bytes exceeds the store budget of {self.max_bytes} bytes")
+
+        handle = handle or secrets.token_urlsafe(9)
+        with self._lock:
+            previous = self._items.pop(handle, None)
+            if previous is not None:
+                self.bytes_used -= self._size(previous)
+            while self.bytes_used + size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes_used -= self._size(evicted)
+                self.evictions += 1
+            self._items[handle] = ciphertext
+            self.bytes_used += size
+        self._resized()
+        return handle
+
+    def __contains__(self, handle: str) -> bool:
+        return handle in self._items
+
+    def get(self, handle: str) -> GSW_Ciphertext:
+        """Look up a ciphertext by handle, marking it as recently used."""
+        with self._lock:
+            if handle not in self._items:
+                raise ValueError(f"Unknown or evicted ciphertext handle: {handle}")
+            self._items.move_to_end(handle)
+            return copy.copy(self._items[handle])
+
+    def drop(self, handle: str) -> bool:
+        with self._lock:
+            ciphertext = self._items.pop(handle, None)
+            if ciphertext is None:
+                return False
+            self.bytes_used -= self._size(ciphertext)
+        self._resized()
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.bytes_used = 0
+        self._resized()
+
+    def _resized(self) -> None:
+        if self.on_resize is not None:
+            self.on_resize()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'count': len(self._items),
+            'bytes_used': self.bytes_used,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions
+        }
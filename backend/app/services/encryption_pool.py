@@ -0,0 +1,120 @@
+import threading
+import weakref
+from collections import deque
+from typing import Any, Dict
+
+import numpy as np
+
+import metrics
+from gsw import GSW, GSW_Ciphertext
+
+
+class EncryptionPool:
+    """
+    Per-key pools of precomputed encryptions of zero (see `GSW.Enc_offline`).
+
+    `encrypt` pops one and only adds the message's gadget term (`GSW.Enc_online`),
+    falling back to a full encryption when the key's pool is empty. A background
+    thread tops pools back up to `size` entries once they drop below `low_water`.
+    Pools are keyed by the GSW instance itself and held weakly, so they vanish
+    with the key they were made for: a reset or evicted key never serves stale
+    material. The worker draws its randomness from its own generator, never from
+    the instance's.
+    """
+
+    def __init__(self, size: int, low_water: int):
+        self.size = size
+        self.low_water = low_water
+        self._pools: "weakref.WeakKeyDictionary[GSW, deque]" = weakref.WeakKeyDictionary()
+        self._queued: "weakref.WeakSet[GSW]" = weakref.WeakSet()
+        self._refill = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = None
+        self.counters = {'hits': 0, 'misses': 0, 'refilled': 0}
+
+    def _count(self, counter: str) -> None:
+        self.counters[counter] += 1
+        metrics.count(f"enc_pool.{counter}")
+
+    def _schedule(self, gsw: GSW) -> None:
+        # Called with the condition held
+        if gsw in self._queued or self._closed:
+            return
+        self._queued.add(gsw)
+        self._refill.append(weakref.ref(gsw))
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="gsw-enc-pool", daemon=True)
+            self._worker.start()
+        self._cond.notify()
+
+    def prime(self, gsw: GSW) -> None:
+        """Start filling the pool of a newly installed key."""
+        if self.size <= 0:
+            return
+        with self._cond:
+            self._pools.setdefault(gsw, deque())
+            self._schedule(gsw)
+
+    def encrypt(self, gsw: GSW, msg: int) -> GSW_Ciphertext:
+        """Encrypt with precomputed material when available, scheduling a refill when running low."""
+        material = None
+        if self.size > 0:
+            with self._cond:
+                pool = self._pools.setdefault(gsw, deque())
+                if pool:
+                    material = pool.popleft()
+                    self._count('hits')
+                else:
+                    self._count('misses')
+                if len(pool) < self.low_water:
+                    self._schedule(gsw)
+
+        if material is None:
+            return gsw.Enc(msg)
+        return gsw.Enc_online(msg, material)
+
+    def _run(self) -> None:
+        rng = np.random.default_rng()
+        while True:
+            with self._cond:
+                while not self._refill and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                gsw = self._refill.popleft()()
+
+            # One entry per lock round trip, so encrypt never waits on a whole refill
+            while gsw is not None:
+                with self._cond:
+                    pool = self._pools.get(gsw)
+                    if pool is None or len(pool) >= self.size or self._closed:
+                        self._queued.discard(gsw)
+                        break
+                try:
+                    material = gsw.Enc_offline(rng)
+                except Exception:
+                    # Leave this key to the full Enc fallback; the next low pool reschedules it
+                    with self._cond:
+                        self._queued.discard(gsw)
+                    break
+                with self._cond:
+                    pool.append(material)
+                    self._count('refilled')
+            # Do not keep the key alive while idle
+            gsw = pool = None
+
+    @property
+    def nbytes(self) -> int:
+        with self._cond:
+            return sum(b.nbytes for pool in self._pools.values() for b, _ in pool)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            entries = sum(len(pool) for pool in self._pools.values())
+            return {'keys': len(self._pools), 'entries': entries, 'size': self.size, **self.counters}
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
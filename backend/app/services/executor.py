@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+class ServiceOverloaded(Exception):
+    """Raised when the worker pool already holds its maximum number of pending jobs."""
+
+
+class ServiceTimeout(Exception):
+    """Raised when a job does not finish within the per-request timeout."""
+
+
+class GSWExecutor:
+    """
+    Runs CPU-bound GSW work off the asyncio event loop.
+
+    Service calls go to a bounded thread pool (NumPy releases the GIL in matmul).
+    In "process" mode, picklable kernels passed to `compute` additionally run in a
+    process pool. "inline" runs everything on the caller, as before.
+    """
+
+    def __init__(self, mode: str = "thread", max_workers: int = 1, max_pending: int = 32, timeout: Optional[float] = None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode: {mode}")
+
+        self.mode = mode
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._threads = ThreadPoolExecutor(max_workers, thread_name_prefix="gsw") if mode != "inline" else None
+        self._processes = ProcessPoolExecutor(max_workers) if mode == "process" else None
+        # Counts queued and running jobs; a slot is only freed once the job really finishes
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a service call in the worker pool, failing fast when saturated."""
+        if self._threads is None:
+            return fn(*args, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            raise ServiceOverloaded("GSW service is busy, retry later")
+        with self._lock:
+            self._pending += 1
+
+        future = self._threads.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise ServiceTimeout(f"GSW operation timed out after {self.timeout} seconds")
+
+    def compute(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a picklable kernel in the process pool, or on the calling thread otherwise."""
+        if self._processes is None:
+            return fn(*args)
+        return self._processes.submit(fn, *args).result()
+
+    def shutdown(self) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,10 @@
+import copy
+import math
 import numpy as np
-from typing import Tuple, Optional, List, Dict, Any
+from typing import Tuple, Optional, List, Dict, Any, Union
 import sys
 import os
 import time
-import uuid
 from fastapi import Request
 
 # Add the project root to the Python path
@@ -12,104 +13,288 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 # Import the GSW implementation directly from the gsw.py file
 # This assumes that gsw.py defines GSW and GSW_Ciphertext classes
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
-from gsw import GSW, GSW_Ciphertext
+from gsw import GSW, GSW_Ciphertext, evaluate_circuit, key_from_bytes, key_to_bytes, matrix_from_bytes
+from metrics import profiled, timed
+from rns import RNS_KEY_MAGIC, RNSGSW, RNSGSW_Ciphertext, rns_key_from_bytes, rns_key_to_bytes, rns_primes
+
+from app.core.config import settings
+from app.services.encryption_pool import EncryptionPool
+from app.services.executor import GSWExecutor
+from app.services.key_pool import KeyPool
+from app.services.session_backend import SessionBackend, create_session_backend
+from app.services.session_manager import SessionManager
+
+# A ciphertext arrives either as a JSON matrix or as a binary wire frame (see gsw.matrix_to_bytes)
+CiphertextInput = Union[List[List[int]], bytes, memoryview]
+
+# Sessions hold a GSW key, or an RNSGSW one for moduli past 2^15 (see rns.py)
+Scheme = Union[GSW, RNSGSW]
+
+def _ciphertext_type(gsw: Scheme) -> type:
+    return RNSGSW_Ciphertext if isinstance(gsw, RNSGSW) else GSW_Ciphertext
+
+def _key_to_bytes(gsw: Scheme) -> bytes:
+    return rns_key_to_bytes(gsw) if isinstance(gsw, RNSGSW) else key_to_bytes(gsw)
+
+def _key_from_bytes(data: bytes) -> Scheme:
+    return rns_key_from_bytes(data) if bytes(data[:4]) == RNS_KEY_MAGIC else key_from_bytes(data)
+
+# Stored ciphertexts travel through a shared backend as frames: the v2 wire frame for GSW,
+# which keeps fresh ones seed-compressed, and the limb-stack frame for RNS
+def _ciphertext_from_frame(gsw: Scheme, frame: bytes, noise_bound: Optional[float]) -> GSW_Ciphertext:
+    ciphertext = _ciphertext_type(gsw).from_bytes(gsw, frame)
+    ciphertext.noise_bound = noise_bound
+    return ciphertext
+
+@timed("service.operate_kernel")
+def _operate_kernel(gsw: Scheme, operation: str, C: np.ndarray, input_C: np.ndarray) -> np.ndarray:
+    """Homomorphic Add/Mult on raw matrices; module-level so it can run in a worker process."""
+    ctxt = _ciphertext_type(gsw)(gsw, C)
+    input_ctxt = _ciphertext_type(gsw)(gsw, input_C)
+    if operation == "Add":
+        return ctxt.Add(input_ctxt).C
+    elif operation == "Mult":
+        return ctxt.Mult(input_ctxt).C
+    raise ValueError(f"Unknown operation: {operation}")
+
+def _operate_noise_bound(gsw: GSW, operation: str, bound: Optional[float], input_bound: Optional[float]) -> Optional[float]:
+    if operation == "Add":
+        return gsw.add_noise_bound(bound, input_bound)
+    return gsw.mult_noise_bound(bound, input_bound)
 
 class GSWService:
-    def __init__(self):
-        # Dictionary to store user sessions: {session_id: {'gsw': GSW instance, 'last_activity': timestamp}}
-        self.user_sessions: Dict[str, Dict[str, Any]] = {}
-        self.session_timeout = 3600  # 1 hour timeout for sessions
-    
-    def _get_or_create_session(self, request: Request) -> str:
-        """Get or create a session ID for the user."""
-        session = request.session
-        session_id = session.get('session_id')
-        
-        if not session_id or session_id not in self.user_sessions:
-            session_id = str(uuid.uuid4())
-            session['session_id'] = session_id
-            self.user_sessions[session_id] = {
-                'gsw': None,
-                'last_activity': time.time()
-            }
-        elif session_id in self.user_sessions:
-            # Update last activity for existing session
-            self.user_sessions[session_id]['last_activity'] = time.time()
-            
-        return session_id
+    def __init__(self, executor: Optional[GSWExecutor] = None, sessions: Optional[SessionManager] = None,
+                 backend: Optional[SessionBackend] = None):
+        # Keys live in the backend, shared by every worker; `sessions` caches them in this process
+        self.backend = backend or create_session_backend(
+            settings.GSW_SESSION_BACKEND, settings.GSW_SESSION_TTL, settings.GSW_SESSION_DB_PATH
+        )
+        # Per-browser sessions: {'id', 'gsw', 'ciphertexts', 'last_activity', 'bytes', 'key_version'}
+        self.sessions = sessions or SessionManager(
+            max_bytes=settings.GSW_SESSION_MAX_BYTES,
+            ttl=settings.GSW_SESSION_TTL,
+            shards=settings.GSW_SESSION_SHARDS,
+            store_max_bytes=settings.GSW_STORE_MAX_BYTES
+        )
+        # Worker pool for CPU-bound calls, so they never block the event loop
+        self.executor = executor or GSWExecutor(
+            mode=settings.GSW_EXECUTOR,
+            max_workers=settings.GSW_MAX_WORKERS,
+            max_pending=settings.GSW_MAX_PENDING,
+            timeout=settings.GSW_REQUEST_TIMEOUT
+        )
+        # Offline halves of encryptions, computed ahead of /encrypt for every cached key
+        self.enc_pool = EncryptionPool(settings.GSW_ENC_POOL_SIZE, settings.GSW_ENC_POOL_LOW_WATER)
+        # Keys for /init and resets, generated ahead of demand with their encryption pools primed
+        self.key_pool = KeyPool(settings.GSW_KEY_POOL_DEPTH, settings.GSW_KEY_POOL_WINDOW,
+                                settings.GSW_KEY_POOL_PARAMS, on_generate=self.enc_pool.prime)
 
+    async def run(self, method, *args: Any, **kwargs: Any) -> Any:
+        """Run a service method in the worker pool, under the request's profiler if one is active."""
+        return await self.executor.run(profiled(method), *args, **kwargs)
+
+    @timed("service.session")
     def _get_user_session(self, request: Request) -> Dict[str, Any]:
-        """Get the user's session data."""
-        session_id = self._get_or_create_session(request)
-        return self.user_sessions[session_id]
+        """Get the user's session data, starting a new session if it is unknown, expired or evicted."""
+        session_id = request.session.get('session_id')
+        session = self.sessions.get(session_id)
+
+        # The cached key is only used while the backend still holds the same version;
+        # otherwise another worker replaced or expired it and the key is reloaded
+        if session is not None and session['key_version'] is not None:
+            version = self.backend.version(session_id)
+            if version != session['key_version']:
+                self.sessions.remove(session_id)
+                session = None
+            elif time.time() - session['key_touched'] > settings.GSW_SESSION_TOUCH_INTERVAL:
+                self.backend.touch(session_id)
+                session['key_touched'] = time.time()
+
+        if session is None and session_id:
+            stored = self.backend.load(session_id)
+            if stored is not None:
+                session = self.sessions.create(session_id)
+                self._cache_gsw(session, _key_from_bytes(stored[1]), stored[0])
+
+        if session is None:
+            session = self.sessions.create()
+            request.session['session_id'] = session['id']
+        return session
 
-    def _cleanup_sessions(self):
+    def _cleanup_sessions(self) -> int:
         """Clean up expired sessions."""
-        current_time = time.time()
-        expired = [sid for sid, data in self.user_sessions.items() 
-                  if (current_time - data['last_activity']) > self.session_timeout]
-        for sid in expired:
-            del self.user_sessions[sid]
-    
-    def initialize(self, n: int, q: int, request: Request) -> Dict[str, Any]:
-        """Initialize the GSW cryptosystem with parameters n and q."""
+        self.backend.cleanup()
+        return self.sessions.cleanup()
+
+    def _cache_gsw(self, session: Dict[str, Any], gsw: GSW, version: int) -> None:
+        session['gsw'] = gsw
+        session['key_version'] = version
+        session['key_touched'] = time.time()
+        self.sessions.resize(session['id'])
+        self.enc_pool.prime(gsw)
+
+    def _set_gsw(self, session: Dict[str, Any], gsw: GSW) -> None:
+        """Install and persist a new key; stored ciphertexts belong to the old key and are dropped."""
+        session['ciphertexts'].clear()
+        self._cache_gsw(session, gsw, self.backend.save(session['id'], _key_to_bytes(gsw)))
+
+    def _reset_gsw(self, session: Dict[str, Any]) -> None:
+        """Replace the session's key with a fresh one of the same parameters."""
+        gsw = session['gsw']
+        self._set_gsw(session, self.key_pool.take(gsw.n, gsw.q, rns=isinstance(gsw, RNSGSW)))
+
+    def _resolve_ciphertext(self, session: Dict[str, Any], ciphertext: Optional[CiphertextInput], handle: Optional[str]) -> GSW_Ciphertext:
+        """Fetch a stored ciphertext by handle, or load an uploaded one."""
+        if handle is not None:
+            return self._stored_ciphertext(session, handle)
+        if ciphertext is None:
+            raise ValueError("Either a ciphertext or a ciphertext handle is required")
+        return self._load_ciphertext(session['gsw'], ciphertext)
+
+    def _store_ciphertext(self, session: Dict[str, Any], ciphertext: GSW_Ciphertext) -> str:
+        """Keep a ciphertext under a new handle, in this worker and, if shared, in the backend."""
+        handle = session['ciphertexts'].put(ciphertext)
+        if self.backend.shared:
+            bound = None if ciphertext.noise_bound is None else float(ciphertext.noise_bound)
+            self.backend.put_ciphertext(session['id'], handle, ciphertext.to_bytes(), bound,
+                                        settings.GSW_STORE_MAX_BYTES)
+        return handle
+
+    def _stored_ciphertext(self, session: Dict[str, Any], handle: str) -> GSW_Ciphertext:
+        """Look up a handle in this worker's store, falling back to the backend for other workers' handles."""
+        store = session['ciphertexts']
+        if not self.backend.shared:
+            return store.get(handle)
+
+        # The backend is authoritative: another worker may have deleted or evicted the handle
+        if handle in store and self.backend.has_ciphertext(session['id'], handle):
+            return store.get(handle)
+        store.drop(handle)
+        stored = self.backend.get_ciphertext(session['id'], handle)
+        if stored is None:
+            raise ValueError(f"Unknown or evicted ciphertext handle: {handle}")
+        ciphertext = _ciphertext_from_frame(session['gsw'], *stored)
+        store.put(ciphertext, handle)
+        return copy.copy(ciphertext)
+
+    def _drop_ciphertext(self, session: Dict[str, Any], handle: str) -> bool:
+        dropped = session['ciphertexts'].drop(handle)
+        return self.backend.delete_ciphertext(session['id'], handle) or dropped
+
+    @timed("service.load_ciphertext")
+    def _load_ciphertext(self, gsw: Scheme, ciphertext: CiphertextInput) -> GSW_Ciphertext:
+        """Build a ciphertext from a JSON matrix or a binary frame."""
+        if isinstance(ciphertext, (bytes, bytearray, memoryview)):
+            return _ciphertext_type(gsw).from_bytes(gsw, ciphertext)
+        if isinstance(gsw, RNSGSW):
+            # Entries are integers mod q, past any fixed-width dtype
+            return RNSGSW_Ciphertext.from_matrix(gsw, ciphertext)
+        C = np.array(ciphertext, dtype=np.int32)
+        if C.shape != (gsw.l, gsw.n + 1):
+            raise ValueError(f"Expected a ({gsw.l}, {gsw.n + 1}) ciphertext, got shape {C.shape}")
+        return GSW_Ciphertext(gsw, C)
+
+    def _load_key(self, gsw: Scheme, key: CiphertextInput) -> np.ndarray:
+        """Build a decryption key from a JSON column or a binary frame, as an (n+1, 1) 0/1 vector.
+
+        GSW keys come as an (n+1,) wire frame, RNS keys in their compact format (rns_key_to_bytes).
+        """
+        if isinstance(key, (bytes, bytearray, memoryview)) and isinstance(gsw, RNSGSW):
+            restored = rns_key_from_bytes(key)
+            if (restored.n, restored.primes, restored.log_base) != (gsw.n, gsw.primes, gsw.log_base):
+                raise ValueError("Key parameters do not match the session's")
+            s = restored.s
+        elif isinstance(key, (bytes, bytearray, memoryview)):
+            s, _ = matrix_from_bytes(gsw, key, shape=(gsw.n + 1,))
+        else:
+            s = np.array(key, dtype=np.int64)
+            if s.shape not in ((gsw.n + 1,), (gsw.n + 1, 1)):
+                raise ValueError(f"Expected a key of {gsw.n + 1} entries, got shape {s.shape}")
+        if not np.isin(s, (0, 1)).all():
+            raise ValueError("Keys are 0/1 vectors")
+        return s.astype(np.int32).reshape(gsw.n + 1, 1)
+
+    @timed("service.dump_ciphertext")
+    def _dump_ciphertext(self, ciphertext: GSW_Ciphertext, binary: bool) -> Union[List[List[int]], bytes]:
+        """Serialize a ciphertext for the response, skipping tolist() in binary mode."""
+        if binary:
+            return ciphertext.to_bytes()
+        # head() expands a seed-compressed ciphertext without caching the full matrix on it
+        return ciphertext.head(ciphertext.gsw.l).tolist()
+
+    def _noise_fields(self, ciphertext: GSW_Ciphertext) -> Dict[str, Optional[float]]:
+        """Analytic noise bound and remaining budget; None for ciphertexts uploaded without history."""
+        bound, budget = ciphertext.noise_bound, ciphertext.noise_budget()
+        return {
+            'noise_bound': None if bound is None else float(bound),
+            'noise_budget': None if budget is None else float(budget)
+        }
+
+    @timed("service.initialize")
+    def initialize(self, n: int, q: int, request: Request, rns: bool = False) -> Dict[str, Any]:
+        """Initialize the GSW cryptosystem with parameters n and q; with rns, q is held as a product of primes."""
         try:
+            if rns:
+                if RNSGSW.ciphertext_bytes(n, q) > settings.GSW_RNS_MAX_CIPHERTEXT_BYTES:
+                    raise ValueError(f"Ciphertexts for n={n} would exceed {settings.GSW_RNS_MAX_CIPHERTEXT_BYTES} bytes; "
+                                     "lower n or q")
+                # Keys are pooled under the modulus actually used, the one resets ask for
+                q = math.prod(rns_primes(q))
             session = self._get_user_session(request)
-            session['gsw'] = GSW(n, q)
-            session['last_activity'] = time.time()
+            self._set_gsw(session, self.key_pool.take(n, q, rns=rns))
             return {
                 'n': n,
-                'q': q,
+                # The RNS modulus is the product of its primes, at least the q asked for
+                'q': session['gsw'].q,
                 'logq': session['gsw'].logq,
                 'l': session['gsw'].l,
                 's': session['gsw'].s.tolist(),  # Include the secret key in the response
+                'rns': rns,
                 'message': 'GSW cryptosystem initialized successfully'
             }
         except Exception as e:
             raise ValueError(f"Initialization failed: {str(e)}")
     
-    def encrypt(self, plaintext: int, request: Request, reset: bool = False) -> Dict[str, Any]:
-        """Encrypt a plaintext matrix."""
+    @timed("service.encrypt")
+    def encrypt(self, plaintext: int, request: Request, reset: bool = False, binary: bool = False, return_ciphertext: bool = True) -> Dict[str, Any]:
+        """Encrypt a plaintext matrix and keep the result under a handle."""
         session = self._get_user_session(request)
         if session['gsw'] is None:
             raise ValueError("GSW cryptosystem not initialized. Call /init first.")
         
         if reset:
-            session['gsw'] = GSW(session['gsw'].n, session['gsw'].q)
+            self._reset_gsw(session)
         
         try:
             # Encrypt the plaintext integer
-            ciphertext = session['gsw'].Enc(plaintext)
+            ciphertext = self.enc_pool.encrypt(session['gsw'], plaintext)
             session['last_activity'] = time.time()
         
             return {
-                'ciphertext': ciphertext.C.tolist(),
+                'ciphertext': self._dump_ciphertext(ciphertext, binary) if return_ciphertext else None,
+                'handle': self._store_ciphertext(session, ciphertext),
+                **self._noise_fields(ciphertext),
                 'message': 'Encryption successful'
             }
         except Exception as e:
             raise ValueError(f"Encryption failed: {str(e)}")
     
-    def decrypt(self, ciphertext: List[List[int]], key: List[List[int]], request: Request, reset: bool = False) -> Dict[str, Any]:
+    @timed("service.decrypt")
+    def decrypt(self, ciphertext: Optional[CiphertextInput], key: CiphertextInput, request: Request, reset: bool = False, handle: Optional[str] = None) -> Dict[str, Any]:
         """Decrypt a ciphertext using the provided key."""
         session = self._get_user_session(request)
         if session['gsw'] is None:
             raise ValueError("GSW cryptosystem not initialized. Call /init first.")
         
         if reset:
-            session['gsw'] = GSW(session['gsw'].n, session['gsw'].q)
+            self._reset_gsw(session)
         
         try:
-            # Convert ciphertext to numpy array
-            ctxt = np.array(ciphertext, dtype=np.int32)
-            
             # Create a GSW_Ciphertext object
-            gsw_ctxt = GSW_Ciphertext(session['gsw'], ctxt)
-            
-            # Convert key to numpy array
-            s = np.array(key, dtype=np.int32)
+            gsw_ctxt = self._resolve_ciphertext(session, ciphertext, handle)
             
-            # Decrypt the ciphertext
-            decrypted = gsw_ctxt.Dec_with_key(s)
+            # Decrypt the ciphertext with the checked key
+            decrypted = gsw_ctxt.Dec_with_key(self._load_key(session['gsw'], key))
             
             return {
                 'plaintext': decrypted.tolist(),
@@ -118,71 +303,126 @@ class GSWService:
         except Exception as e:
             raise ValueError(f"Decryption failed: {str(e)}")
     
-    def operate(self, operation: str, ciphertext: List[List[int]], inputCiphertext: List[List[int]], request: Request, reset: bool = False) -> Dict[str, Any]:
-        """Operate on a ciphertext."""
+    @timed("service.operate")
+    def operate(self, operation: str, ciphertext: Optional[CiphertextInput], inputCiphertext: Optional[CiphertextInput], request: Request, reset: bool = False, binary: bool = False,
+                handle: Optional[str] = None, input_handle: Optional[str] = None, return_ciphertext: bool = True) -> Dict[str, Any]:
+        """Operate on a ciphertext and keep the result under a handle."""
         session = self._get_user_session(request)
         if session['gsw'] is None:
             raise ValueError("GSW cryptosystem not initialized. Call /init first.")
         
         if reset:
-            session['gsw'] = GSW(session['gsw'].n, session['gsw'].q)
+            self._reset_gsw(session)
         
         try:
-            # Convert ciphertext to numpy array
-            ctxt = np.array(ciphertext, dtype=np.int32)
-            
-            # Create a GSW_Ciphertext object
-            gsw_ctxt = GSW_Ciphertext(session['gsw'], ctxt)
-            
-            # Convert input ciphertext to numpy array
-            input_ctxt = np.array(inputCiphertext, dtype=np.int32)
-            gsw_input_ctxt = GSW_Ciphertext(session['gsw'], input_ctxt)
-
-            # Operate on the ciphertext
-            if operation == "Add":
-                operated = gsw_ctxt.Add(gsw_input_ctxt)
-            elif operation == "Mult":
-                operated = gsw_ctxt.Mult(gsw_input_ctxt)
+            # Create GSW_Ciphertext objects
+            gsw_ctxt = self._resolve_ciphertext(session, ciphertext, handle)
+            gsw_input_ctxt = self._resolve_ciphertext(session, inputCiphertext, input_handle)
+
+            # Operate on the ciphertext; the noise bound is tracked here, the kernel only sees matrices
+            noise_bound = _operate_noise_bound(session['gsw'], operation, gsw_ctxt.noise_bound, gsw_input_ctxt.noise_bound)
+            operated = _ciphertext_type(session['gsw'])(session['gsw'], self.executor.compute(
+                _operate_kernel, session['gsw'], operation, gsw_ctxt.C, gsw_input_ctxt.C
+            ), noise_bound)
             
             session['last_activity'] = time.time()
             
             return {
-                'ciphertext': operated.C.tolist(),
+                'ciphertext': self._dump_ciphertext(operated, binary) if return_ciphertext else None,
+                'handle': self._store_ciphertext(session, operated),
+                **self._noise_fields(operated),
                 'message': 'Operation successful'
             }
         except Exception as e:
             raise ValueError(f"Operation failed: {str(e)}")
 
-    def get_ciphertext_error(self, ciphertext: List[List[int]], request: Request, reset: bool = False) -> Dict[str, Any]:
+    @timed("service.ciphertext_error")
+    def get_ciphertext_error(self, ciphertext: Optional[CiphertextInput], request: Request, reset: bool = False, handle: Optional[str] = None) -> Dict[str, Any]:
         """Get the error of a ciphertext."""
         session = self._get_user_session(request)
         if session['gsw'] is None:
             raise ValueError("GSW cryptosystem not initialized. Call /init first.")
         
         if reset:
-            session['gsw'] = GSW(session['gsw'].n, session['gsw'].q)
+            self._reset_gsw(session)
         
         try:
-            # Convert ciphertext to numpy array
-            ctxt = np.array(ciphertext, dtype=np.int32)
-            
             # Create a GSW_Ciphertext object
-            gsw_ctxt = GSW_Ciphertext(session['gsw'], ctxt)
+            gsw_ctxt = self._resolve_ciphertext(session, ciphertext, handle)
             
-            # Get the error
-            error = gsw_ctxt.get_error(0)  # Using 0 as a placeholder plaintext
+            # The error is measured against the decrypted plaintext, which is the
+            # encrypted one as long as the error is still small enough to decrypt
+            plaintext = int(session['gsw'].Dec(gsw_ctxt))
+            error = gsw_ctxt.get_error(plaintext)
             max_error = gsw_ctxt.max_valid_error()
-            is_valid = gsw_ctxt.is_error_valid(0)  # Using 0 as a placeholder plaintext
+            is_valid = error < max_error
             
             return {
                 'error': float(error),
                 'max_valid_error': float(max_error),
                 'is_valid': bool(is_valid),
+                'plaintext': plaintext,
+                **self._noise_fields(gsw_ctxt),
                 'message': 'Error calculation successful'
             }
         except Exception as e:
             raise ValueError(f"Error calculation failed: {str(e)}")
     
+    @timed("service.evaluate")
+    def evaluate(self, inputs: Dict[str, CiphertextInput], input_handles: Dict[str, str], gates: List[Tuple[str, str, List[str]]],
+                 request: Request, outputs: Optional[List[str]] = None, reset: bool = False, return_ciphertext: bool = True,
+                 strict: bool = False) -> Dict[str, Any]:
+        """Evaluate a circuit of Add/Mult/Not gates in one request and store its outputs."""
+        session = self._get_user_session(request)
+        if session['gsw'] is None:
+            raise ValueError("GSW cryptosystem not initialized. Call /init first.")
+        if len(gates) > settings.GSW_MAX_CIRCUIT_GATES:
+            raise ValueError(f"Circuit has {len(gates)} gates, the limit is {settings.GSW_MAX_CIRCUIT_GATES}")
+
+        if reset:
+            self._reset_gsw(session)
+
+        try:
+            gsw_inputs = {node: self._load_ciphertext(session['gsw'], ctxt) for node, ctxt in inputs.items()}
+            gsw_inputs.update({node: self._stored_ciphertext(session, handle) for node, handle in input_handles.items()})
+
+            results = evaluate_circuit(session['gsw'], gsw_inputs, gates, outputs, strict=strict)
+            session['last_activity'] = time.time()
+
+            return {
+                'outputs': {
+                    node: {
+                        'ciphertext': self._dump_ciphertext(ctxt, False) if return_ciphertext else None,
+                        'handle': self._store_ciphertext(session, ctxt),
+                        **self._noise_fields(ctxt)
+                    }
+                    for node, ctxt in results.items()
+                },
+                'message': 'Evaluation successful'
+            }
+        except Exception as e:
+            raise ValueError(f"Evaluation failed: {str(e)}")
+
+    def get_ciphertext(self, handle: str, request: Request, binary: bool = False) -> Dict[str, Any]:
+        """Download a stored ciphertext."""
+        session = self._get_user_session(request)
+        if session['gsw'] is None:
+            raise ValueError("GSW cryptosystem not initialized. Call /init first.")
+
+        return {
+            'ciphertext': self._dump_ciphertext(self._stored_ciphertext(session, handle), binary),
+            'handle': handle,
+            'message': 'Ciphertext retrieved successfully'
+        }
+
+    def delete_ciphertext(self, handle: str, request: Request) -> Dict[str, Any]:
+        """Drop a stored ciphertext."""
+        session = self._get_user_session(request)
+        if not self._drop_ciphertext(session, handle):
+            raise ValueError(f"Unknown or evicted ciphertext handle: {handle}")
+
+        return {'handle': handle, 'message': 'Ciphertext deleted successfully'}
+
     def get_model_info(self, request: Request) -> Optional[Dict[str, Any]]:
         """Get information about the current GSW model."""
         session = self._get_user_session(request)
@@ -193,14 +433,20 @@ class GSWService:
             'n': session['gsw'].n,
             'q': session['gsw'].q,
             'logq': session['gsw'].logq,
-            'l': session['gsw'].l
+            'l': session['gsw'].l,
+            'rns': isinstance(session['gsw'], RNSGSW),
+            'ciphertexts': session['ciphertexts'].stats()
         }
+
+    def get_session_stats(self) -> Dict[str, Any]:
+        """Occupancy of the session table, across all users."""
+        return {**self.sessions.stats(), 'encryption_pool': self.enc_pool.stats(), 'key_pool': self.key_pool.stats()}
     
     def reset(self, request: Request) -> None:
         """Reset the GSW instance for a specific user."""
         session = self._get_user_session(request)
         if session['gsw'] is not None:
-            session['gsw'] = GSW(session['gsw'].n, session['gsw'].q)
+            self._reset_gsw(session)
             session['last_activity'] = time.time()
     
     def is_initialized(self, request: Request) -> bool:
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import metrics
+from gsw import GSW
+from rns import RNSGSW
+
+# (n, q, rns)
+Params = Tuple[int, int, bool]
+
+
+class KeyPool:
+    """
+    Pre-generated GSW keys per (n, q, rns), handed out by `/init` and resets.
+
+    Each parameter set's target depth follows demand: the number of keys taken in
+    the last `window` seconds, capped at `max_depth`. Sets that saw no demand for a
+    whole window are dropped, and at most `max_params` sets are tracked (least
+    recently used first out), so only popular parameters stay warm. A background
+    thread refills pools below target; `on_generate` is called on every new key,
+    e.g. to start filling its encryption pool before the key is even handed out.
+    """
+
+    def __init__(self, max_depth: int, window: float, max_params: int = 8,
+                 on_generate: Optional[Callable[[Union[GSW, RNSGSW]], None]] = None):
+        self.max_depth = max_depth
+        self.window = window
+        self.max_params = max_params
+        self.on_generate = on_generate
+        # {(n, q, rns): {'keys': deque of keys, 'takes': deque of timestamps}}, in LRU order
+        self._params: "OrderedDict[Params, Dict[str, deque]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = None
+        self.counters = {'hits': 0, 'misses': 0, 'generated': 0}
+
+    def _count(self, counter: str) -> None:
+        self.counters[counter] += 1
+        metrics.count(f"key_pool.{counter}")
+
+    def _target(self, entry: Dict[str, deque], now: float) -> int:
+        # Called with the condition held
+        takes = entry['takes']
+        while takes and now - takes[0] > self.window:
+            takes.popleft()
+        return min(self.max_depth, len(takes))
+
+    def _generate(self, n: int, q: int, rns: bool) -> Union[GSW, RNSGSW]:
+        gsw = RNSGSW(n, q) if rns else GSW(n, q)
+        if self.on_generate is not None:
+            self.on_generate(gsw)
+        return gsw
+
+    def take(self, n: int, q: int, rns: bool = False) -> Union[GSW, RNSGSW]:
+        """A fresh key for (n, q), an RNSGSW one with rns: pre-generated when one is ready, built on the spot otherwise."""
+        if self.max_depth <= 0:
+            return self._generate(n, q, rns)
+
+        params = (n, q, rns)
+        with self._cond:
+            entry = self._params.get(params)
+            gsw = entry['keys'].popleft() if entry is not None and entry['keys'] else None
+            self._count('hits' if gsw is not None else 'misses')
+
+        # Invalid parameters raise here, on the request path, before they are tracked
+        if gsw is None:
+            gsw = self._generate(n, q, rns)
+
+        with self._cond:
+            entry = self._params.get(params)
+            if entry is None:
+                entry = self._params[params] = {'keys': deque(), 'takes': deque()}
+                while len(self._params) > self.max_params:
+                    self._params.popitem(last=False)
+            self._params.move_to_end(params)
+            entry['takes'].append(time.time())
+            self._wake()
+        return gsw
+
+    def _wake(self) -> None:
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="gsw-key-pool", daemon=True)
+            self._worker.start()
+        self._cond.notify()
+
+    def _next_refill(self) -> Optional[Params]:
+        # Called with the condition held: the most recently used set below its target
+        now = time.time()
+        for params in reversed(self._params):
+            entry = self._params[params]
+            target = self._target(entry, now)
+            if target == 0:
+                del self._params[params]
+                return self._next_refill()
+            if len(entry['keys']) < target:
+                return params
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                params = self._next_refill()
+                while params is None and not self._closed:
+                    # Demand ages out of the window even without new takes
+                    self._cond.wait(self.window)
+                    params = self._next_refill()
+                if self._closed:
+                    return
+
+            gsw = self._generate(*params)
+            with self._cond:
+                entry = self._params.get(params)
+                if entry is not None and len(entry['keys']) < self.max_depth:
+                    entry['keys'].append(gsw)
+                    self._count('generated')
+            # Do not keep the key alive while idle
+            gsw = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            params = {
+                f"{n}:{q}" + (":rns" if rns else ""): {'keys': len(entry['keys']), 'target': self._target(entry, now)}
+                for (n, q, rns), entry in self._params.items()
+            }
+        return {'params': params, 'max_depth': self.max_depth, 'window': self.window, **self.counters}
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._params.clear()
+            self._cond.notify_all()
@@ -0,0 +1,241 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+
+class SessionBackend(ABC):
+    """
+    Durable home of session keys, shared by every worker that serves the API.
+
+    Keys are opaque blobs (see `gsw.key_to_bytes`). Every `save` bumps the
+    session's version, so workers caching a key can cheaply detect that another
+    worker replaced it. Sessions idle for longer than `ttl` seconds are treated
+    as gone.
+
+    A `shared` backend also keeps the sessions' stored ciphertexts, as wire frames
+    under (session_id, handle), so a handle made by one worker resolves on any other.
+    A new key drops the session's ciphertexts, which belong to the old one.
+    Backends private to one process keep none: the worker's `CiphertextStore`
+    already holds everything its handles can reach.
+    """
+
+    shared = False
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        """Return (version, key) for a live session, or None."""
+
+    @abstractmethod
+    def version(self, session_id: str) -> Optional[int]:
+        """Return the current key version of a live session, or None."""
+
+    @abstractmethod
+    def save(self, session_id: str, key: bytes) -> int:
+        """Store a session's key and return its new version."""
+
+    @abstractmethod
+    def touch(self, session_id: str) -> None:
+        """Refresh a session's last activity."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def cleanup(self) -> int:
+        """Drop expired sessions; returns how many were removed."""
+
+    def put_ciphertext(self, session_id: str, handle: str, frame: bytes, noise_bound: Optional[float],
+                       max_bytes: int) -> None:
+        """Store a ciphertext frame, dropping the session's oldest frames past `max_bytes`."""
+
+    def get_ciphertext(self, session_id: str, handle: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        """Return (frame, noise_bound) of a stored ciphertext, or None."""
+        return None
+
+    def has_ciphertext(self, session_id: str, handle: str) -> bool:
+        return False
+
+    def delete_ciphertext(self, session_id: str, handle: str) -> bool:
+        return False
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Keys held in this process only; the single-worker default."""
+
+    def __init__(self, ttl: float):
+        super().__init__(ttl)
+        # {session_id: (version, key, last_activity)}
+        self._items: Dict[str, Tuple[int, bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, session_id: str) -> Optional[Tuple[int, bytes, float]]:
+        item = self._items.get(session_id)
+        if item is None or time.time() - item[2] > self.ttl:
+            return None
+        return item
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        with self._lock:
+            item = self._live(session_id)
+        return item[:2] if item is not None else None
+
+    def version(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            item = self._live(session_id)
+        return item[0] if item is not None else None
+
+    def save(self, session_id: str, key: bytes) -> int:
+        with self._lock:
+            item = self._items.get(session_id)
+            version = item[0] + 1 if item is not None else 1
+            self._items[session_id] = (version, bytes(key), time.time())
+        return version
+
+    def touch(self, session_id: str) -> None:
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is not None:
+                self._items[session_id] = (item[0], item[1], time.time())
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._items.pop(session_id, None)
+
+    def cleanup(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, item in self._items.items() if now - item[2] > self.ttl]
+            for sid in expired:
+                del self._items[sid]
+        return len(expired)
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Keys and stored ciphertexts in a SQLite database file, so several uvicorn
+    workers (or hosts sharing the file) can serve any session without sticky
+    routing. Each thread opens its own connection; WAL mode lets readers proceed
+    while another worker writes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, ttl: float):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS gsw_sessions ("
+                "id TEXT PRIMARY KEY, version INTEGER NOT NULL, key BLOB NOT NULL, last_activity REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS gsw_sessions_last_activity ON gsw_sessions (last_activity)")
+            # Insertion order (rowid) is the eviction order
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS gsw_ciphertexts ("
+                "session_id TEXT NOT NULL, handle TEXT NOT NULL, frame BLOB NOT NULL, noise_bound REAL, "
+                "PRIMARY KEY (session_id, handle))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _deadline(self) -> float:
+        return time.time() - self.ttl
+
+    def load(self, session_id: str) -> Optional[Tuple[int, bytes]]:
+        row = self._connect().execute(
+            "SELECT version, key FROM gsw_sessions WHERE id = ? AND last_activity >= ?",
+            (session_id, self._deadline())
+        ).fetchone()
+        return (row[0], bytes(row[1])) if row is not None else None
+
+    def version(self, session_id: str) -> Optional[int]:
+        row = self._connect().execute(
+            "SELECT version FROM gsw_sessions WHERE id = ? AND last_activity >= ?",
+            (session_id, self._deadline())
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def save(self, session_id: str, key: bytes) -> int:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO gsw_sessions (id, version, key, last_activity) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET version = version + 1, key = excluded.key, "
+                "last_activity = excluded.last_activity",
+                (session_id, bytes(key), time.time())
+            )
+            conn.execute("DELETE FROM gsw_ciphertexts WHERE session_id = ?", (session_id,))
+            return conn.execute("SELECT version FROM gsw_sessions WHERE id = ?", (session_id,)).fetchone()[0]
+
+    def touch(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE gsw_sessions SET last_activity = ? WHERE id = ?", (time.time(), session_id))
+
+    def delete(self, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM gsw_sessions WHERE id = ?", (session_id,))
+            conn.execute("DELETE FROM gsw_ciphertexts WHERE session_id = ?", (session_id,))
+
+    def cleanup(self) -> int:
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM gsw_sessions WHERE last_activity < ?", (self._deadline(),)).rowcount
+            conn.execute("DELETE FROM gsw_ciphertexts WHERE session_id NOT IN (SELECT id FROM gsw_sessions)")
+            return removed
+
+    def put_ciphertext(self, session_id: str, handle: str, frame: bytes, noise_bound: Optional[float],
+                       max_bytes: int) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO gsw_ciphertexts (session_id, handle, frame, noise_bound) VALUES (?, ?, ?, ?)",
+                (session_id, handle, bytes(frame), noise_bound)
+            )
+            rows = conn.execute(
+                "SELECT rowid, length(frame) FROM gsw_ciphertexts WHERE session_id = ? ORDER BY rowid DESC",
+                (session_id,)
+            ).fetchall()
+            # Keep the newest frames that fit the budget
+            total, evicted = 0, []
+            for rowid, size in rows:
+                total += size
+                if total > max_bytes:
+                    evicted.append((rowid,))
+            conn.executemany("DELETE FROM gsw_ciphertexts WHERE rowid = ?", evicted)
+
+    def get_ciphertext(self, session_id: str, handle: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        row = self._connect().execute(
+            "SELECT frame, noise_bound FROM gsw_ciphertexts WHERE session_id = ? AND handle = ?",
+            (session_id, handle)
+        ).fetchone()
+        return (bytes(row[0]), row[1]) if row is not None else None
+
+    def has_ciphertext(self, session_id: str, handle: str) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM gsw_ciphertexts WHERE session_id = ? AND handle = ?", (session_id, handle)
+        ).fetchone() is not None
+
+    def delete_ciphertext(self, session_id: str, handle: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM gsw_ciphertexts WHERE session_id = ? AND handle = ?", (session_id, handle)
+            ).rowcount > 0
+
+
+def create_session_backend(kind: str, ttl: float, path: str = "gsw_sessions.db") -> SessionBackend:
+    if kind == "memory":
+        return InMemorySessionBackend(ttl)
+    if kind == "sqlite":
+        return SQLiteSessionBackend(path, ttl)
+    raise ValueError(f"Unknown session backend: {kind}")
@@ -0,0 +1,169 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.services.ciphertext_store import CiphertextStore
+
+# Rough fixed cost of a session (dicts, locks, GSW attributes) on top of its arrays
+SESSION_OVERHEAD_BYTES = 4096
+
+
+class SessionManager:
+    """
+    Sharded, memory-bounded table of per-browser GSW sessions.
+
+    Each session is charged for its key tables (`GSW.nbytes`) and its stored
+    ciphertexts; when the total exceeds `max_bytes` the least recently used
+    sessions are evicted. Sessions idle for longer than `ttl` seconds expire when
+    next accessed or at the latest on the next `cleanup` sweep. Sessions are
+    spread over `shards` independently locked tables so concurrent requests from
+    different users do not contend on one lock.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, shards: int = 16, store_max_bytes: int = 256 * 2**20):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store_max_bytes = store_max_bytes
+        self._shards: List["OrderedDict[str, Dict[str, Any]]"] = [OrderedDict() for _ in range(shards)]
+        self._shard_locks = [threading.Lock() for _ in range(shards)]
+        # Guards the global byte count and the counters
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.counters = {'created': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard_of(self, session_id: str) -> int:
+        return hash(session_id) % len(self._shards)
+
+    def _count(self, counter: str, delta_bytes: int = 0) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+            self.bytes_used += delta_bytes
+
+    def _is_expired(self, session: Dict[str, Any], now: float) -> bool:
+        return now - session['last_activity'] > self.ttl
+
+    @staticmethod
+    def measure(session: Dict[str, Any]) -> int:
+        """Bytes currently held by a session."""
+        gsw_bytes = session['gsw'].nbytes if session['gsw'] is not None else 0
+        return SESSION_OVERHEAD_BYTES + gsw_bytes + session['ciphertexts'].bytes_used
+
+    def get(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Look up a live session, refreshing its TTL and LRU position."""
+        if not session_id:
+            return None
+
+        i = self._shard_of(session_id)
+        now = time.time()
+        with self._shard_locks[i]:
+            session = self._shards[i].get(session_id)
+            if session is not None and self._is_expired(session, now):
+                del self._shards[i][session_id]
+                self._count('expirations', -session['bytes'])
+                return None
+            if session is None:
+                self._count('misses')
+                return None
+            self._shards[i].move_to_end(session_id)
+            session['last_activity'] = now
+
+        self._count('hits')
+        return session
+
+    def create(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Create an empty session, under a fresh id unless one is given."""
+        session_id = session_id or str(uuid.uuid4())
+        session = {
+            'id': session_id,
+            'gsw': None,
+            'ciphertexts': CiphertextStore(self.store_max_bytes, on_resize=lambda: self.resize(session_id)),
+            'last_activity': time.time(),
+            'bytes': 0,
+            'key_version': None
+        }
+        i = self._shard_of(session_id)
+        with self._shard_locks[i]:
+            self._shards[i][session_id] = session
+        self._count('created')
+        self.resize(session_id)
+        return session
+
+    def resize(self, session_id: str) -> None:
+        """Re-measure a session after its key or stored ciphertexts changed, evicting others if over budget."""
+        i = self._shard_of(session_id)
+        with self._shard_locks[i]:
+            session = self._shards[i].get(session_id)
+            if session is None:
+                return
+            size = self.measure(session)
+            delta = size - session['bytes']
+            session['bytes'] = size
+
+        with self._lock:
+            self.bytes_used += delta
+        self._enforce_budget(keep=session_id)
+
+    def remove(self, session_id: str, counter: Optional[str] = None) -> bool:
+        i = self._shard_of(session_id)
+        with self._shard_locks[i]:
+            session = self._shards[i].pop(session_id, None)
+        if session is None:
+            return False
+
+        with self._lock:
+            self.bytes_used -= session['bytes']
+            if counter is not None:
+                self.counters[counter] += 1
+        return True
+
+    def _least_recently_used(self, keep: str) -> Optional[str]:
+        # Each shard is ordered by access, so the global LRU session is the oldest shard head
+        oldest, oldest_id = None, None
+        for i, shard in enumerate(self._shards):
+            with self._shard_locks[i]:
+                for session_id, session in shard.items():
+                    if session_id == keep:
+                        continue
+                    if oldest is None or session['last_activity'] < oldest:
+                        oldest, oldest_id = session['last_activity'], session_id
+                    break
+        return oldest_id
+
+    def _enforce_budget(self, keep: str) -> None:
+        # The session being resized is never evicted by its own request
+        while self.bytes_used > self.max_bytes:
+            victim = self._least_recently_used(keep)
+            if victim is None:
+                break
+            self.remove(victim, 'evictions')
+
+    def cleanup(self) -> int:
+        """Drop every expired session; returns how many were removed."""
+        now = time.time()
+        removed = 0
+        for i, shard in enumerate(self._shards):
+            with self._shard_locks[i]:
+                expired = [sid for sid, session in shard.items() if self._is_expired(session, now)]
+                sessions = [shard.pop(sid) for sid in expired]
+            for session in sessions:
+                self._count('expirations', -session['bytes'])
+            removed += len(sessions)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        shard_sizes = [len(shard) for shard in self._shards]
+        with self._lock:
+            return {
+                'sessions': sum(shard_sizes),
+                'bytes_used': self.bytes_used,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'shards': len(shard_sizes),
+                'largest_shard': max(shard_sizes),
+                **self.counters
+            }
@@ -0,0 +1,406 @@
+from utils import uniform_sample, decompose
+from gsw import GSW, GSW_Ciphertext, GSW_Ciphertext_Batch, BlasMatmul, Workspace
+from rgsw import RGSW, ntt_prime
+from rns import RNSGSW
+
+import numpy as np
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+logq = 15
+q = 2**logq
+
+bench_ns = [32, 128, 512]
+legacy_rows = 4  # the per-element C_ loop is timed on a few rows and extrapolated to l
+
+
+def best_of(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+# Per-element sampling as done by GSW before the vectorized Generator path
+def legacy_sample_error(gsw):
+    e = np.ones((gsw.l, 1), dtype=np.int32)
+    for i in range(gsw.l):
+        e[i] = uniform_sample([0, 1])[0]
+
+    return e
+
+def legacy_sample_s(gsw):
+    s = np.ones((gsw.n+1, 1), dtype=np.int32)
+    for i in range(1, gsw.n+1):
+        s[i] = uniform_sample([0, 1])[0]
+
+    return s
+
+def legacy_sample_C_(gsw, rows):
+    C_ = np.ones((rows, gsw.n), dtype=np.int32)
+    for i in range(rows):
+        for j in range(gsw.n):
+            C_[i][j] = uniform_sample(range(gsw.q))[0]
+
+    return C_
+
+def legacy_G_inverse(gsw, M):
+    G_inv_M = np.zeros((M.shape[0], gsw.l), dtype=np.int32)
+    for i in range(M.shape[0]):
+        for j in range(gsw.l):
+            G_inv_M[i][j] = decompose(M[i][j // gsw.logq], gsw.logq)[j % gsw.logq]
+
+    return G_inv_M % gsw.q
+
+
+def sampling_bench():
+    print(f"=== sampling_bench (logq={logq}) ===")
+    for n in bench_ns:
+        gsw = GSW(n, q, seed=0)
+        cases = [
+            ("get_error", lambda: legacy_sample_error(gsw), 1, gsw.get_error),
+            ("generate_s", lambda: legacy_sample_s(gsw), 1, gsw.generate_s),
+            ("Enc C_", lambda: legacy_sample_C_(gsw, legacy_rows), gsw.l / legacy_rows,
+             lambda: gsw.rng.integers(0, gsw.q, (gsw.l, gsw.n), dtype=np.int32)),
+        ]
+        for name, legacy, legacy_scale, vectorized in cases:
+            new = best_of(vectorized)
+            old = best_of(legacy, repeat=1) * legacy_scale
+            print(f"n={n:4d} {name:10s} vectorized {new*1e3:10.3f} ms  loop {old*1e3:12.3f} ms  speedup {old/new:10.1f}x")
+
+        print(f"n={n:4d} {'Enc':10s} vectorized {best_of(lambda: gsw.Enc(1))*1e3:10.3f} ms")
+
+
+def G_inverse_bench():
+    print(f"=== G_inverse_bench (logq={logq}) ===")
+    for n in bench_ns:
+        gsw = GSW(n, q, seed=0)
+        C = gsw.Enc(1).C
+        new = best_of(lambda: gsw.generate_G_inverse(C))
+        old = best_of(lambda: legacy_G_inverse(gsw, C[:legacy_rows]), repeat=1) * gsw.l / legacy_rows
+        print(f"n={n:4d} vectorized {new*1e3:10.3f} ms  loop {old*1e3:12.3f} ms  speedup {old/new:10.1f}x")
+
+        for log_base in [2, 4]:
+            gsw_B = GSW(n, q, seed=0, log_base=log_base)
+            C_B = gsw_B.Enc(1).C
+            t = best_of(lambda: gsw_B.generate_G_inverse(C_B))
+            print(f"n={n:4d} base 2^{log_base} l={gsw_B.l:5d} vectorized {t*1e3:10.3f} ms")
+
+
+def batch_bench(k=256, n=32):
+    print(f"=== batch_bench (k={k}, n={n}, logq={logq}) ===")
+    gsw = GSW(n, q, seed=0)
+    msgs = [int(m) for m in gsw.rng.integers(0, 2, k)]
+    ctxts = [gsw.Enc(m) for m in msgs]
+    batch = GSW_Ciphertext_Batch.from_ciphertexts(ctxts)
+    cases = [
+        ("Enc", lambda: [gsw.Enc(m) for m in msgs], lambda: gsw.Enc_batch(msgs)),
+        ("Dec", lambda: [gsw.Dec(c) for c in ctxts], lambda: gsw.Dec_batch(batch)),
+        ("get_error", lambda: [c.get_error(m) for c, m in zip(ctxts, msgs)], lambda: batch.get_error(msgs)),
+    ]
+    for name, loop, batched in cases:
+        old = best_of(loop)
+        new = best_of(batched)
+        print(f"{name:10s} batched {new*1e3:10.3f} ms  loop {old*1e3:10.3f} ms  speedup {old/new:6.1f}x")
+
+
+def serialization_bench():
+    print(f"=== serialization_bench (logq={logq}) ===")
+    for n in bench_ns:
+        gsw = GSW(n, q, seed=0)
+        ctxt = gsw.Enc(1)
+        text = json.dumps(ctxt.C.tolist())
+        json_time = best_of(lambda: json.dumps(ctxt.C.tolist())) + best_of(lambda: np.array(json.loads(text), dtype=np.int32))
+        print(f"n={n:4d} {'json':15s} {len(text)/1e6:10.3f} MB  round trip {json_time*1e3:10.3f} ms")
+
+        # Fresh ciphertexts ship seed-compressed; "full" is the same matrix once operated on
+        for form, c in [("seeded", ctxt), ("full", GSW_Ciphertext(gsw, ctxt.C))]:
+            for compression in [None, "zlib"]:
+                data = c.to_bytes(compression)
+                bin_time = best_of(lambda: c.to_bytes(compression)) + best_of(lambda: GSW_Ciphertext.from_bytes(gsw, data))
+                print(f"n={n:4d} {form:6s} {str(compression):8s} {len(data)/1e6:10.3f} MB  round trip {bin_time*1e3:10.3f} ms"
+                      f"  {len(text)/len(data):7.1f}x smaller  {json_time/bin_time:7.1f}x faster")
+
+
+# A chain of Mults through the mutating API, which allocates every temporary afresh,
+# against mult(out=..., workspace=...) reusing one output matrix and one set of scratch buffers
+def chain_bench(steps=8):
+    print(f"=== chain_bench ({steps} Mults, logq={logq}) ===")
+    for n in bench_ns[:2]:
+        gsw = GSW(n, q, seed=0)
+        a, b = gsw.Enc(1), gsw.Enc(1)
+
+        def mutating():
+            c = GSW_Ciphertext(gsw, a.C)
+            for _ in range(steps):
+                c.Mult(b)
+
+        workspace = Workspace()
+        out = GSW_Ciphertext(gsw, a.C.copy())
+        def reusing():
+            for _ in range(steps):
+                out.mult(b, out=out, workspace=workspace)
+
+        for name, fn in [("Mult", mutating), ("mult(out=)", reusing)]:
+            t = best_of(fn)
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"n={n:4d} {name:11s} {t*1e3:10.3f} ms  peak allocations {peak/2**20:8.2f} MiB")
+
+
+# Mult without an engine (the packed kernel) against the exact float64 BLAS engine at several
+# worker counts. The engine-less path is only timed up to int_max_n.
+def mult_engine_bench(ns=(32, 128, 256, 512), int_max_n=128):
+    print(f"=== mult_engine_bench (logq={logq}, {os.cpu_count()} cores) ===")
+    workers = sorted({1, 2, os.cpu_count() or 1})
+    for n in ns:
+        gsw = GSW(n, q, seed=0)
+        a, b = gsw.Enc(1), gsw.Enc(1)
+        engines = [("packed", None)] if n <= int_max_n else []
+        engines += [(f"blas x{w}", BlasMatmul(workers=w)) for w in workers]
+
+        baseline = None
+        for name, engine in engines:
+            gsw.arith.engine = engine
+            t = best_of(lambda: a.mult(b), repeat=1 if engine is None else 3)
+            baseline = baseline or t
+            print(f"n={n:4d} l={gsw.l:5d} {name:8s} {t*1e3:10.1f} ms  speedup {baseline/t:6.1f}x")
+
+
+# The G^-1(C1) @ C2 product of Mult as a dense integer matmul against the packed kernel, at
+# moduli too large for the exact float64 engine (l * q >= 2^53), with the size of G^-1(C1)
+def packed_matmul_bench(params=((32, 45), (64, 45), (64, 50))):
+    print("=== packed_matmul_bench ===")
+    for n, logq_ in params:
+        gsw = GSW(n, 2**logq_, seed=0)
+        a, b = gsw.Enc(1), gsw.Enc(1)
+        modulus = gsw.half_q * gsw.q
+        dense, packed = gsw.generate_G_inverse(a.C), gsw.generate_G_inverse_packed(a.C)
+
+        t_dense = best_of(lambda: gsw.arith.matmul(dense, b.C, 1, gsw.q - 1, modulus=modulus), repeat=1)
+        t_packed = best_of(lambda: gsw.arith.packed_matmul(packed, b.C, gsw.q - 1, modulus=modulus))
+        print(f"n={n:4d} logq={logq_:2d} dense {t_dense*1e3:10.1f} ms  packed {t_packed*1e3:10.1f} ms"
+              f"  speedup {t_dense/t_packed:6.1f}x  G^-1 {dense.nbytes/1e6:8.2f} -> {packed.nbytes/1e6:8.2f} MB")
+
+
+# GSW against ring GSW at matched parameters: LWE dimension n vs ring degree n, and a
+# power-of-two q vs the NTT-friendly prime just below it. Reports ciphertext size, Enc and Mult.
+def rgsw_bench(params=((64, 15), (128, 15), (256, 20), (512, 20))):
+    print("=== rgsw_bench ===")
+    for n, logq_ in params:
+        gsw, rgsw = GSW(n, 2**logq_, seed=0), RGSW(n, ntt_prime(n, logq_), seed=0)
+        for name, scheme in [("gsw", gsw), ("rgsw", rgsw)]:
+            a, b = scheme.Enc(1), scheme.Enc(1)
+            t_enc = best_of(lambda: scheme.Enc(1))
+            t_mult = best_of(lambda: a.mult(b), repeat=1 if scheme is gsw else 3)
+            print(f"n={n:4d} logq={logq_:2d} {name:5s} ctxt {a.C.nbytes/1e3:10.1f} KB"
+                  f"  Enc {t_enc*1e3:9.2f} ms  Mult {t_mult*1e3:10.2f} ms")
+
+
+# GSW at moduli near int64, where its Mult falls back to Python integers, against the RNS
+# representation of a modulus at least as large (30-bit limbs, limb-wise Mult). GSW itself
+# only goes up to 2^63; past that only the RNS rows are timed.
+def rns_bench(params=((8, 60), (16, 60), (16, 120), (32, 120))):
+    print("=== rns_bench ===")
+    for n, logq_ in params:
+        rns = RNSGSW(n, 2**logq_, seed=0)
+        schemes = [("gsw", GSW(n, 2**logq_, seed=0))] if logq_ < 64 else []
+        for name, scheme in schemes + [(f"rns x{rns.L}", rns)]:
+            a, b = scheme.Enc(1), scheme.Enc(1)
+            t_enc = best_of(lambda: scheme.Enc(1))
+            t_mult = best_of(lambda: a.mult(b), repeat=3 if scheme is rns else 1)
+            print(f"n={n:4d} logq={logq_:3d} {name:7s} l={scheme.l:5d} ctxt {a.C.nbytes/1e3:9.1f} KB"
+                  f"  Enc {t_enc*1e3:9.2f} ms  Mult {t_mult*1e3:10.2f} ms")
+
+
+def run_benchmarks():
+    sampling_bench()
+    G_inverse_bench()
+    batch_bench()
+    serialization_bench()
+    chain_bench()
+    mult_engine_bench()
+    packed_matmul_bench()
+    rgsw_bench()
+    rns_bench()
+
+
+# ---- Benchmark suite: latency percentiles, peak memory and regression checks ----
+
+suite_ns = [16, 32, 64]
+suite_logqs = [8, 15]
+api_n, api_logq = 16, 8
+regression_threshold = 0.2  # flag cases whose p50 grew by more than 20%
+
+# Times `repeat` calls after a warm-up, then one extra call under tracemalloc
+# (kept out of the timings, since tracing slows allocation-heavy code down)
+def measure(fn, repeat):
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times)
+    return {
+        "p50_ms": float(np.percentile(times, 50)) * 1e3,
+        "p95_ms": float(np.percentile(times, 95)) * 1e3,
+        "mean_ms": float(times.mean()) * 1e3,
+        "ops_per_sec": float(1 / times.mean()),
+        "peak_kib": peak / 1024,
+        "repeat": repeat,
+    }
+
+def primitive_cases(n, logq):
+    q = 2**logq
+    gsw = GSW(n, q, seed=0)
+    a, b = gsw.Enc(1), gsw.Enc(0)
+    # Add/Mult work in place, so they run on a scratch copy; timings do not depend on its noise
+    scratch = GSW_Ciphertext(gsw, a.C.copy())
+    material = gsw.Enc_offline()
+
+    return [
+        ("keygen", lambda: GSW(n, q)),
+        ("Enc", lambda: gsw.Enc(1)),
+        # The online half of Enc, on one precomputed material (reusing it is fine for timing only)
+        ("Enc_online", lambda: gsw.Enc_online(1, material)),
+        ("Dec", lambda: gsw.Dec(a)),
+        ("Add", lambda: scratch.Add(b)),
+        ("Mult", lambda: scratch.Mult(b)),
+        ("G_inverse", lambda: gsw.generate_G_inverse(a.C)),
+        ("get_error", lambda: a.get_error(1)),
+    ]
+
+# End-to-end latency of each route through the in-process ASGI client, JSON bodies as the frontend sends them
+def api_cases(n, logq):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    prefix = "/api/v1/gsw"
+
+    def post(route, body):
+        response = client.post(prefix + route, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{route} answered {response.status_code}: {response.text}")
+        return response.json()["data"]
+
+    s = post("/init", {"n": n, "q": 2**logq})["s"]
+    encrypted = post("/encrypt", {"plaintext": 1})
+    C, handle = encrypted["ciphertext"], encrypted["handle"]
+    gates = [{"id": "x", "op": "Add", "inputs": ["a", "b"]}, {"id": "y", "op": "Mult", "inputs": ["x", "a"]}]
+
+    return [
+        ("POST /init", lambda: post("/init", {"n": n, "q": 2**logq})),
+        ("POST /encrypt", lambda: post("/encrypt", {"plaintext": 1})),
+        ("POST /decrypt", lambda: post("/decrypt", {"ciphertext": C, "key": s})),
+        ("POST /operate Add", lambda: post("/operate", {"operation": "Add", "ciphertext": C, "inputCiphertext": C})),
+        ("POST /operate Mult", lambda: post("/operate", {"operation": "Mult", "ciphertext": C, "inputCiphertext": C})),
+        ("POST /operate Mult handles", lambda: post("/operate", {"operation": "Mult", "ciphertextHandle": handle,
+                                                                  "inputCiphertextHandle": handle, "returnCiphertext": False})),
+        ("POST /ciphertext_error", lambda: post("/ciphertext_error", {"ciphertext": C})),
+        ("POST /evaluate", lambda: post("/evaluate", {"inputHandles": {"a": handle, "b": handle}, "gates": gates,
+                                                      "returnCiphertext": False})),
+        ("GET /model_info", lambda: client.get(prefix + "/model_info").json()),
+    ], s
+
+def run_suite(ns, logqs, repeat, api=True):
+    results = []
+    for n in ns:
+        for logq in logqs:
+            for name, fn in primitive_cases(n, logq):
+                results.append({"group": "primitive", "name": name, "n": n, "logq": logq, **measure(fn, repeat)})
+                print_result(results[-1])
+
+    if api:
+        try:
+            cases, _ = api_cases(api_n, api_logq)
+        except ImportError as e:
+            print(f"Skipping API benchmarks: {e}")
+            cases = []
+        # Re-initializing replaces the key behind the other routes, so /init runs last
+        cases.sort(key=lambda case: case[0] == "POST /init")
+        for name, fn in cases:
+            results.append({"group": "api", "name": name, "n": api_n, "logq": api_logq, **measure(fn, repeat)})
+            print_result(results[-1])
+
+    return results
+
+def print_result(r):
+    print(f"{r['group']:9s} {r['name']:28s} n={r['n']:4d} logq={r['logq']:2d}  p50 {r['p50_ms']:9.3f} ms  "
+          f"p95 {r['p95_ms']:9.3f} ms  {r['ops_per_sec']:10.1f} ops/s  peak {r['peak_kib']:10.1f} KiB")
+
+def write_results(results, json_path=None, csv_path=None):
+    if json_path:
+        meta = {"python": sys.version.split()[0], "numpy": np.__version__, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(json_path, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+# Compares p50 latencies against a JSON file written by an earlier run; returns the regressions
+def compare_results(results, baseline_path, threshold=regression_threshold):
+    with open(baseline_path) as f:
+        baseline = {(r["group"], r["name"], r["n"], r["logq"]): r for r in json.load(f)["results"]}
+
+    print(f"=== comparison against {baseline_path} (threshold {threshold:.0%}) ===")
+    regressions = []
+    for r in results:
+        base = baseline.get((r["group"], r["name"], r["n"], r["logq"]))
+        if base is None:
+            continue
+        ratio = r["p50_ms"] / base["p50_ms"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        if flag:
+            regressions.append(r)
+        print(f"{r['group']:9s} {r['name']:28s} n={r['n']:4d} logq={r['logq']:2d}  "
+              f"{base['p50_ms']:9.3f} -> {r['p50_ms']:9.3f} ms  {ratio:6.2f}x  {flag}")
+
+    print(f"{len(regressions)} regression(s)")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="GSW benchmarks")
+    parser.add_argument("--suite", action="store_true", help="run the percentile suite instead of the legacy comparisons")
+    parser.add_argument("--ns", type=int, nargs="+", default=suite_ns)
+    parser.add_argument("--logqs", type=int, nargs="+", default=suite_logqs)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-api", action="store_true", help="skip the FastAPI route latencies")
+    parser.add_argument("--json", help="write results to this JSON file (usable as a baseline)")
+    parser.add_argument("--csv", help="write results to this CSV file")
+    parser.add_argument("--baseline", help="compare p50 latencies against this JSON file")
+    parser.add_argument("--threshold", type=float, default=regression_threshold)
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.suite:
+        run_benchmarks()
+        sys.exit(0)
+
+    results = run_suite(args.ns, args.logqs, args.repeat, api=not args.no_api)
+    write_results(results, args.json, args.csv)
+    if args.baseline and compare_results(results, args.baseline, args.threshold):
+        sys.exit(1)
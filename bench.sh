@@ -0,0 +1 @@
+conda run -n gsw python bench.py
\ No newline at end of file
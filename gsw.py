@@ -1,109 +1,1145 @@
-from utils import decompose, uniform_sample
+from utils import gadget_decompose, pack_bits, pack_uints, unpack_bits, unpack_uints, uniform_sample_matrix
+import metrics
+from metrics import timed
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
 import numpy as np
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INT64_MAX = np.iinfo(np.int64).max
+# Integers up to 2^53 are exact in float64
+FLOAT64_EXACT = 2**53
+G_CACHE_SIZE = 8
+
+# Binary ciphertext wire format, all fields little-endian:
+# magic, version, compression, bits per coefficient, log_base, dtype char, n, q,
+# payload length, ndim, flags, then ndim uint32 dimensions and the payload. Coefficients
+# are packed at ceil(log2 q) bits each, or stored raw when that fills the dtype.
+# With WIRE_SEEDED, the frame is a seed-compressed fresh ciphertext: the dimensions are
+# still those of the full matrix, but the payload holds one SEED_BYTES seed per ciphertext
+# followed by column 0 only. Version 1 frames (no flags byte) are still read.
+WIRE_MAGIC = b"GSWC"
+WIRE_VERSION = 2
+WIRE_HEADER = struct.Struct("<4sBBBBcIQQBB")
+WIRE_HEADER_V1 = struct.Struct("<4sBBBBcIQQB")
+WIRE_COMPRESSION = {None: 0, "zlib": 1, "zstd": 2}
+WIRE_SEEDED = 1
+SEED_BYTES = 16
+
+# Compact secret key format: magic, version, log_base, n, q, then the n binary
+# coefficients s[1:] packed one bit each (s[0] is always 1)
+KEY_MAGIC = b"GSWK"
+KEY_VERSION = 1
+KEY_HEADER = struct.Struct("<4sBBIQ")
+
+# Exact integer arithmetic mod q. Accumulator dtypes are picked from worst-case
+# bounds on the operands, so intermediate sums never wrap; results are stored in
+# the narrowest unsigned dtype that holds [0, modulus).
+class ModularArithmetic:
+    def __init__(self, q, engine=None):
+        self.q = q
+        self.storage_dtype = self.dtype_for(q)
+        # Optional faster kernel for large products (see BlasMatmul); None keeps the integer paths
+        self.engine = engine
+
+    @staticmethod
+    def dtype_for(modulus):
+        return np.min_scalar_type(modulus - 1)
+
+    @staticmethod
+    def accumulator_dtype(bound):
+        for dtype in (np.int32, np.int64):
+            if bound <= np.iinfo(dtype).max:
+                return dtype
+
+        return object
+
+    @staticmethod
+    def bound_of(A):
+        A = np.asarray(A)
+        if A.size == 0:
+            return 0
+
+        return max(abs(int(A.min())), abs(int(A.max())))
+
+    def reduce(self, X, modulus=None):
+        modulus = self.q if modulus is None else modulus
+
+        return (X % modulus).astype(self.dtype_for(modulus))
+
+    # Entries of A and B are assumed to lie in [0, q), so one conditional subtraction
+    # reduces the sum; the result is written into `out` (storage dtype) when given
+    def add(self, A, B, out=None):
+        dtype = self.accumulator_dtype(2 * (self.q - 1))
+        S = np.add(A, B, dtype=dtype)
+        np.subtract(S, self.q, out=S, where=S >= self.q)
+        if out is None:
+            return S.astype(self.storage_dtype)
+
+        np.copyto(out, S, casting="unsafe")
+        return out
+
+    def sub(self, A, B):
+        dtype = self.accumulator_dtype(self.q - 1)
+
+        return self.reduce(np.asarray(A).astype(dtype) - np.asarray(B).astype(dtype))
+
+    # c may be a scalar or an array broadcasting against A
+    def scale(self, A, c):
+        c = np.asarray(c) % self.q
+        dtype = self.accumulator_dtype((self.q - 1) * self.bound_of(c))
+
+        return self.reduce(np.asarray(A).astype(dtype) * c.astype(dtype))
+
+    # Whether matmul hands a product with A.size == size and |dot products| <= dot_bound to the engine
+    def engine_accepts(self, size, dot_bound):
+        return self.engine is not None and self.engine.accepts(size, dot_bound)
+
+    # (A @ B) % modulus for |A| <= a_bound, |B| <= b_bound; bounds default to the operands' extremes.
+    # With a workspace, the widened operands and the product live in its reused buffers and
+    # the result is returned in the accumulator dtype, valid until the workspace's next use.
+    @timed("gsw.matmul")
+    def matmul(self, A, B, a_bound=None, b_bound=None, modulus=None, workspace=None):
+        modulus = self.q if modulus is None else modulus
+        a_bound = self.bound_of(A) if a_bound is None else a_bound
+        b_bound = self.bound_of(B) if b_bound is None else b_bound
+        term = a_bound * b_bound
+        K = A.shape[-1]
+
+        if A.dtype != object and B.dtype != object and self.engine_accepts(A.size, K * term):
+            if metrics.ENABLED:
+                metrics.count("matmul.blas")
+            X = self.engine.matmul(A, B, modulus, workspace)
+            return X if workspace is not None else X.astype(self.dtype_for(modulus))
+
+        dtype = self.accumulator_dtype(K * term)
+        if dtype is not object:
+            if metrics.ENABLED:
+                metrics.count(f"matmul.{np.dtype(dtype).name}")
+            if workspace is None:
+                return self.reduce(A.astype(dtype) @ B.astype(dtype), modulus)
+
+            X = np.matmul(workspace.cast("matmul.A", A, dtype), workspace.cast("matmul.B", B, dtype),
+                          out=workspace.take("matmul.X", A.shape[:-1] + B.shape[-1:], dtype))
+            # A modulus past the accumulator's range already exceeds every entry of X
+            if modulus <= np.iinfo(dtype).max:
+                np.remainder(X, modulus, out=X)
+            return X
+
+        # Too wide for a single int64 pass: reduce after every chunk of terms that fits
+        if term == 0 or term > INT64_MAX or modulus > INT64_MAX // 2:
+            if metrics.ENABLED:
+                metrics.count("matmul.object")
+            return self.reduce(A.astype(object) @ B.astype(object), modulus)
+
+        if metrics.ENABLED:
+            metrics.count("matmul.chunked")
+        chunk = INT64_MAX // term
+        acc = np.zeros(A.shape[:-1] + B.shape[-1:], dtype=np.int64)
+        for k in range(0, K, chunk):
+            partial = A[..., k:k+chunk].astype(np.int64) @ B[..., k:k+chunk, :].astype(np.int64)
+            acc = (acc + partial % modulus) % modulus
+
+        return acc.astype(self.dtype_for(modulus))
+
+    # (P @ B) % modulus for a 0/1 matrix P packed by pack_bits, with B of shape (..., K, m).
+    # Each byte of a packed row selects a subset of 8 rows of B, so the product is a sum of
+    # K / 8 lookups into a table of all 256 subset sums of those rows, rebuilt per group
+    # ("four Russians"): about 8x fewer additions than the dense product, exact in int64,
+    # and P is read at one bit per entry. The workspace contract is the one of matmul.
+    @timed("gsw.packed_matmul")
+    def packed_matmul(self, P, B, b_bound=None, modulus=None, workspace=None):
+        modulus = self.q if modulus is None else modulus
+        b_bound = self.bound_of(B) if b_bound is None else b_bound
+        K, m = B.shape[-2:]
+        groups = P.shape[-1]
+        step = 8 * b_bound
+
+        # Past int64, the running sum cannot be reduced, so the whole sum has to fit
+        if B.dtype == object or step > INT64_MAX // 2 or (modulus > INT64_MAX and groups * step > INT64_MAX):
+            return self.matmul(unpack_bits(P, K), B, 1, b_bound, modulus, workspace)
+
+        if metrics.ENABLED:
+            metrics.count("matmul.packed")
+        scratch = Workspace() if workspace is None else workspace
+        batch = np.broadcast_shapes(P.shape[:-2], B.shape[:-2])
+        rows = P.shape[-2]
+        X = scratch.take("matmul.X", batch + (rows, m), np.int64)
+        X.fill(0)
+        P = np.broadcast_to(P, batch + P.shape[-2:])
+        # uint64 entries would promote the table sums to float64
+        B = np.broadcast_to(B if B.dtype == np.int64 else scratch.cast("packed.B", B, np.int64), batch + B.shape[-2:])
+        table = scratch.take("packed.table", (256, m), np.int64)
+        table[0] = 0
+        lookup = scratch.take("packed.lookup", (rows, m), np.int64)
+
+        for idx in np.ndindex(batch):
+            Bi, Xi = B[idx], X[idx]
+            # One contiguous row of selectors per group
+            selectors = np.ascontiguousarray(P[idx].T)
+            bound = 0
+            for g in range(groups):
+                # Zero padding bits in P never select the table rows of missing B rows
+                for b, row in enumerate(Bi[8*g:8*g + 8]):
+                    np.add(table[:1 << b], row, out=table[1 << b:2 << b])
+                if bound > INT64_MAX - step:
+                    np.remainder(Xi, modulus, out=Xi)
+                    bound = modulus - 1
+                np.add(Xi, np.take(table, selectors[g], axis=0, out=lookup), out=Xi)
+                bound += step
+
+            if modulus <= INT64_MAX:
+                np.remainder(Xi, modulus, out=Xi)
+
+        # Past int64 the exact sum is already below the modulus
+        return X if workspace is not None else X.astype(self.dtype_for(modulus))
+
+    # round(X / d) mod q for non-negative integer X, rounding half to even like np.round,
+    # but without the float64 round trip (exact for any q). Uses the workspace's buffers
+    # for the intermediate quotient and remainder, and writes into `out` when given.
+    def round_div(self, X, d, out=None, workspace=None):
+        if X.dtype == object or d > INT64_MAX // 2:
+            X = X.astype(object)
+            Q, R = X // d, X % d
+            Q = (Q + (2 * R + Q % 2 > d)) % self.q
+            if out is None:
+                return Q.astype(self.storage_dtype)
+            np.copyto(out, Q, casting="unsafe")
+            return out
+
+        workspace = Workspace() if workspace is None else workspace
+        Q = workspace.cast("round.Q", X, np.int64)
+        R = np.remainder(Q, d, out=workspace.take("round.R", Q.shape, np.int64))
+        np.floor_divide(Q, d, out=Q)
+        # Round up when 2R + (Q odd) > d: above half, or exactly half with an odd quotient
+        np.multiply(R, 2, out=R)
+        np.add(R, np.bitwise_and(Q, 1, out=workspace.take("round.parity", Q.shape, np.int64)), out=R)
+        np.add(Q, np.greater(R, d, out=workspace.take("round.up", Q.shape, np.bool_)), out=Q)
+        np.remainder(Q, self.q, out=Q)
+        if out is None:
+            return Q.astype(self.storage_dtype)
+
+        np.copyto(out, Q, casting="unsafe")
+        return out
+
+# Exact float64 BLAS matmul for integer operands: when every |dot product| stays below
+# 2^53 (K * a_bound * b_bound), all partial sums are exactly representable, so the float
+# result is the integer product. This is what makes the 0/1 (or small-digit) G^-1(C1) in
+# Mult cheap: NumPy's integer matmul has no BLAS kernel. Row tiles of A are widened to
+# float64 one at a time, which bounds the extra memory, and are spread over `workers`
+# threads (BLAS releases the GIL). With a multithreaded BLAS, keep workers * BLAS threads
+# at about the core count.
+class BlasMatmul:
+    def __init__(self, workers=1, tile_rows=512, min_size=2**14):
+        self.workers = max(1, workers)
+        self.tile_rows = tile_rows
+        # Smaller products are left to the integer path, where the float round trip does not pay off
+        self.min_size = min_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    # The pool is created lazily and not pickled, so engines travel to worker processes
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key not in ("_pool", "_pool_lock")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _pool=None, _pool_lock=threading.Lock())
+
+    # The engine is shared by every executor thread, so the pool is created under a lock:
+    # concurrent first Mults would otherwise each start (and leak) their own
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="gsw-mult")
+
+        return self._pool
+
+    def accepts(self, size, dot_bound):
+        return dot_bound < FLOAT64_EXACT and size >= self.min_size
+
+    # (A @ B) % modulus as int64, written into the workspace's product buffer when given
+    def matmul(self, A, B, modulus, workspace=None):
+        batch = np.broadcast_shapes(A.shape[:-2], B.shape[:-2])
+        rows, cols = A.shape[-2], B.shape[-1]
+        shape = batch + (rows, cols)
+        X = np.empty(shape, np.int64) if workspace is None else workspace.take("matmul.X", shape, np.int64)
+
+        A = np.broadcast_to(A, batch + A.shape[-2:])
+        B = np.broadcast_to(B.astype(np.float64), batch + B.shape[-2:])
+        tiles = [(idx, r) for idx in np.ndindex(batch) for r in range(0, rows, self.tile_rows)]
+        reduce = modulus <= INT64_MAX
+
+        def run(tile):
+            idx, r = tile
+            out = X[idx][r:r + self.tile_rows]
+            np.copyto(out, A[idx][r:r + self.tile_rows].astype(np.float64) @ B[idx], casting="unsafe")
+            if reduce:
+                np.remainder(out, modulus, out=out)
+
+        if self.workers == 1 or len(tiles) == 1:
+            for tile in tiles:
+                run(tile)
+        else:
+            list(self._get_pool().map(run, tiles))
+
+        return X
+
+# Shared by every GSW instance unless replaced (gsw.arith.engine = BlasMatmul(workers=8)),
+# or disabled with GSW_MULT_ENGINE=int. GSW_MULT_WORKERS sets the default thread count.
+DEFAULT_MATMUL_ENGINE = None if os.environ.get("GSW_MULT_ENGINE", "blas") == "int" else \
+    BlasMatmul(workers=int(os.environ.get("GSW_MULT_WORKERS", "1")))
+
+# Scratch buffers reused across calls, reallocated only when a shape or dtype changes.
+# Arrays handed out stay owned by the workspace and are overwritten by its next use,
+# so one workspace serves one thread and one chain of operations at a time.
+class Workspace:
+    def __init__(self):
+        self.buffers = {}
+
+    def take(self, name, shape, dtype):
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self.buffers[name] = np.empty(shape, dtype)
+
+        return buf
+
+    # Copies A into a reused buffer of the given dtype; A itself is passed through if it already is that buffer
+    def cast(self, name, A, dtype):
+        buf = self.take(name, A.shape, dtype)
+        if buf is not A:
+            np.copyto(buf, A, casting="unsafe")
+
+        return buf
+
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self.buffers.values())
+
+# G depends only on the parameters, so every GSW instance with the same (n, q, log_base)
+# shares one read-only copy
+@lru_cache(maxsize=G_CACHE_SIZE)
+def gadget_matrix(n, q, log_base=1):
+    d = -(-int(np.log2(q)) // log_base)
+    l = (n + 1) * d
+    rows = np.arange(l)
+
+    G = np.zeros((l, n+1), dtype=ModularArithmetic.accumulator_dtype(q - 1))
+    G[rows, rows // d] = 2**(log_base * (rows % d))
+    G.setflags(write=False)
+
+    return G
+
+def _compress(payload, compression):
+    if compression is None:
+        return payload
+    if compression == "zlib":
+        return zlib.compress(payload)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().compress(payload)
+
+    raise ValueError(f"Unknown compression: {compression}")
+
+# Decompresses at most max_len bytes, the payload size the frame's validated shape implies,
+# so a small frame cannot declare its way into a large allocation
+def _decompress(payload, code, max_len):
+    if code == WIRE_COMPRESSION[None]:
+        return payload
+    if code == WIRE_COMPRESSION["zlib"]:
+        decompressor = zlib.decompressobj()
+        try:
+            out = decompressor.decompress(payload, max_len)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt zlib payload: {e}")
+        if decompressor.unconsumed_tail:
+            raise ValueError("Decompressed payload is larger than its shape")
+        return out
+    if code == WIRE_COMPRESSION["zstd"]:
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        try:
+            return zstandard.ZstdDecompressor().decompress(payload, max_output_size=max_len)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Corrupt or oversized zstd payload: {e}")
+
+    raise ValueError(f"Unknown compression code: {code}")
+
+# With `seeds` (an int, or one per ciphertext of a batch), C is column 0 of a
+# seed-compressed fresh ciphertext (see GSW.Enc)
+@timed("gsw.matrix_to_bytes")
+def matrix_to_bytes(gsw, C, compression=None, seeds=None):
+    dtype = gsw.arith.storage_dtype
+    bits = (gsw.q - 1).bit_length()
+    C = np.asarray(C, dtype=dtype)
+
+    if bits == dtype.itemsize * 8:
+        payload = C.astype(dtype.newbyteorder("<")).tobytes()
+    else:
+        payload = pack_uints(C, bits)
+
+    shape, flags = C.shape, 0
+    if seeds is not None:
+        seeds = [seeds] if C.ndim == 2 else seeds
+        payload = b"".join(seed.to_bytes(SEED_BYTES, "little") for seed in seeds) + payload
+        shape, flags = C.shape[:-1] + (gsw.n + 1,), WIRE_SEEDED
+    payload = _compress(payload, compression)
+
+    header = WIRE_HEADER.pack(WIRE_MAGIC, WIRE_VERSION, WIRE_COMPRESSION[compression], bits, gsw.log_base,
+                              dtype.char.encode(), gsw.n, gsw.q, len(payload), len(shape), flags)
+
+    return header + struct.pack(f"<{len(shape)}I", *shape) + payload
+
+# Header fields (flags last, 0 for version 1) and the header's size
+def _unpack_header(data, offset):
+    if len(data) - offset < WIRE_HEADER_V1.size:
+        raise ValueError("Truncated ciphertext header")
+    magic, version = struct.unpack_from("<4sB", data, offset)
+    if magic != WIRE_MAGIC or version not in (1, WIRE_VERSION):
+        raise ValueError("Not a GSW ciphertext or unsupported format version")
+    if version == 1:
+        return WIRE_HEADER_V1.unpack_from(data, offset) + (0,), WIRE_HEADER_V1.size
+    if len(data) - offset < WIRE_HEADER.size:
+        raise ValueError("Truncated ciphertext header")
+
+    return WIRE_HEADER.unpack_from(data, offset), WIRE_HEADER.size
+
+# Returns the matrix, the seeds (None unless the frame is seed-compressed, in which case
+# the matrix is column 0) and the number of bytes consumed, so frames can be read back
+# to back. Uncompressed full-width payloads are decoded as a zero-copy, read-only view of `data`.
+# The header comes from the sender, so everything in it is checked against `gsw` before any
+# payload is decoded: the frame must have exactly `shape`, or by default be a ciphertext
+# (l, n+1) or a batch (k, l, n+1), in the instance's storage dtype and bit width.
+@timed("gsw.matrix_from_bytes")
+def frame_from_bytes(gsw, data, offset=0, shape=None):
+    data = memoryview(data)
+    fields, header_size = _unpack_header(data, offset)
+    _, _, compression, bits, log_base, dtype_char, n, q, length, ndim, flags = fields
+    if (n, q, log_base) != (gsw.n, gsw.q, gsw.log_base):
+        raise ValueError(f"Ciphertext parameters (n={n}, q={q}, log_base={log_base}) do not match the GSW instance")
+    dtype = gsw.arith.storage_dtype
+    try:
+        dtype_ok = np.dtype(dtype_char.decode()) == dtype
+    except (TypeError, UnicodeDecodeError):
+        dtype_ok = False
+    if not dtype_ok or bits != (gsw.q - 1).bit_length():
+        raise ValueError(f"Frame coefficients must be {dtype} at {(gsw.q - 1).bit_length()} bits")
+
+    start = offset + header_size
+    if len(data) - start < 4 * ndim:
+        raise ValueError("Truncated ciphertext header")
+    declared = struct.unpack_from(f"<{ndim}I", data, start)
+    if shape is None:
+        valid = ndim in (2, 3) and declared[-2:] == (gsw.l, gsw.n + 1)
+    else:
+        valid = declared == tuple(shape)
+    if not valid:
+        expected = f"(k, {gsw.l}, {gsw.n + 1}) or ({gsw.l}, {gsw.n + 1})" if shape is None else str(tuple(shape))
+        raise ValueError(f"Frame of shape {declared} does not match the expected {expected}")
+    start += 4 * ndim
+    if len(data) - start < length:
+        raise ValueError("Truncated ciphertext payload")
+
+    shape, seeds, k = declared, None, 0
+    if flags & WIRE_SEEDED:
+        if ndim not in (2, 3):
+            raise ValueError("Seed-compressed frames hold a ciphertext or a batch")
+        k = shape[0] if ndim == 3 else 1
+        shape = shape[:-1] + (1,)
+    dtype = dtype.newbyteorder("<")
+    count = int(np.prod(shape))
+    full_width = bits == dtype.itemsize * 8
+    size = k * SEED_BYTES + (count * dtype.itemsize if full_width else -(-count * bits // 8))
+
+    payload = _decompress(data[start:start + length], compression, size)
+    if len(payload) < size:
+        raise ValueError("Truncated ciphertext payload")
+    if k:
+        seeds = [int.from_bytes(payload[i*SEED_BYTES:(i+1)*SEED_BYTES], "little") for i in range(k)]
+        seeds = seeds if ndim == 3 else seeds[0]
+        payload = payload[k*SEED_BYTES:]
+
+    if full_width:
+        C = np.frombuffer(payload, dtype=dtype, count=count)
+    else:
+        C = unpack_uints(payload, bits, count, dtype)
+
+    return C.reshape(shape), seeds, start + length - offset
+
+# Like frame_from_bytes, but always returns the full matrix, expanding seed-compressed frames
+def matrix_from_bytes(gsw, data, offset=0, shape=None):
+    C, seeds, consumed = frame_from_bytes(gsw, data, offset, shape)
+    if seeds is not None:
+        C = gsw.expand(C, seeds)
+
+    return C, consumed
+
+# Size in bytes of the wire frame starting at `offset`, read from its header
+def frame_size(data, offset=0):
+    fields, header_size = _unpack_header(data, offset)
+    length, ndim = fields[8], fields[9]
+
+    return header_size + 4 * ndim + length
+
+# Splits back-to-back frames without decoding them; `sizer` gives each frame's size
+def split_frames(data, sizer=frame_size):
+    data = memoryview(data)
+    frames = []
+    offset = 0
+    while offset < len(data):
+        end = offset + sizer(data, offset)
+        if end > len(data):
+            raise ValueError("Truncated ciphertext payload")
+        frames.append(data[offset:end])
+        offset = end
+
+    return frames
+
+def key_to_bytes(gsw):
+    header = KEY_HEADER.pack(KEY_MAGIC, KEY_VERSION, gsw.log_base, gsw.n, gsw.q)
+
+    return header + gsw.s_bits.tobytes()
+
+def key_from_bytes(data, seed=None):
+    data = memoryview(data)
+    if len(data) < KEY_HEADER.size:
+        raise ValueError("Truncated key header")
+
+    magic, version, log_base, n, q = KEY_HEADER.unpack_from(data)
+    if magic != KEY_MAGIC or version != KEY_VERSION:
+        raise ValueError("Not a GSW key or unsupported format version")
+    if len(data) - KEY_HEADER.size < -(-n // 8):
+        raise ValueError("Truncated key payload")
+
+    s = np.ones((n+1, 1), dtype=np.int32)
+    s[1:, 0] = unpack_bits(np.frombuffer(data[KEY_HEADER.size:], dtype=np.uint8), n)
+
+    return GSW(n, q, seed=seed, log_base=log_base, s=s)
 
 class GSW:
-    def __init__(self, n, q):
+    def __init__(self, n, q, seed=None, log_base=1, s=None):
         self.n = n
         self.q = q
         self.logq = int(np.log2(q))
-        self.l = (n + 1) * self.logq
+        # Gadget base B = 2^log_base: larger bases shrink l at the cost of more noise in Mult
+        self.log_base = log_base
+        self.d = -(-self.logq // log_base)
+        self.l = (n + 1) * self.d
+        # Pass a seed for reproducible keys and ciphertexts
+        self.rng = np.random.default_rng(seed)
+        self.arith = ModularArithmetic(q, DEFAULT_MATMUL_ENGINE)
+        self.half_q = q // 2
+        # decode() rounds phase / (q // 2), so it is correct while |error| < q // 4
+        self.noise_threshold = self.half_q // 2
+        # A fresh encryption carries a single error sample from get_error, in {0, 1}
+        self.fresh_noise_bound = 1
+        # An existing key can be passed in, e.g. one restored with key_from_bytes
+        self.s = self.generate_s() if s is None else np.asarray(s, dtype=np.int32).reshape(n+1, 1)
+
+    # The key is held as the packed bits of s[1:] (s[0] = 1). s is unpacked on access;
+    # s_ and Gs are cached per key and dropped by the setter (invalidate_key_cache)
+    @property
+    def s(self):
+        s = np.ones((self.n+1, 1), dtype=np.int32)
+        s[1:, 0] = unpack_bits(self.s_bits, self.n)
+
+        return s
+
+    @s.setter
+    def s(self, s):
+        s = np.asarray(s).reshape(self.n+1, 1)
+        if s[0, 0] != 1 or not np.isin(s, (0, 1)).all():
+            raise ValueError("GSW keys are 0/1 vectors with s[0] = 1")
+
+        self.s_bits = pack_bits(s[1:, 0])
+        self.invalidate_key_cache()
+
+    def invalidate_key_cache(self):
+        for name in ("Gs", "s_"):
+            self.__dict__.pop(name, None)
+
+    def regenerate_key(self):
         self.s = self.generate_s()
-        self.G = self.generate_G()
 
-    def get_error(self):
-        e = np.ones((self.l, 1), dtype=np.int32)
-        for i in range(self.l):
-            e[i] = uniform_sample([0, 1])
+    # Bytes held by this instance's key tables; the dense G is shared through gadget_matrix
+    @property
+    def nbytes(self):
+        tables = [self.s_bits] + [self.__dict__[name] for name in ("gadget_powers", "Gs", "s_") if name in self.__dict__]
+        return sum(table.nbytes for table in tables)
+
+    # Dense G, only materialized on access; the hot paths use the gadget_* operators below
+    @property
+    def G(self):
+        return gadget_matrix(self.n, self.q, self.log_base)
+
+    @cached_property
+    def Gs(self):
+        return self.gadget_apply(self.s)
+
+    @cached_property
+    def gadget_powers(self):
+        return 2**(self.log_base * np.arange(self.d, dtype=np.int64))
 
-        return e
+    # Row i of G holds B^(i % d) in column i // d, so G @ x is a reshape against the
+    # d gadget powers: O(l) work instead of O(l * n).
+
+    # G @ x for x of shape (..., n+1, m)
+    def gadget_apply(self, x):
+        x = np.asarray(x)
+        Gx = x[..., :, None, :].astype(np.int64) * self.gadget_powers[:, None]
+
+        return Gx.reshape(x.shape[:-2] + (self.l, x.shape[-1]))
+
+    @cached_property
+    def s_(self):
+        return unpack_bits(self.s_bits, self.n).reshape(self.n, 1)
+
+    def get_error(self, rng=None):
+        return uniform_sample_matrix(self.rng if rng is None else rng, 2, (self.l, 1))
 
     def generate_s(self):
         s = np.ones((self.n+1, 1), dtype=np.int32)
         # s[uniform_sample(range(1, self.n+1), self.n // 2 + 1)] = 0
 
-        for i in range(1, self.n+1):
-            s[i] = uniform_sample([0, 1])
-        
+        s[1:] = uniform_sample_matrix(self.rng, 2, (self.n, 1))
+
         return s
 
     def encode(self, msg):
-        return msg * (self.q // 2)
+        return msg * self.half_q
 
     def decode(self, encoded):
-        return np.round(encoded / (self.q // 2)).astype(np.int32)
+        return np.round(encoded / self.half_q).astype(np.int32)
 
     def generate_G(self):
-        G = np.zeros((self.l, self.n+1), dtype=np.int32)
-        for i in range(self.l):
-            G[i][i // self.logq] = 2**(i % self.logq)
-
-        return G
+        return self.G
     
     # G_inv_M * G = M
-    def generate_G_inverse(self, M):
-        if (self.n+1 != M.shape[1]):
+    # With a workspace, the digits are extracted into a reused buffer of M's dtype
+    # (owned by the workspace) instead of fresh temporaries and a uint8 copy
+    @timed("gsw.G_inverse")
+    def generate_G_inverse(self, M, workspace=None):
+        if (self.n+1 != M.shape[-1]):
             raise ValueError("G and M must have the same number of columns")
-        
-        G_inv_M = np.zeros((M.shape[0], self.l), dtype=np.int32)
-        for i in range(M.shape[0]):
-            for j in range(self.l):
-                G_inv_M[i][j] = decompose(M[i][j // self.logq], self.logq)[j % self.logq]
+        if workspace is None or M.dtype == object:
+            return gadget_decompose(M, self.logq, self.log_base)
 
-        return G_inv_M % self.q
+        digits = workspace.take("G_inverse.digits", M.shape + (self.d,), M.dtype)
+        shifts = (np.arange(self.d) * self.log_base).astype(M.dtype)
+        np.right_shift(M[..., None], shifts, out=digits)
+        np.bitwise_and(digits, M.dtype.type(2**self.log_base - 1), out=digits)
 
+        return digits.reshape(M.shape[:-1] + (self.l,))
+
+    # G^-1(M) for log_base 1, packed by pack_bits: the digits are the low logq bits of each
+    # entry, which unpackbits reads straight from M's little-endian bytes
+    @timed("gsw.G_inverse")
+    def generate_G_inverse_packed(self, M):
+        if self.log_base != 1:
+            raise ValueError("Packed G^-1 needs 0/1 digits (log_base = 1)")
+        if (self.n+1 != M.shape[-1]):
+            raise ValueError("G and M must have the same number of columns")
+        if M.dtype == object:
+            return pack_bits(gadget_decompose(M, self.logq))
+
+        M = np.ascontiguousarray(M, dtype=M.dtype.newbyteorder("<"))
+        le_bytes = M.view(np.uint8).reshape(M.shape + (M.dtype.itemsize,))
+        bits = np.unpackbits(le_bytes, axis=-1, count=self.logq, bitorder="little")
+
+        return pack_bits(bits.reshape(M.shape[:-1] + (self.l,)))
+
+    # Columns 1..n of a fresh ciphertext are uniform, so they are drawn from a Philox stream
+    # under a fresh 128-bit seed and only column 0 and the seed are kept (see expand)
+    def draw_seed(self, rng=None):
+        return int.from_bytes((self.rng if rng is None else rng).bytes(SEED_BYTES), "little")
+
+    # The leading `rows` rows of the uniform columns under `seed`; rows are drawn in order,
+    # so any prefix is regenerated without the rest
+    def uniform_part(self, seed, rows=None):
+        prg = np.random.Generator(np.random.Philox(key=seed))
+        rows = self.l if rows is None else rows
+
+        return uniform_sample_matrix(prg, self.q, (rows, self.n), dtype=self.arith.storage_dtype)
+
+    # Full ciphertext matrices (or their leading rows) from column 0, of shape (..., rows, 1),
+    # and the seed, or one seed per ciphertext of a batch
+    def expand(self, b, seed):
+        if b.ndim == 2:
+            return np.concatenate((b, self.uniform_part(seed, b.shape[0])), axis=1)
+
+        return np.stack([self.expand(b_i, seed_i) for b_i, seed_i in zip(b, seed)])
+
+    @timed("gsw.Enc")
     def Enc(self, msg):
-        e = self.get_error()
-        Cs = self.encode(msg) * (self.G @ self.s) + e
+        return self.Enc_online(msg, self.Enc_offline())
 
-        C_ = np.ones((self.l, self.n), dtype=np.int32)
-        for i in range(self.l):
-            for j in range(self.n):
-                C_[i][j] = uniform_sample(range(self.q))
+    # Everything in Enc but the message: column 0 of a seed-compressed encryption of zero,
+    # e - C_ @ s_, and its seed. Pass a separate rng to precompute off the instance's own
+    # generator, e.g. from another thread.
+    @timed("gsw.Enc_offline")
+    def Enc_offline(self, rng=None):
+        e = self.get_error(rng)
+        seed = self.draw_seed(rng)
+        b = self.arith.sub(e, self.arith.matmul(self.uniform_part(seed), self.s_, self.q - 1, 1))
 
-        s_ = self.s[1:]
-        C = np.concatenate((-C_ @ s_ + Cs, C_), axis=1) % self.q
+        return b, seed
 
-        return GSW_Ciphertext(self, C)
+    # Adds encode(msg) * G s to column 0 of offline material, which shifts the phase of
+    # every row by the message's gadget term; each material must be used only once
+    def Enc_online(self, msg, material):
+        b, seed = material
+        b = self.arith.add(self.arith.scale(self.Gs, self.encode(msg)), b)
 
-    def Dec_with_key(self, ctxt, s):
-        encoded = (ctxt.C[0] @ s)[0] % self.q
+        return GSW_Ciphertext(self, b, self.fresh_noise_bound, seed=seed)
+
+    # Same draws, in the same order, as calling Enc on each message in turn
+    @timed("gsw.Enc_batch")
+    def Enc_batch(self, msgs):
+        k = len(msgs)
+        e = np.empty((k, self.l, 1), dtype=np.int32)
+        C_ = np.empty((k, self.l, self.n), dtype=self.arith.storage_dtype)
+        seeds = []
+        for i in range(k):
+            e[i] = self.get_error()
+            seeds.append(self.draw_seed())
+            C_[i] = self.uniform_part(seeds[i])
+
+        codes = np.array([self.encode(msg) % self.q for msg in msgs]).reshape(k, 1, 1)
+        Cs = self.arith.add(self.arith.scale(self.Gs, codes), e)
+        b = self.arith.sub(Cs, self.arith.matmul(C_, self.s_, self.q - 1, 1))
+
+        return GSW_Ciphertext_Batch(self, b, np.full(k, self.fresh_noise_bound), seeds=seeds)
+
+    # C[row] @ s mod q, for a single (l, n+1) ciphertext matrix or a (k, l, n+1) stack
+    def phase(self, C, s=None, row=0):
+        s = self.s if s is None else s
+
+        return self.arith.matmul(C[..., row, :], s, self.q - 1)[..., 0]
+
+    # |C[row] @ s - encode(ptxt) * (G @ s)[row]| mod q, touching only that row: (G @ s)[row]
+    # is B^(row % d) * s[row // d], so Gs is never built.
+    # Only row 0 carries the message under encode(), but any row can be inspected for noise.
+    def row_error(self, C, ptxt, row=0):
+        codes = (np.asarray(self.encode(np.asarray(ptxt))) % self.q).reshape(C.shape[:-2])
+
+        gs = int(self.gadget_powers[row % self.d]) * int(self.s[row // self.d, 0])
+
+        return np.abs(self.arith.sub(self.phase(C, row=row), self.arith.scale(gs, codes)))
+
+    # C + c * G mod q, touching only the l nonzero entries of G
+    def add_gadget_multiple(self, C, c):
+        rows = np.arange(self.l)
+        cols = rows // self.d
+        C = C.copy()
+        C[..., rows, cols] = self.arith.add(C[..., rows, cols], self.arith.scale(self.gadget_powers[rows % self.d], c))
+
+        return C
+
+    # Analytic worst-case |error| bounds, updated without touching the matrices.
+    # None means unknown (e.g. an uploaded ciphertext); bounds are capped at q,
+    # past which the noise is uniform anyway.
+    def add_noise_bound(self, b1, b2):
+        if b1 is None or b2 is None:
+            return None
+
+        return np.minimum(np.add(b1, b2), self.q)
+
+    # With X = G^-1(C1) @ C2 and C2 s = e2 + encode(m2) Gs + q k, dividing by q // 2 leaves
+    #   m2 e1 + G^-1(C1) e2 / (q // 2) + 2 G^-1(C1) k
+    # plus (n+1)/2 of rounding. |G^-1(C1)| sums to at most l (B-1) per row, and |k| is at
+    # most (n+1) + (e2 + (q // 2) B^(d-1)) / q, so the last term alone is usually already q.
+    def mult_noise_bound(self, b1, b2):
+        if b1 is None or b2 is None:
+            return None
+
+        digits = self.l * (2**self.log_base - 1)
+        k = (self.n + 1) + (np.asarray(b2) + self.half_q * int(self.gadget_powers[-1])) / self.q
+        bound = np.add(b1, digits * np.asarray(b2) / self.half_q) + 2 * digits * k + (self.n + 1) / 2
+
+        return np.minimum(bound, self.q)
 
-        return self.decode(encoded)
+    # Functional homomorphic ops: return a new ciphertext of c1's class, or write into
+    # `out` (a ciphertext whose writable matrix the caller owns) and return it
+    def add(self, c1, c2, out=None):
+        bound = self.add_noise_bound(c1.noise_bound, c2.noise_bound)
+        if out is None:
+            return type(c1)(self, self.arith.add(c1.C, c2.C), bound)
 
+        # Rebinding drops any seed `out` was expanded from, since its matrix changes
+        out.C = self.arith.add(c1.C, c2.C, out=out.C)
+        out.noise_bound = bound
+        return out
+
+    # round(G^-1(C1) @ C2 / (q // 2)) mod q. The product is only reduced mod (q // 2) * q,
+    # which leaves the rounded quotient unchanged mod q. Pass a Workspace to reuse the
+    # widened G^-1(C1) and the product buffers across a chain of multiplications.
+    # Base-2 digits the engine does not take (no engine, or q too large for exact float64)
+    # go through the packed kernel instead of NumPy's integer matmul.
+    def mult(self, c1, c2, out=None, workspace=None):
+        workspace = Workspace() if workspace is None else workspace
+        modulus = self.half_q * self.q
+        size = c1.C.size // (self.n+1) * self.l
+        if self.log_base == 1 and c1.C.dtype != object and not self.arith.engine_accepts(size, self.l * (self.q - 1)):
+            X = self.arith.packed_matmul(self.generate_G_inverse_packed(c1.C), c2.C, self.q - 1,
+                                         modulus=modulus, workspace=workspace)
+        else:
+            X = self.arith.matmul(self.generate_G_inverse(c1.C, workspace), c2.C, 2**self.log_base - 1, self.q - 1,
+                                  modulus=modulus, workspace=workspace)
+        bound = self.mult_noise_bound(c1.noise_bound, c2.noise_bound)
+        if out is None:
+            return type(c1)(self, self.arith.round_div(X, self.half_q, workspace=workspace), bound)
+
+        out.C = self.arith.round_div(X, self.half_q, out=out.C, workspace=workspace)
+        out.noise_bound = bound
+        return out
+
+    def noise_budget(self, bound):
+        if bound is None:
+            return None
+
+        return np.maximum(self.noise_threshold - np.asarray(bound), 0)
+
+    def Dec_with_key(self, ctxt, s):
+        return self.decode(self.phase(ctxt.head(1), s))
+
+    @timed("gsw.Dec")
     def Dec(self, ctxt):
         return self.Dec_with_key(ctxt, self.s)
 
-class GSW_Ciphertext:
-    def __init__(self, gsw, C):
+    @timed("gsw.Dec_batch")
+    def Dec_batch(self, batch):
+        return batch.Dec_with_key(self.s)
+
+# Ciphertext matrices that may be held seed-compressed: for a fresh encryption only
+# column 0 (`b`) and the seed(s) of the uniform columns are kept, and C is expanded on
+# first access and cached. Assigning C drops the seed; decryption and row errors only
+# regenerate the rows they read.
+class _SeededMatrix:
+    def _set_matrix(self, C, seed):
+        # Matrices already in the storage dtype are taken to be reduced mod q
+        if C.dtype != self.gsw.arith.storage_dtype:
+            C = self.gsw.arith.reduce(C)
+        if seed is None:
+            self.C = C
+        else:
+            self._C, self.b, self.seed = None, C, seed
+
+    @property
+    def C(self):
+        if self._C is None:
+            self._C = self.gsw.expand(self.b, self.seed)
+
+        return self._C
+
+    @C.setter
+    def C(self, C):
+        self._C, self.b, self.seed = C, None, None
+
+    @property
+    def seeded(self):
+        return self.seed is not None
+
+    # Bytes held in memory, counting column 0 and the seeds while C is not expanded
+    @property
+    def nbytes(self):
+        if self.seed is None:
+            return self._C.nbytes
+
+        matrix = self._C.nbytes if self._C is not None else 0
+        seeds = len(self.seed) if isinstance(self.seed, list) else 1
+        return matrix + self.b.nbytes + SEED_BYTES * seeds
+
+    # The leading `rows` rows of C, without expanding the rest of a seeded matrix
+    def head(self, rows):
+        if self._C is not None:
+            return self._C[..., :rows, :]
+
+        return self.gsw.expand(self.b[..., :rows, :], self.seed)
+
+    def to_bytes(self, compression=None):
+        if self.seed is not None:
+            return matrix_to_bytes(self.gsw, self.b, compression, self.seed)
+
+        return matrix_to_bytes(self.gsw, self.C, compression)
+
+class GSW_Ciphertext(_SeededMatrix):
+    # With a seed, C is only column 0 of a fresh ciphertext (see GSW.Enc)
+    def __init__(self, gsw, C, noise_bound=None, seed=None):
         self.gsw = gsw
-        self.C = C
+        self._set_matrix(C, seed)
+        # Analytic bound on |error|, or None when the ciphertext's history is unknown
+        self.noise_bound = noise_bound
 
-    def get_error(self, ptxt):
-        G = self.gsw.G
-        s = self.gsw.s
+    @timed("gsw.get_error")
+    def get_error(self, ptxt, row=0):
+        return self.gsw.row_error(self.head(row + 1), ptxt, row)
 
-        error_vec = ((self.C @ s) - self.gsw.encode(ptxt) * (G @ s)) % self.gsw.q
+    @classmethod
+    def from_bytes(cls, gsw, data):
+        C, seed, _ = frame_from_bytes(gsw, data, shape=(gsw.l, gsw.n + 1))
 
-        return abs(error_vec[0][0])
+        return cls(gsw, C, seed=seed)
 
     def max_valid_error(self):
-        return self.gsw.q // 2
+        return self.gsw.half_q
     
     def is_error_valid(self, ptxt):
         return self.get_error(ptxt) < self.max_valid_error()
 
+    # O(1) estimate of how much more error decryption tolerates; no key or matmul needed
+    def noise_budget(self):
+        return self.gsw.noise_budget(self.noise_bound)
+
     def Dec_with_key(self, s):
-        encoded = (self.C[0] @ s)[0] % self.gsw.q
+        return self.gsw.decode(self.gsw.phase(self.head(1), s))
+
+    # Add/Mult replace self.C with a new matrix and return self; add/mult (and +, *)
+    # leave both operands untouched, or write into an `out` ciphertext the caller owns
+    @timed("gsw.Add")
+    def Add(self, other):
+        result = self.gsw.add(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    @timed("gsw.Mult")
+    def Mult(self, other):
+        result = self.gsw.mult(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    def add(self, other, out=None):
+        return self.gsw.add(self, other, out)
+
+    def mult(self, other, out=None, workspace=None):
+        return self.gsw.mult(self, other, out, workspace)
+
+    def __add__(self, other):
+        return self.add(other)
+
+    def __mul__(self, other):
+        return self.mult(other)
+
+    # Adds the noiseless encryption encode(1) * G of 1, flipping the bit
+    def Not(self):
+        self.C = self.gsw.add_gadget_multiple(self.C, self.gsw.encode(1))
+
+        return self
+
+# A stack of k ciphertexts of the same GSW instance, held as one (k, l, n+1) array
+class GSW_Ciphertext_Batch(_SeededMatrix):
+    # With seeds (one per ciphertext), C holds only column 0 of each, of shape (k, l, 1)
+    def __init__(self, gsw, C, noise_bound=None, seeds=None):
+        self.gsw = gsw
+        if C.ndim != 3:
+            raise ValueError("Batched ciphertexts must have shape (k, l, n+1)")
+        self._set_matrix(C, None if seeds is None else list(seeds))
+        # Per-ciphertext bounds of shape (k,), or None if any is unknown
+        self.noise_bound = noise_bound
+
+    # Stays seed-compressed when every ciphertext is
+    @classmethod
+    def from_ciphertexts(cls, ctxts):
+        if len(ctxts) == 0:
+            raise ValueError("Cannot batch an empty list of ciphertexts")
 
-        return self.gsw.decode(encoded)
+        bounds = [ctxt.noise_bound for ctxt in ctxts]
+        noise_bound = None if any(b is None for b in bounds) else np.array(bounds, dtype=np.float64)
+        if all(ctxt.seeded for ctxt in ctxts):
+            return cls(ctxts[0].gsw, np.stack([ctxt.b for ctxt in ctxts]), noise_bound, [ctxt.seed for ctxt in ctxts])
 
+        return cls(ctxts[0].gsw, np.stack([ctxt.C for ctxt in ctxts]), noise_bound)
+
+    @classmethod
+    def from_bytes(cls, gsw, data):
+        C, seeds, _ = frame_from_bytes(gsw, data)
+        if C.ndim != 3:
+            raise ValueError("Expected a batch, got a single ciphertext")
+
+        return cls(gsw, C, seeds=seeds)
+
+    def to_ciphertexts(self):
+        return [self[i] for i in range(len(self))]
+
+    def __len__(self):
+        return (self.b if self._C is None else self._C).shape[0]
+
+    def __getitem__(self, i):
+        bound = None if self.noise_bound is None else self.noise_bound[i]
+        if self.seed is not None:
+            return GSW_Ciphertext(self.gsw, self.b[i], bound, seed=self.seed[i])
+
+        return GSW_Ciphertext(self.gsw, self._C[i], bound)
+
+    @timed("gsw.batch.get_error")
+    def get_error(self, ptxts, row=0):
+        return self.gsw.row_error(self.head(row + 1), ptxts, row)
+
+    def max_valid_error(self):
+        return self.gsw.half_q
+
+    def is_error_valid(self, ptxts):
+        return self.get_error(ptxts) < self.max_valid_error()
+
+    def noise_budget(self):
+        return self.gsw.noise_budget(self.noise_bound)
+
+    def Dec_with_key(self, s):
+        return self.gsw.decode(self.gsw.phase(self.head(1), s))
+
+    @timed("gsw.batch.Add")
     def Add(self, other):
-        self.C = (self.C + other.C) % self.gsw.q
+        result = self.gsw.add(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
 
         return self
 
+    @timed("gsw.batch.Mult")
     def Mult(self, other):
-        C = (self.gsw.generate_G_inverse(self.C) @ other.C) / (self.gsw.q // 2)
-        self.C = np.round(C).astype(np.int32) % self.gsw.q
+        result = self.gsw.mult(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    def add(self, other, out=None):
+        return self.gsw.add(self, other, out)
+
+    def mult(self, other, out=None, workspace=None):
+        return self.gsw.mult(self, other, out, workspace)
+
+    def __add__(self, other):
+        return self.add(other)
+
+    def __mul__(self, other):
+        return self.mult(other)
+
+    def Not(self):
+        self.C = self.gsw.add_gadget_multiple(self.C, self.gsw.encode(1))
+
+        return self
+
+
+GATE_OPS = {"add": "Add", "mult": "Mult", "not": "Not"}
+
+# Turns gates (gate_id, op, input_ids) over the named inputs into levels of binary or
+# unary gates, where every gate only depends on earlier levels. n-ary Add/Mult gates are
+# split into trees that pair the shallowest operands first, which minimizes the resulting
+# multiplicative depth; each Mult takes the deeper (noisier) operand on the left, since
+# G^-1(C1) @ C2 amplifies the noise of C2 and only carries over that of C1
+# (plan_noise_bounds revisits that choice when the operands' noise bounds are known).
+def schedule_circuit(input_ids, gates):
+    depth = {node: 0 for node in input_ids}
+    level = {node: 0 for node in input_ids}
+    steps = []
+    counter = 0
+
+    def add_step(node, op, operands):
+        level[node] = 1 + max(level[x] for x in operands)
+        depth[node] = max(depth[x] for x in operands) + (op == "Mult")
+        steps.append((level[node], node, op, operands))
+
+    for gate_id, op, operands in gates:
+        op = GATE_OPS.get(str(op).lower())
+        if op is None:
+            raise ValueError(f"Gate {gate_id}: unknown operation, expected one of Add, Mult, Not")
+        if gate_id in depth or "#" in str(gate_id):
+            raise ValueError(f"Gate {gate_id}: duplicate or reserved node id")
+        for x in operands:
+            if x not in depth:
+                raise ValueError(f"Gate {gate_id}: unknown or later-defined input {x}")
+        if op == "Not" and len(operands) != 1:
+            raise ValueError(f"Gate {gate_id}: Not takes exactly one input")
+        if op != "Not" and len(operands) < 2:
+            raise ValueError(f"Gate {gate_id}: {op} takes at least two inputs")
+
+        if op == "Not":
+            add_step(gate_id, op, [operands[0]])
+            continue
+
+        pending = list(operands)
+        while len(pending) > 2:
+            pending.sort(key=lambda x: (depth[x], level[x]))
+            left, right = pending[1], pending[0]
+            counter += 1
+            node = f"{gate_id}#{counter}"
+            add_step(node, op, [left, right])
+            pending = pending[2:] + [node]
+        left, right = sorted(pending, key=lambda x: (depth[x], level[x]), reverse=True)
+        add_step(gate_id, op, [left, right])
+
+    levels = {}
+    for step_level, node, op, operands in steps:
+        levels.setdefault(step_level, []).append((node, op, operands))
+
+    return [levels[k] for k in sorted(levels)], depth
+
+# Predicts every node's noise bound from the inputs' bounds, flipping the operands of a
+# Mult whenever the other orientation gives a strictly smaller bound. O(gates), no matmul.
+def plan_noise_bounds(gsw, levels, input_bounds):
+    bounds = dict(input_bounds)
+    for level in levels:
+        for node, op, operands in level:
+            if op == "Not":
+                bounds[node] = bounds[operands[0]]
+            elif op == "Add":
+                bounds[node] = gsw.add_noise_bound(bounds[operands[0]], bounds[operands[1]])
+            else:
+                left, right = operands
+                bound = gsw.mult_noise_bound(bounds[left], bounds[right])
+                flipped = gsw.mult_noise_bound(bounds[right], bounds[left])
+                if bound is not None and flipped < bound:
+                    operands.reverse()
+                    bound = flipped
+                bounds[node] = bound
+
+    return bounds
+
+# Evaluates the circuit level by level, running all gates of the same level and
+# operation as one stacked GSW_Ciphertext_Batch call. Gates must be listed after
+# their inputs (i.e. in topological order). With strict=True the circuit is refused
+# up front if any output's noise bound is unknown or too large to decrypt.
+@timed("gsw.evaluate_circuit")
+def evaluate_circuit(gsw, inputs, gates, outputs=None, strict=False):
+    levels, _ = schedule_circuit(list(inputs), gates)
+    bounds = plan_noise_bounds(gsw, levels, {node: ctxt.noise_bound for node, ctxt in inputs.items()})
+
+    outputs = [gate[0] for gate in gates] if outputs is None else outputs
+    for node in outputs:
+        if node not in bounds or "#" in node:
+            raise ValueError(f"Unknown output node: {node}")
+    if strict:
+        failing = [node for node in outputs if bounds[node] is None or bounds[node] >= gsw.noise_threshold]
+        if failing:
+            raise ValueError(f"Noise budget exhausted or unknown for outputs: {', '.join(map(str, failing))}")
+
+    # Schemes with their own ciphertext types name them (see rns.RNSGSW)
+    batch_type = getattr(gsw, "batch_type", GSW_Ciphertext_Batch)
+    ciphertext_type = getattr(gsw, "ciphertext_type", GSW_Ciphertext)
+    values = {node: ctxt.C for node, ctxt in inputs.items()}
+    workspace = Workspace()
+    for level in levels:
+        by_op = {}
+        for node, op, operands in level:
+            by_op.setdefault(op, []).append((node, operands))
+
+        for op, group in by_op.items():
+            left = batch_type(gsw, np.stack([values[operands[0]] for _, operands in group]))
+            if op == "Not":
+                result = left.Not()
+            else:
+                right = batch_type(gsw, np.stack([values[operands[1]] for _, operands in group]))
+                result = left.add(right) if op == "Add" else left.mult(right, workspace=workspace)
+            for i, (node, _) in enumerate(group):
+                values[node] = result.C[i]
 
-        return self
\ No newline at end of file
+    return {node: ciphertext_type(gsw, values[node], bounds[node]) for node in outputs}
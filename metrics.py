@@ -0,0 +1,157 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Opt-in instrumentation. The flag is read once at import: when it is off, `timed`
+# returns the function unchanged and `timer`/`count` are no-ops, so hot paths pay nothing.
+ENABLED = os.environ.get("GSW_METRICS", "").lower() in ("1", "true", "yes")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # phase -> [bucket counts..., +Inf count, sum]
+_counters = {}    # event -> count
+
+
+def observe(phase, seconds):
+    with _lock:
+        hist = _histograms.get(phase)
+        if hist is None:
+            hist = _histograms[phase] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        else:
+            hist[len(BUCKETS)] += 1
+        hist[-1] += seconds
+
+def count(event, value=1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[event] = _counters.get(event, 0) + value
+
+@contextmanager
+def _timer(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(phase, time.perf_counter() - start)
+
+def timer(phase):
+    return _timer(phase) if ENABLED else nullcontext()
+
+def timed(phase):
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(phase, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Prometheus text exposition format; `gauges` maps metric name -> value, for point-in-time readings
+def render_prometheus(gauges=None):
+    with _lock:
+        histograms = {phase: list(hist) for phase, hist in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = ["# HELP gsw_phase_seconds Time spent per instrumented phase",
+             "# TYPE gsw_phase_seconds histogram"]
+    for phase, hist in sorted(histograms.items()):
+        label = f'phase="{_escape(phase)}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS, hist):
+            cumulative += n
+            lines.append(f'gsw_phase_seconds_bucket{{{label},le="{bound:g}"}} {cumulative}')
+        cumulative += hist[len(BUCKETS)]
+        lines.append(f'gsw_phase_seconds_bucket{{{label},le="+Inf"}} {cumulative}')
+        lines.append(f"gsw_phase_seconds_sum{{{label}}} {hist[-1]:.9f}")
+        lines.append(f"gsw_phase_seconds_count{{{label}}} {cumulative}")
+
+    lines += ["# HELP gsw_events_total Instrumented event counts",
+              "# TYPE gsw_events_total counter"]
+    for event, n in sorted(counters.items()):
+        lines.append(f'gsw_events_total{{event="{_escape(event)}"}} {n}')
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+# ---- Per-request profiling ----
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+# Set for the duration of a request that asked to be profiled; worker pools read it
+# from the submitting context and profile the job on the thread that runs it
+active_profile = ContextVar("gsw_active_profile", default=None)
+
+class RequestProfile:
+    def __init__(self, profiler="cprofile"):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {profiler}")
+        # pyinstrument is optional; fall back to cProfile without it
+        self.profiler = profiler if profiler == "cprofile" or pyinstrument is not None else "cprofile"
+        self.reports = []
+
+    def wrap(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if self.profiler == "pyinstrument":
+                profiler = pyinstrument.Profiler()
+                profiler.start()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    profiler.stop()
+                    self.reports.append(profiler.output_text())
+
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+                self.reports.append(out.getvalue())
+
+        return wrapper
+
+    def report(self):
+        return "\n".join(self.reports) or "No profiled work ran in this request\n"
+
+def profiled(fn):
+    profile = active_profile.get()
+    return fn if profile is None else profile.wrap(fn)
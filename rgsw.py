@@ -0,0 +1,282 @@
+from utils import is_prime, uniform_sample_matrix
+from metrics import timed
+from functools import lru_cache
+import numpy as np
+
+# Coefficients are multiplied in int64, so products of two residues must fit: q < 2^31
+RGSW_MAX_Q = 2**31
+
+# Largest prime q < 2^logq with q = 1 mod 2n, so that Z_q has the 2n-th roots of unity
+# the negacyclic NTT of degree n needs
+def ntt_prime(n, logq):
+    q = (2**logq - 1) // (2 * n) * (2 * n) + 1
+    while q > 2 * n:
+        if q < 2**logq and is_prime(q):
+            return q
+        q -= 2 * n
+
+    raise ValueError(f"No NTT-friendly prime below 2^{logq} for n={n}")
+
+# Twiddle tables of the negacyclic NTT over Z_q[X]/(X^n + 1), shared by every instance
+# with the same (n, q): psi is a primitive 2n-th root of unity and omega = psi^2.
+class NTTTables:
+    def __init__(self, n, q):
+        if n & (n - 1) or n < 2:
+            raise ValueError("The ring degree n must be a power of two")
+        if (q - 1) % (2 * n) or not is_prime(q):
+            raise ValueError(f"q={q} must be a prime with q = 1 mod 2n (see ntt_prime)")
+
+        self.n, self.q = n, q
+        self.log_n = n.bit_length() - 1
+        psi = self._root(n, q)
+        psi_inv = pow(psi, q - 2, q)
+
+        powers = np.arange(n, dtype=object)
+        self.psi = np.array([pow(psi, int(i), q) for i in powers], dtype=np.int64)
+        self.psi_inv_scaled = np.array([pow(psi_inv, int(i), q) * pow(n, q - 2, q) % q for i in powers], dtype=np.int64)
+        self.bitrev = np.array([int(format(i, f"0{self.log_n}b")[::-1], 2) for i in range(n)], dtype=np.int64)
+        self.forward = self._stage_twiddles(psi * psi % q)
+        self.inverse = self._stage_twiddles(psi_inv * psi_inv % q)
+
+    @staticmethod
+    def _root(n, q):
+        for g in range(2, q):
+            psi = pow(g, (q - 1) // (2 * n), q)
+            if pow(psi, n, q) == q - 1:
+                return psi
+
+        raise ValueError(f"No primitive {2 * n}-th root of unity mod {q}")
+
+    # Per butterfly stage with half-size m: omega_(2m)^k for k < m
+    def _stage_twiddles(self, omega):
+        stages = []
+        m = 1
+        while m < self.n:
+            w = pow(omega, self.n // (2 * m), self.q)
+            stages.append(np.array([pow(w, k, self.q) for k in range(m)], dtype=np.int64))
+            m *= 2
+
+        return stages
+
+    # Iterative radix-2 transform along the last axis, every butterfly of a stage at once
+    def _transform(self, a, stages):
+        a = a[..., self.bitrev]
+        batch = a.shape[:-1]
+        m = 1
+        for w in stages:
+            blocks = a.reshape(batch + (self.n // (2 * m), 2, m))
+            u = blocks[..., 0, :]
+            v = blocks[..., 1, :] * w % self.q
+            a = np.stack(((u + v) % self.q, (u - v) % self.q), axis=-2).reshape(batch + (self.n,))
+            m *= 2
+
+        return a
+
+    # Coefficients in [0, q) -> evaluations at the odd powers of psi
+    def ntt(self, a):
+        return self._transform(np.asarray(a, dtype=np.int64) * self.psi % self.q, self.forward)
+
+    def intt(self, a_hat):
+        return self._transform(a_hat, self.inverse) * self.psi_inv_scaled % self.q
+
+@lru_cache(maxsize=8)
+def ntt_tables(n, q):
+    return NTTTables(n, q)
+
+# Product of polynomials in Z_q[X]/(X^n + 1), for coefficient arrays broadcasting along the leading axes
+def negacyclic_mul(a, b, tables):
+    return tables.intt(tables.ntt(a) * tables.ntt(b) % tables.q)
+
+
+# Ring-GSW over R_q = Z_q[X]/(X^n + 1), with the secret s = (1, z) for a binary polynomial z.
+# A ciphertext is an (l, 2) matrix of ring elements, l = 2d, held as an (l, 2, n) array of
+# coefficients in [0, q): C = Z + m G with G = I_2 (x) (1, B, ..., B^(d-1)) and the rows
+# (b_i, a_i) of Z encryptions of zero, b_i = e_i - a_i z. Every entry is one ring element
+# instead of n integers, so ciphertexts are n times smaller than GSW's (l*n, n+1) matrices,
+# and Mult's matrix product runs through the NTT in O(l^2 n log n) instead of O(l^3 n^3).
+#
+# Unlike GSW's encode(), the message sits unscaled in G, so Mult is the plain
+# G^-1(C1) C2 with additive noise growth, and decryption reads the first-block row whose
+# gadget power lies nearest q / 2. Messages are bits; Add adds them in Z, so a sum only
+# decrypts while it stays in {0, 1}.
+class RGSW:
+    def __init__(self, n, q, seed=None, log_base=1):
+        if q >= RGSW_MAX_Q:
+            raise ValueError(f"RGSW needs q < 2^31, got q={q}")
+
+        self.n = n
+        self.q = q
+        self.tables = ntt_tables(n, q)
+        self.bits = (q - 1).bit_length()
+        self.log_base = log_base
+        self.d = -(-self.bits // log_base)
+        self.l = 2 * self.d
+        self.gadget_powers = 2**(log_base * np.arange(self.d, dtype=np.int64)) % q
+        self.rng = np.random.default_rng(seed)
+
+        # Decryption row: the power farthest from 0 mod q, decoded correctly while |error| < half that distance
+        distance = np.minimum(self.gadget_powers, q - self.gadget_powers)
+        self.dec_row = int(np.argmax(distance))
+        self.noise_threshold = int(distance[self.dec_row]) // 2
+        self.fresh_noise_bound = 1
+
+        self.z = self.generate_z()
+
+    def generate_z(self):
+        return uniform_sample_matrix(self.rng, 2, (self.n,), dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return self.z.nbytes
+
+    # m G as an (l, 2, n) coefficient array: constant polynomials m B^j on the block diagonal
+    def gadget(self, m):
+        G = np.zeros((self.l, 2, self.n), dtype=np.int64)
+        for block in range(2):
+            G[block*self.d:(block+1)*self.d, block, 0] = self.gadget_powers * m % self.q
+
+        return G
+
+    # Base-B digits of every coefficient: row (c0, c1) -> (digits of c0, digits of c1), so
+    # G^-1(C) has shape (..., l, l, n) with G^-1(C) G = C
+    @timed("rgsw.G_inverse")
+    def generate_G_inverse(self, C):
+        shifts = (self.log_base * np.arange(self.d, dtype=np.int64))[:, None]
+        digits = (C[..., :, None, :] >> shifts) & (2**self.log_base - 1)
+
+        return digits.reshape(C.shape[:-2] + (self.l, self.n))
+
+    @timed("rgsw.Enc")
+    def Enc(self, msg):
+        a = uniform_sample_matrix(self.rng, self.q, (self.l, self.n), dtype=np.int64)
+        e = uniform_sample_matrix(self.rng, 2, (self.l, self.n), dtype=np.int64)
+        b = (e - negacyclic_mul(a, self.z, self.tables)) % self.q
+        C = (np.stack((b, a), axis=1) + self.gadget(msg)) % self.q
+
+        return RGSW_Ciphertext(self, C, self.fresh_noise_bound)
+
+    # (C s)[row] = b + a z, the message's gadget term plus the row's error
+    def phase(self, C, z=None, row=None):
+        z = self.z if z is None else z
+        row = self.dec_row if row is None else row
+
+        return (C[row, 0] + negacyclic_mul(C[row, 1], z, self.tables)) % self.q
+
+    def decode(self, phase):
+        g = int(self.gadget_powers[self.dec_row])
+        # Circular distances of the constant coefficient to 0 and to g
+        to_zero = min(phase, self.q - phase)
+        to_g = min((phase - g) % self.q, (g - phase) % self.q)
+
+        return int(to_g < to_zero)
+
+    def Dec_with_key(self, ctxt, z):
+        return self.decode(int(self.phase(ctxt.C, z)[0]))
+
+    @timed("rgsw.Dec")
+    def Dec(self, ctxt):
+        return self.Dec_with_key(ctxt, self.z)
+
+    # Largest |coefficient| of the row's error, centered mod q
+    def row_error(self, C, ptxt, row=None):
+        row = self.dec_row if row is None else row
+        block, j = divmod(row, self.d)
+        # Row `row` of m G s is m B^j in the first block and m B^j z in the second
+        expected = np.zeros(self.n, dtype=np.int64)
+        expected[0] = ptxt * self.gadget_powers[j] % self.q
+        if block == 1:
+            expected = negacyclic_mul(expected, self.z, self.tables)
+        error = (self.phase(C, row=row) - expected) % self.q
+
+        return int(np.minimum(error, self.q - error).max())
+
+    # Worst-case |error| bounds: Add sums them; Mult leaves m2 e1 + G^-1(C1) e2, and each
+    # coefficient of G^-1(C1) e2 sums l n products of a digit (< B) and an error coefficient
+    def add_noise_bound(self, b1, b2):
+        if b1 is None or b2 is None:
+            return None
+
+        return min(b1 + b2, self.q)
+
+    def mult_noise_bound(self, b1, b2):
+        if b1 is None or b2 is None:
+            return None
+
+        return min(b1 + self.l * self.n * (2**self.log_base - 1) * b2, self.q)
+
+    def noise_budget(self, bound):
+        if bound is None:
+            return None
+
+        return max(self.noise_threshold - bound, 0)
+
+    def add(self, c1, c2):
+        return RGSW_Ciphertext(self, (c1.C + c2.C) % self.q, self.add_noise_bound(c1.noise_bound, c2.noise_bound))
+
+    # G^-1(C1) C2: the l x l x l ring products become pointwise products of NTT evaluations,
+    # accumulated over the inner index with one reduction per term (each is below q^2 < 2^62)
+    @timed("rgsw.mult")
+    def mult(self, c1, c2):
+        D_hat = self.tables.ntt(self.generate_G_inverse(c1.C))
+        C2_hat = self.tables.ntt(c2.C)
+        acc = np.zeros((self.l, 2, self.n), dtype=np.int64)
+        for k in range(self.l):
+            acc = (acc + D_hat[:, k, None, :] * C2_hat[k] % self.q) % self.q
+
+        return RGSW_Ciphertext(self, self.tables.intt(acc), self.mult_noise_bound(c1.noise_bound, c2.noise_bound))
+
+class RGSW_Ciphertext:
+    def __init__(self, rgsw, C, noise_bound=None):
+        self.rgsw = rgsw
+        self.C = C
+        self.noise_bound = noise_bound
+
+    @property
+    def nbytes(self):
+        return self.C.nbytes
+
+    def get_error(self, ptxt, row=None):
+        return self.rgsw.row_error(self.C, ptxt, row)
+
+    def max_valid_error(self):
+        return self.rgsw.noise_threshold
+
+    def is_error_valid(self, ptxt):
+        return self.get_error(ptxt) < self.max_valid_error()
+
+    def noise_budget(self):
+        return self.rgsw.noise_budget(self.noise_bound)
+
+    def Dec_with_key(self, z):
+        return self.rgsw.Dec_with_key(self, z)
+
+    # Add/Mult replace self.C and return self, like GSW_Ciphertext; add/mult (and +, *) do not
+    def Add(self, other):
+        result = self.rgsw.add(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    def Mult(self, other):
+        result = self.rgsw.mult(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    def add(self, other):
+        return self.rgsw.add(self, other)
+
+    def mult(self, other):
+        return self.rgsw.mult(self, other)
+
+    def __add__(self, other):
+        return self.add(other)
+
+    def __mul__(self, other):
+        return self.mult(other)
+
+    # G - C encrypts 1 - m, with the error negated
+    def Not(self):
+        self.C = (self.rgsw.gadget(1) - self.C) % self.rgsw.q
+
+        return self
@@ -0,0 +1,459 @@
+from utils import is_prime, pack_bits, unpack_bits, uniform_sample_matrix
+from gsw import DEFAULT_MATMUL_ENGINE, ModularArithmetic, frame_size, split_frames
+from metrics import timed
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+import math
+import numpy as np
+import os
+import struct
+import threading
+
+# Limb primes are the largest primes below 2^RNS_LIMB_BITS. Residues stay below 2^31, so a
+# residue times a CRT constant fits int64 and limbs are stored as uint32
+RNS_LIMB_BITS = 30
+RNS_MAX_LIMB_BITS = 31
+# Threads running the per-limb products of Mult; GSW_RNS_WORKERS=1 runs limbs in turn
+RNS_WORKERS = int(os.environ.get("GSW_RNS_WORKERS", str(os.cpu_count() or 1)))
+
+# Compact RNS key format: magic, version, log_base, n, number of limbs, then the limb primes
+# as uint32 and the n binary coefficients s[1:] packed one bit each (s[0] is always 1)
+RNS_KEY_MAGIC = b"GSWR"
+RNS_KEY_VERSION = 1
+RNS_KEY_HEADER = struct.Struct("<4sBBIB")
+
+# RNS ciphertext frame, for binary mode and server-side storage: magic, version, ndim, then
+# ndim uint32 dimensions of the (L, l, n+1) limb stack and its residues as little-endian uint32
+RNS_FRAME_MAGIC = b"GSWM"
+RNS_FRAME_VERSION = 1
+RNS_FRAME_HEADER = struct.Struct("<4sBB")
+
+_limb_pool = None
+_limb_pool_lock = threading.Lock()
+
+# fn(k) for every limb k, spread over RNS_WORKERS threads (the matmul kernels release the GIL).
+# The pool is created under a lock, since every executor thread may run a Mult at once
+def _map_limbs(fn, count):
+    global _limb_pool
+    if RNS_WORKERS <= 1 or count == 1:
+        return [fn(k) for k in range(count)]
+
+    if _limb_pool is None:
+        with _limb_pool_lock:
+            if _limb_pool is None:
+                _limb_pool = ThreadPoolExecutor(RNS_WORKERS, thread_name_prefix="gsw-rns")
+    return list(_limb_pool.map(fn, range(count)))
+
+# The fewest of the largest primes below 2^limb_bits whose product is at least q
+def rns_primes(q, limb_bits=RNS_LIMB_BITS):
+    if not 2 <= limb_bits <= RNS_MAX_LIMB_BITS:
+        raise ValueError(f"Limb primes must have 2 to {RNS_MAX_LIMB_BITS} bits, got {limb_bits}")
+
+    primes, Q = [], 1
+    p = 2**limb_bits - 1
+    while Q < q:
+        if p < 3:
+            raise ValueError(f"Not enough {limb_bits}-bit primes for q={q}")
+        if is_prime(p):
+            primes.append(p)
+            Q *= p
+        p -= 2
+
+    return tuple(primes)
+
+# Residue number system over pairwise distinct primes p_k with product Q: an integer mod Q
+# is held as its residues mod each p_k, on a trailing limb axis here, and recovered by CRT
+# as sum_k [r_k (Q/p_k)^-1]_{p_k} (Q/p_k) mod Q
+class RNSBasis:
+    def __init__(self, primes):
+        primes = tuple(int(p) for p in primes)
+        if not primes or len(set(primes)) != len(primes) or not all(is_prime(p) for p in primes):
+            raise ValueError("RNS limbs need distinct primes")
+        if max(primes) >= 2**RNS_MAX_LIMB_BITS:
+            raise ValueError(f"RNS limb primes must be below 2^{RNS_MAX_LIMB_BITS}")
+
+        self.primes = primes
+        self.Q = int(np.prod(np.array(primes, dtype=object)))
+        self.Q_hat = [self.Q // p for p in primes]
+        self.Q_hat_inv = [pow(Q_hat % p, -1, p) for Q_hat, p in zip(self.Q_hat, primes)]
+        self.moduli = np.array(primes, dtype=np.int64)
+
+    def to_rns(self, X):
+        X = np.asarray(X, dtype=object)
+
+        return np.stack([(X % p).astype(np.int64) for p in self.primes], axis=-1)
+
+    # Residues of shape (..., L) -> integers in [0, Q), as an object array
+    def reconstruct(self, R):
+        R = np.asarray(R, dtype=np.int64)
+        X = 0
+        for k, p in enumerate(self.primes):
+            X = X + (R[..., k] * self.Q_hat_inv[k] % p).astype(object) * self.Q_hat[k]
+
+        return np.asarray(X % self.Q, dtype=object)
+
+# GSW over a modulus q far past int64, held in RNS: every ciphertext is a stack of L
+# (l, n+1) matrices, one per limb prime, stored as (L, l, n+1) (with any leading batch
+# axes). Add, Not and Mult run limb by limb in int64 and never leave the residues; only
+# decryption and the JSON form of a ciphertext (head) reconstruct integers mod q by CRT.
+#
+# G^-1 needs the digits of whole integers, which residues do not give, so the gadget is the
+# RNS gadget: row (column c, limb i, digit j) of G holds B^j (q/p_i) [(q/p_i)^-1]_{p_i}
+# mod q in column c, which is B^j in limb i and 0 in every other limb. G^-1(C) is then just
+# the base-B digits of every residue, l = (n+1) L d with d digits per limb, and
+# G^-1(C1) C2 is L independent products G^-1(C1) C2[k] mod p_k.
+#
+# As in rgsw.RGSW, the message sits unscaled in G (q / 2 has no RNS form to round by), so
+# Mult is the plain G^-1(C1) C2 with additive noise growth, and decryption reads the row
+# whose gadget entry lies farthest from 0 mod q. Messages are bits; Add adds them in Z.
+class RNSGSW:
+    # q is a lower bound: the modulus is the product of the limb primes, rns_primes(q)
+    # unless `primes` is given, and is at least q
+    def __init__(self, n, q, seed=None, log_base=1, s=None, primes=None, limb_bits=RNS_LIMB_BITS):
+        self.basis = RNSBasis(rns_primes(q, limb_bits) if primes is None else primes)
+        self.primes = self.basis.primes
+        self.n = n
+        self.q = self.basis.Q
+        self.logq = (self.q - 1).bit_length()
+        self.L = len(self.primes)
+        self.log_base = log_base
+        # Digits per limb, enough for the largest prime
+        self.d = -(-max(p.bit_length() for p in self.primes) // log_base)
+        self.l = (n + 1) * self.L * self.d
+        self.moduli = self.basis.moduli[:, None, None]
+        self.storage_dtype = ModularArithmetic.dtype_for(max(self.primes))
+        self.limbs = [ModularArithmetic(p, DEFAULT_MATMUL_ENGINE) for p in self.primes]
+        self.rng = np.random.default_rng(seed)
+
+        # Decryption row: among the column-0 rows, the gadget entry farthest from 0 mod q,
+        # decoded correctly while |error| < half that distance (at least q / 8)
+        gadget = [(2**(log_base * j) * Q_hat * Q_hat_inv) % self.q
+                  for Q_hat, Q_hat_inv in zip(self.basis.Q_hat, self.basis.Q_hat_inv) for j in range(self.d)]
+        distance = [min(g, self.q - g) for g in gadget]
+        self.dec_row = int(np.argmax(np.array(distance, dtype=object)))
+        self.dec_gadget = gadget[self.dec_row]
+        self.noise_threshold = distance[self.dec_row] // 2
+        self.fresh_noise_bound = 1
+
+        self.s = self.generate_s() if s is None else np.asarray(s, dtype=np.int32).reshape(n+1, 1)
+
+    @staticmethod
+    def ciphertext_bytes(n, q, log_base=1, limb_bits=RNS_LIMB_BITS):
+        L = len(rns_primes(q, limb_bits))
+        d = -(-limb_bits // log_base)
+
+        return L * (n + 1) * L * d * (n + 1) * np.dtype(np.uint32).itemsize
+
+    @property
+    def nbytes(self):
+        return self.s.nbytes
+
+    def generate_s(self):
+        s = np.ones((self.n+1, 1), dtype=np.int32)
+        s[1:] = uniform_sample_matrix(self.rng, 2, (self.n, 1))
+
+        return s
+
+    def get_error(self, rng=None):
+        return uniform_sample_matrix(self.rng if rng is None else rng, 2, (self.l, 1), dtype=np.int64)
+
+    # The RNS gadget as an (L, l, n+1) stack: B^j at (column c, limb k, digit j) of limb k only
+    @cached_property
+    def G(self):
+        G = np.zeros((self.L, self.l, self.n+1), dtype=self.storage_dtype)
+        cols = np.repeat(np.arange(self.n+1), self.d)
+        for k, p in enumerate(self.primes):
+            rows = (np.arange(self.n+1)[:, None] * (self.L * self.d) + k * self.d + np.arange(self.d)).ravel()
+            G[k, rows, cols] = np.tile([pow(2**self.log_base, j, p) for j in range(self.d)], self.n+1)
+
+        return G
+
+    # m G in int64, for an integer m (or one per leading batch axis)
+    def gadget_multiple(self, m):
+        m = np.asarray(m, dtype=object)[..., None, None, None] % self.moduli
+
+        return self.G.astype(np.int64) * m.astype(np.int64) % self.moduli
+
+    # Base-B digits of every residue, ordered like the rows of G: M of shape (..., L, rows, n+1)
+    # gives (..., rows, l), with G^-1(M) G[k] = M[k] mod p_k in every limb
+    @timed("rns.G_inverse")
+    def generate_G_inverse(self, M):
+        shifts = (self.log_base * np.arange(self.d)).astype(M.dtype)
+        digits = (M[..., None] >> shifts) & M.dtype.type(2**self.log_base - 1)
+        digits = np.moveaxis(digits, -4, -2).astype(np.uint8 if self.log_base <= 8 else M.dtype)
+
+        return digits.reshape(M.shape[:-3] + (M.shape[-2], self.l))
+
+    @timed("rns.Enc")
+    def Enc(self, msg):
+        return self.Enc_online(msg, self.Enc_offline())
+
+    # An encryption of zero, (e - A s_ | A) in every limb for one shared binary e; the
+    # material is (Z, None), shaped like GSW.Enc_offline's (b, seed), for EncryptionPool
+    @timed("rns.Enc_offline")
+    def Enc_offline(self, rng=None):
+        rng = self.rng if rng is None else rng
+        e = self.get_error(rng)
+        A = rng.integers(0, self.moduli, size=(self.L, self.l, self.n), dtype=np.int64)
+        b = (e - A @ self.s[1:].astype(np.int64)) % self.moduli
+
+        return np.concatenate((b, A), axis=-1).astype(self.storage_dtype), None
+
+    def Enc_online(self, msg, material):
+        Z, _ = material
+        C = (Z + self.gadget_multiple(msg)) % self.moduli
+
+        return RNSGSW_Ciphertext(self, C.astype(self.storage_dtype), self.fresh_noise_bound)
+
+    # (C s)[row] mod q, reconstructed from the limbs' residues
+    def phase(self, C, s=None, row=None):
+        s = self.s if s is None else np.asarray(s)
+        row = self.dec_row if row is None else row
+        R = C[..., :, row, :].astype(np.int64) @ s.astype(np.int64).reshape(-1, 1)
+
+        return self.basis.reconstruct(R[..., 0] % self.basis.moduli)
+
+    # Nearest of 0 and the decryption row's gadget entry, circularly mod q
+    def decode(self, phase):
+        x, g = np.asarray(phase, dtype=object), self.dec_gadget
+        to_zero = np.minimum(x, self.q - x)
+        to_g = np.minimum((x - g) % self.q, (g - x) % self.q)
+
+        return np.asarray(to_g < to_zero).astype(np.int32)
+
+    def Dec_with_key(self, ctxt, s):
+        return self.decode(self.phase(ctxt.C, s))
+
+    @timed("rns.Dec")
+    def Dec(self, ctxt):
+        return self.Dec_with_key(ctxt, self.s)
+
+    # |C[row] s - ptxt (G s)[row]|, centered mod q
+    def row_error(self, C, ptxt, row=None):
+        row = self.dec_row if row is None else row
+        s = self.s.astype(np.int64)
+        codes = np.asarray(ptxt, dtype=object)[..., None] % self.basis.moduli
+        expected = codes.astype(np.int64) * (self.G[:, row, :].astype(np.int64) @ s)[:, 0] % self.basis.moduli
+        R = (C[..., :, row, :].astype(np.int64) @ s)[..., 0] - expected
+        error = self.basis.reconstruct(R % self.basis.moduli)
+
+        return np.minimum(error, self.q - error)
+
+    # Worst-case |error| bounds: Add sums them; Mult leaves m2 e1 + G^-1(C1) e2, where each
+    # row of G^-1(C1) has l digits below B
+    def add_noise_bound(self, b1, b2):
+        if b1 is None or b2 is None:
+            return None
+
+        return min(b1 + b2, self.q)
+
+    def mult_noise_bound(self, b1, b2):
+        if b1 is None or b2 is None:
+            return None
+
+        return min(b1 + self.l * (2**self.log_base - 1) * b2, self.q)
+
+    def noise_budget(self, bound):
+        if bound is None:
+            return None
+
+        return max(self.noise_threshold - bound, 0)
+
+    def add(self, c1, c2):
+        C = (c1.C.astype(np.int64) + c2.C) % self.moduli
+
+        return RNSGSW_Ciphertext(self, C.astype(self.storage_dtype), self.add_noise_bound(c1.noise_bound, c2.noise_bound))
+
+    # G^-1(C1) C2[k] mod p_k for every limb k, in parallel. Like GSW.mult, base-2 digits
+    # the engine declines go through the packed kernel; the workspace is accepted for
+    # evaluate_circuit and not used, since limbs run on separate threads.
+    @timed("rns.mult")
+    def mult(self, c1, c2, workspace=None):
+        D = self.generate_G_inverse(c1.C)
+        digit_bound = 2**self.log_base - 1
+        dot_bound = self.l * digit_bound * (max(self.primes) - 1)
+        packed = self.log_base == 1 and not self.limbs[0].engine_accepts(D.size, dot_bound)
+        P = pack_bits(D) if packed else None
+
+        def limb(k):
+            arith, C2 = self.limbs[k], c2.C[..., k, :, :]
+            if packed:
+                return arith.packed_matmul(P, C2, arith.q - 1)
+            return arith.matmul(D, C2, digit_bound, arith.q - 1)
+
+        C = np.stack(_map_limbs(limb, self.L), axis=-3).astype(self.storage_dtype)
+
+        return RNSGSW_Ciphertext(self, C, self.mult_noise_bound(c1.noise_bound, c2.noise_bound))
+
+    # Batches are RNSGSW_Ciphertext stacks with leading axes, so evaluate_circuit uses one type
+    @property
+    def ciphertext_type(self):
+        return RNSGSW_Ciphertext
+
+    batch_type = ciphertext_type
+
+class RNSGSW_Ciphertext:
+    def __init__(self, gsw, C, noise_bound=None):
+        self.gsw = gsw
+        self.C = C
+        self.noise_bound = noise_bound
+
+    @property
+    def nbytes(self):
+        return self.C.nbytes
+
+    # The first rows as integers mod q, shape (..., rows, n+1): the form ciphertexts take in JSON
+    def head(self, rows=None):
+        return self.gsw.basis.reconstruct(np.moveaxis(self.C[..., :rows, :], -3, -1))
+
+    @classmethod
+    def from_matrix(cls, gsw, M, noise_bound=None):
+        M = np.asarray(M, dtype=object)
+        if M.shape[-2:] != (gsw.l, gsw.n+1):
+            raise ValueError(f"Expected a ({gsw.l}, {gsw.n+1}) ciphertext, got shape {M.shape}")
+
+        return cls(gsw, np.moveaxis(gsw.basis.to_rns(M), -1, -3).astype(gsw.storage_dtype), noise_bound)
+
+    # The limb stack as an RNS frame (rns_ciphertext_to_bytes); GSW's wire frames carry a
+    # single 64-bit modulus. The residues are stored raw, so there is nothing to compress
+    def to_bytes(self, compression=None):
+        if compression is not None:
+            raise ValueError("RNS ciphertext frames are not compressed")
+
+        return rns_ciphertext_to_bytes(self)
+
+    @classmethod
+    def from_bytes(cls, gsw, data):
+        return rns_ciphertext_from_bytes(gsw, data)
+
+    def get_error(self, ptxt, row=None):
+        return self.gsw.row_error(self.C, ptxt, row)
+
+    def max_valid_error(self):
+        return self.gsw.noise_threshold
+
+    def is_error_valid(self, ptxt):
+        return self.get_error(ptxt) < self.max_valid_error()
+
+    def noise_budget(self):
+        return self.gsw.noise_budget(self.noise_bound)
+
+    def Dec_with_key(self, s):
+        return self.gsw.Dec_with_key(self, s)
+
+    # Add/Mult replace self.C and return self, like GSW_Ciphertext; add/mult (and +, *) do not
+    def Add(self, other):
+        result = self.gsw.add(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    def Mult(self, other):
+        result = self.gsw.mult(self, other)
+        self.C, self.noise_bound = result.C, result.noise_bound
+
+        return self
+
+    def add(self, other):
+        return self.gsw.add(self, other)
+
+    def mult(self, other, workspace=None):
+        return self.gsw.mult(self, other, workspace)
+
+    def __add__(self, other):
+        return self.add(other)
+
+    def __mul__(self, other):
+        return self.mult(other)
+
+    # G - C encrypts 1 - m, with the error negated
+    def Not(self):
+        self.C = ((self.gsw.G.astype(np.int64) - self.C) % self.gsw.moduli).astype(self.gsw.storage_dtype)
+
+        return self
+
+def rns_key_to_bytes(gsw):
+    header = RNS_KEY_HEADER.pack(RNS_KEY_MAGIC, RNS_KEY_VERSION, gsw.log_base, gsw.n, gsw.L)
+    primes = np.array(gsw.primes, dtype="<u4").tobytes()
+
+    return header + primes + pack_bits(gsw.s[1:, 0]).tobytes()
+
+def rns_key_from_bytes(data, seed=None):
+    data = memoryview(data)
+    if len(data) < RNS_KEY_HEADER.size:
+        raise ValueError("Truncated key header")
+
+    magic, version, log_base, n, L = RNS_KEY_HEADER.unpack_from(data)
+    if magic != RNS_KEY_MAGIC or version != RNS_KEY_VERSION:
+        raise ValueError("Not an RNS GSW key or unsupported format version")
+    offset = RNS_KEY_HEADER.size + 4 * L
+    if len(data) - offset < -(-n // 8):
+        raise ValueError("Truncated key payload")
+
+    primes = np.frombuffer(data[RNS_KEY_HEADER.size:offset], dtype="<u4").tolist()
+    s = np.ones((n+1, 1), dtype=np.int32)
+    s[1:, 0] = unpack_bits(np.frombuffer(data[offset:], dtype=np.uint8), n)
+
+    return RNSGSW(n, 0, seed=seed, log_base=log_base, s=s, primes=primes)
+
+def rns_ciphertext_to_bytes(ctxt):
+    C = np.ascontiguousarray(ctxt.C, dtype="<u4")
+    header = RNS_FRAME_HEADER.pack(RNS_FRAME_MAGIC, RNS_FRAME_VERSION, C.ndim)
+
+    return header + struct.pack(f"<{C.ndim}I", *C.shape) + C.tobytes()
+
+# Size in bytes of the RNS ciphertext or key frame starting at `offset`, read from its header
+def rns_frame_size(data, offset=0):
+    data = memoryview(data)
+    magic = bytes(data[offset:offset + 4])
+    if magic == RNS_KEY_MAGIC:
+        if len(data) - offset < RNS_KEY_HEADER.size:
+            raise ValueError("Truncated key header")
+        _, _, _, n, L = RNS_KEY_HEADER.unpack_from(data, offset)
+        return RNS_KEY_HEADER.size + 4 * L + -(-n // 8)
+    if magic != RNS_FRAME_MAGIC:
+        raise ValueError("Not an RNS ciphertext or key frame")
+
+    if len(data) - offset < RNS_FRAME_HEADER.size:
+        raise ValueError("Truncated ciphertext header")
+    ndim = RNS_FRAME_HEADER.unpack_from(data, offset)[2]
+    if len(data) - offset < RNS_FRAME_HEADER.size + 4 * ndim:
+        raise ValueError("Truncated ciphertext header")
+    shape = struct.unpack_from(f"<{ndim}I", data, offset + RNS_FRAME_HEADER.size)
+
+    return RNS_FRAME_HEADER.size + 4 * ndim + 4 * math.prod(shape)
+
+def _any_frame_size(data, offset):
+    if bytes(data[offset:offset + 4]) in (RNS_FRAME_MAGIC, RNS_KEY_MAGIC):
+        return rns_frame_size(data, offset)
+
+    return frame_size(data, offset)
+
+# Splits back-to-back frames of either format: GSW wire frames and RNS ciphertexts and keys
+def split_any_frames(data):
+    return split_frames(data, _any_frame_size)
+
+# A single ciphertext of this key: shape (L, l, n+1), every residue below its limb prime
+def rns_ciphertext_from_bytes(gsw, data, noise_bound=None):
+    data = memoryview(data)
+    if len(data) < RNS_FRAME_HEADER.size:
+        raise ValueError("Truncated ciphertext header")
+
+    magic, version, ndim = RNS_FRAME_HEADER.unpack_from(data)
+    if magic != RNS_FRAME_MAGIC or version != RNS_FRAME_VERSION:
+        raise ValueError("Not an RNS ciphertext frame or unsupported format version")
+    if len(data) < RNS_FRAME_HEADER.size + 4 * ndim:
+        raise ValueError("Truncated ciphertext header")
+    shape = struct.unpack_from(f"<{ndim}I", data, RNS_FRAME_HEADER.size)
+    if shape != (gsw.L, gsw.l, gsw.n+1):
+        raise ValueError(f"Frame of shape {shape} does not match this key's ({gsw.L}, {gsw.l}, {gsw.n+1}) ciphertexts")
+    offset = RNS_FRAME_HEADER.size + 4 * ndim
+    count = math.prod(shape)
+    if len(data) - offset < 4 * count:
+        raise ValueError("Truncated ciphertext payload")
+
+    C = np.frombuffer(data[offset:], dtype="<u4", count=count).reshape(shape)
+    if (C >= gsw.moduli).any():
+        raise ValueError("Frame residues must lie below their limb primes")
+
+    return RNSGSW_Ciphertext(gsw, C.astype(gsw.storage_dtype), noise_bound)
@@ -1,9 +1,19 @@
-from utils import uniform_sample, is_two_array_same_in_modq, decompose
-from gsw import GSW
+from utils import uniform_sample, is_two_array_same_in_modq, decompose, unpack_bits
+from rgsw import RGSW, negacyclic_mul, ntt_prime, ntt_tables
+from rns import RNSBasis, RNSGSW, RNSGSW_Ciphertext, rns_key_from_bytes, rns_key_to_bytes, split_any_frames
+from gsw import GSW, GSW_Ciphertext, GSW_Ciphertext_Batch, ModularArithmetic, WIRE_HEADER, Workspace, evaluate_circuit, key_from_bytes, key_to_bytes
 
 import numpy as np
+import os
+import struct
+import sys
+import zlib
+import metrics
 from collections import Counter
 
+# The service tests import the backend's app package (they need its requirements installed)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
 n = 32
 logq = 8
 q = 2**logq
@@ -54,6 +64,60 @@ def G_inverse_test():
     else:
         print("Test failed with broken:", broken)
 
+def G_inverse_matches_decompose_test():
+    print(f"=== G_inverse_matches_decompose_test ===")
+    broken = 0
+    for _ in range(test_num):
+        gsw = GSW(n, q)
+        M = np.random.randint(0, q, (4, gsw.n+1))
+        expected = np.array([[decompose(M[i][j // logq], logq)[j % logq] for j in range(gsw.l)] for i in range(M.shape[0])])
+        G_inv_M = gsw.generate_G_inverse(M)
+
+        if G_inv_M.dtype != np.uint8 or not np.array_equal(G_inv_M, expected):
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+def G_inverse_base_test():
+    print(f"=== G_inverse_base_test ===")
+    broken = 0
+    for log_base in [2, 3, 4, logq]:
+        for _ in range(test_num // 4):
+            gsw = GSW(n, q, log_base=log_base)
+            M = np.random.randint(0, q, (gsw.l, gsw.n+1))
+            G_inv_M = gsw.generate_G_inverse(M)
+            msg = uniform_sample([0, 1])
+
+            if G_inv_M.max() >= 2**log_base or not is_two_array_same_in_modq(G_inv_M @ gsw.G, M, q):
+                broken += 1
+            elif msg != gsw.Dec(gsw.Enc(msg)):
+                broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+def Gadget_operator_test():
+    print(f"=== Gadget_operator_test ===")
+    broken = 0
+    for log_base in [1, 3]:
+        for _ in range(test_num // 2):
+            gsw = GSW(n, q, log_base=log_base)
+            G = gsw.G.astype(np.int64)
+            x = np.random.randint(0, q, (gsw.n+1, 3))
+
+            if not np.array_equal(gsw.gadget_apply(x), G @ x):
+                broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
 def GSW_Ciphertext_Error_test():
     print(f"=== GSW_Ciphertext_Error_test ===")
     broken = 0
@@ -70,6 +134,24 @@ def GSW_Ciphertext_Error_test():
     else:
         print("Test failed with broken:", broken)
 
+def GSW_row_error_test():
+    print(f"=== GSW_row_error_test ===")
+    broken = 0
+    for _ in range(test_num):
+        gsw = GSW(n, q)
+        msg = uniform_sample([0, 1])
+        ctxt = gsw.Enc(msg)
+        full = ((ctxt.C.astype(np.int64) @ gsw.s) - gsw.encode(msg) * (gsw.G @ gsw.s)) % q
+        row = np.random.randint(gsw.l)
+
+        if ctxt.get_error(msg, row) != full[row][0]:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
 def GSW_Ciphertext_Add_test():
     print(f"=== GSW_Ciphertext_Add_test ===")
     broken = 0
@@ -164,14 +246,724 @@ def GSW_Ciphertext_Error_On_Single_Mult_test():
         print("Test failed with broken:", broken)
   
 
+def GSW_seed_reproducibility_test():
+    print(f"=== GSW_seed_reproducibility_test ===")
+    broken = 0
+    for seed in range(test_num):
+        gsw1 = GSW(n, q, seed=seed)
+        gsw2 = GSW(n, q, seed=seed)
+        msg = uniform_sample([0, 1])
+
+        if not np.array_equal(gsw1.s, gsw2.s):
+            broken += 1
+        elif not np.array_equal(gsw1.Enc(msg).C, gsw2.Enc(msg).C):
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def GSW_key_serialization_test():
+    print(f"=== GSW_key_serialization_test ===")
+    broken = 0
+    for _ in range(test_num):
+        gsw = GSW(n, q)
+        data = key_to_bytes(gsw)
+        restored = key_from_bytes(data)
+        msg = uniform_sample([0, 1])[0]
+
+        if len(data) > 32 + n // 8 or not np.array_equal(restored.s, gsw.s):
+            broken += 1
+        elif restored.Dec(gsw.Enc(msg)) != msg:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def GSW_key_cache_test():
+    print(f"=== GSW_key_cache_test ===")
+    broken = 0
+    for _ in range(test_num):
+        gsw = GSW(n, q)
+        if gsw.G is not GSW(n, q).G or not np.array_equal(gsw.Gs, gsw.G @ gsw.s):
+            broken += 1
+
+        gsw.regenerate_key()
+        msg = uniform_sample([0, 1])
+        if not np.array_equal(gsw.Gs, gsw.G @ gsw.s) or not np.array_equal(gsw.s_, gsw.s[1:]):
+            broken += 1
+        elif msg != gsw.Dec(gsw.Enc(msg)):
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+def Modular_arithmetic_test():
+    print(f"=== Modular_arithmetic_test ===")
+    broken = 0
+    rng = np.random.default_rng(0)
+    for _ in range(test_num):
+        # Cover the int32, int64, chunked int64 and object accumulator paths
+        mod_q = int(rng.choice([2**8, 2**15, 2**28, 2**31, 2**40, 2**62, 1000003]))
+        modulus = int(rng.choice([mod_q, (mod_q // 2) * mod_q]))
+        arith = ModularArithmetic(mod_q)
+        rows, K, cols = rng.integers(1, 8), rng.integers(1, 300), rng.integers(1, 8)
+        A = np.array([[int(rng.integers(0, mod_q)) for _ in range(K)] for _ in range(rows)], dtype=object)
+        B = np.array([[int(rng.integers(0, mod_q)) for _ in range(cols)] for _ in range(K)], dtype=object)
+
+        expected = [[sum(A[i][k] * B[k][j] for k in range(K)) % modulus for j in range(cols)] for i in range(rows)]
+        result = arith.matmul(A.astype(arith.storage_dtype), B.astype(arith.storage_dtype), mod_q - 1, mod_q - 1, modulus=modulus)
+        if result.tolist() != expected:
+            broken += 1
+
+        expected_add = [[(A[i][k] + A[i][k]) % mod_q for k in range(K)] for i in range(rows)]
+        if arith.add(A.astype(arith.storage_dtype), A.astype(arith.storage_dtype)).tolist() != expected_add:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def GSW_Ciphertext_Batch_test():
+    print(f"=== GSW_Ciphertext_Batch_test ===")
+    broken = 0
+    k = 8
+    for seed in range(test_num // 8):
+        msgs1 = [int(m) for m in np.random.randint(0, 2, k)]
+        msgs2 = [int(m) for m in np.random.randint(0, 2, k)]
+
+        gsw = GSW(n, q, seed=seed)
+        ctxts1 = [gsw.Enc(m) for m in msgs1]
+        ctxts2 = [gsw.Enc(m) for m in msgs2]
+
+        gsw_batch = GSW(n, q, seed=seed)
+        batch1 = gsw_batch.Enc_batch(msgs1)
+        batch2 = gsw_batch.Enc_batch(msgs2)
+
+        if not np.array_equal(batch1.C, np.stack([c.C for c in ctxts1])):
+            broken += 1
+        if list(gsw_batch.Dec_batch(batch1)) != [gsw.Dec(c) for c in ctxts1]:
+            broken += 1
+        if list(batch1.get_error(msgs1)) != [c.get_error(m) for c, m in zip(ctxts1, msgs1)]:
+            broken += 1
+
+        added = GSW_Ciphertext_Batch.from_ciphertexts(ctxts1).Add(batch2)
+        multiplied = GSW_Ciphertext_Batch.from_ciphertexts(ctxts1).Mult(batch2)
+        for i in range(k):
+            scalar = gsw.Enc(0)
+            scalar.C = ctxts1[i].C
+            if not np.array_equal(added[i].C, scalar.Add(ctxts2[i]).C):
+                broken += 1
+            scalar.C = ctxts1[i].C
+            if not np.array_equal(multiplied[i].C, scalar.Mult(ctxts2[i]).C):
+                broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def GSW_Ciphertext_serialization_test():
+    print(f"=== GSW_Ciphertext_serialization_test ===")
+    broken = 0
+    for mod_q in [q, 2**15, 2**16]:
+        for compression in [None, "zlib"]:
+            for _ in range(test_num // 8):
+                gsw = GSW(n, mod_q)
+                msg = uniform_sample([0, 1])
+                ctxt = gsw.Enc(msg)
+                data = ctxt.to_bytes(compression)
+                decoded = GSW_Ciphertext.from_bytes(gsw, data)
+
+                if not np.array_equal(decoded.C, ctxt.C) or msg != gsw.Dec(decoded):
+                    broken += 1
+
+                batch = gsw.Enc_batch([0, 1, 1])
+                if not np.array_equal(GSW_Ciphertext_Batch.from_bytes(gsw, batch.to_bytes(compression)).C, batch.C):
+                    broken += 1
+
+                try:
+                    GSW_Ciphertext.from_bytes(GSW(n + 1, mod_q), data)
+                    broken += 1
+                except ValueError:
+                    pass
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Seeded_ciphertext_test():
+    print(f"=== Seeded_ciphertext_test ===")
+    broken = 0
+    for _ in range(test_num // 8):
+        gsw = GSW(n, 2**15)
+        msg = uniform_sample([0, 1])[0]
+        ctxt = gsw.Enc(msg)
+        data = ctxt.to_bytes()
+
+        # Only column 0 and the seed are held and shipped until the matrix is needed
+        if not ctxt.seeded or ctxt.nbytes > 2 * gsw.l * 2 + 16 or len(data) * n > len(GSW_Ciphertext(gsw, ctxt.C).to_bytes()) * 2:
+            broken += 1
+        decoded = GSW_Ciphertext.from_bytes(gsw, data)
+        if not decoded.seeded or decoded._C is not None or msg != gsw.Dec(decoded) or decoded._C is not None:
+            broken += 1
+        if not np.array_equal(decoded.C, ctxt.C) or not np.array_equal(ctxt.C[:, 1:], gsw.uniform_part(ctxt.seed)):
+            broken += 1
+
+        # Operations see the expanded matrix; writing into a seeded `out` drops its seed
+        other = gsw.Enc(1)
+        if not np.array_equal((ctxt * other).C, (GSW_Ciphertext(gsw, ctxt.C) * GSW_Ciphertext(gsw, other.C)).C):
+            broken += 1
+        out = gsw.Enc(0)
+        ctxt.add(other, out=out)
+        if out.seeded or not np.array_equal(GSW_Ciphertext.from_bytes(gsw, out.to_bytes()).C, (ctxt + other).C):
+            broken += 1
+
+        # Batches stay compressed through bytes and indexing
+        batch = gsw.Enc_batch([0, 1, 1])
+        decoded = GSW_Ciphertext_Batch.from_bytes(gsw, batch.to_bytes("zlib"))
+        if not decoded.seeded or not np.array_equal(decoded.C, batch.C) or list(gsw.Dec_batch(decoded)) != [0, 1, 1]:
+            broken += 1
+        if not batch[1].seeded or not GSW_Ciphertext_Batch.from_ciphertexts(batch.to_ciphertexts()).seeded:
+            broken += 1
+
+    # Version 1 frames, without the flags byte, are still read
+    gsw = GSW(n, q)
+    ctxt = GSW_Ciphertext(gsw, gsw.Enc(1).C)
+    data = ctxt.to_bytes()
+    v1 = bytes(data[:4]) + b"\x01" + bytes(data[5:WIRE_HEADER.size - 1]) + bytes(data[WIRE_HEADER.size:])
+    if not np.array_equal(GSW_Ciphertext.from_bytes(gsw, v1).C, ctxt.C):
+        broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Malformed_frame_test():
+    print(f"=== Malformed_frame_test ===")
+    broken = 0
+    gsw = GSW(n, 2**15)
+    data = GSW_Ciphertext(gsw, gsw.Enc(1).C).to_bytes()
+    seeded = gsw.Enc(1).to_bytes("zlib")
+    header = bytearray(data[:WIRE_HEADER.size])
+
+    def frame(shape, payload, compression=1, flags=1, bits=None, dtype_char=None):
+        fields = list(WIRE_HEADER.unpack_from(header))
+        fields[2], fields[9], fields[10] = compression, len(shape), flags
+        fields[3] = fields[3] if bits is None else bits
+        fields[5] = fields[5] if dtype_char is None else dtype_char
+        fields[8] = len(payload)
+        return WIRE_HEADER.pack(*fields) + struct.pack(f"<{len(shape)}I", *shape) + payload
+
+    bad = [
+        # Truncated header, dimensions and payload
+        data[:WIRE_HEADER.size - 4], data[:WIRE_HEADER.size + 2], data[:-3], seeded[:-3],
+        # Wrong shapes: too few rows, and a batch where one ciphertext is expected
+        GSW_Ciphertext(gsw, gsw.Enc(1).C[:2]).to_bytes(),
+        gsw.Enc_batch([0, 1]).to_bytes(),
+        # A small zlib frame declaring millions of rows
+        frame((2_000_000, gsw.n + 1), zlib.compress(bytes(16 + 2_000_000 * 2))),
+        # The right shape, but a payload that inflates past it
+        frame((gsw.l, gsw.n + 1), zlib.compress(bytes(10**6))),
+        # Coefficients of another dtype or bit width
+        frame((gsw.l, gsw.n + 1), bytes(data[WIRE_HEADER.size + 8:]), compression=0, flags=0, dtype_char=b"d"),
+        frame((gsw.l, gsw.n + 1), bytes(data[WIRE_HEADER.size + 8:]), compression=0, flags=0, bits=16),
+    ]
+    for frame_bytes in bad:
+        try:
+            GSW_Ciphertext.from_bytes(gsw, frame_bytes)
+            broken += 1
+        except ValueError:
+            pass
+
+    # A batch frame still decodes as a batch, and a single ciphertext does not
+    try:
+        GSW_Ciphertext_Batch.from_bytes(gsw, data)
+        broken += 1
+    except ValueError:
+        pass
+    if list(gsw.Dec_batch(GSW_Ciphertext_Batch.from_bytes(gsw, gsw.Enc_batch([0, 1]).to_bytes("zlib")))) != [0, 1]:
+        broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+class _FakeRequest:
+    def __init__(self, session):
+        self.session = session
+
+
+def Service_upload_validation_test():
+    print(f"=== Service_upload_validation_test ===")
+    from app.services.executor import GSWExecutor
+    from app.services.gsw_service import GSWService
+    from app.services.session_backend import InMemorySessionBackend
+    from gsw import matrix_to_bytes
+
+    broken = 0
+    service = GSWService(executor=GSWExecutor(mode="inline"), backend=InMemorySessionBackend(3600))
+    request = _FakeRequest({})
+    s = np.array(service.initialize(4, 2**15, request)['s'])
+    gsw = service.sessions.get(request.session['session_id'])['gsw']
+    ctxt = gsw.Enc(1)
+    data = ctxt.to_bytes("zlib")
+    key = matrix_to_bytes(gsw, s.ravel())
+
+    if service.decrypt(data, key, request)['plaintext'] != 1 or service.decrypt(data, s.tolist(), request)['plaintext'] != 1:
+        broken += 1
+
+    bad_ciphertexts = [
+        data[:-3],
+        GSW_Ciphertext(gsw, ctxt.C[:2]).to_bytes(),
+        gsw.Enc_batch([0, 1]).to_bytes(),
+        ctxt.C[:2].tolist(),
+    ]
+    bad_keys = [key[:-1], matrix_to_bytes(gsw, s[:3]), matrix_to_bytes(gsw, s), matrix_to_bytes(gsw, 2 * s.ravel()), [[1], [0]]]
+    for bad in bad_ciphertexts:
+        for call in (lambda: service.decrypt(bad, key, request), lambda: service.operate("Mult", bad, data, request),
+                     lambda: service.get_ciphertext_error(bad, request),
+                     lambda: service.evaluate({"a": bad}, {}, [("b", "Not", ["a"])], request)):
+            try:
+                call()
+                broken += 1
+            except ValueError:
+                pass
+    for bad in bad_keys:
+        try:
+            service.decrypt(data, bad, request)
+            broken += 1
+        except ValueError:
+            pass
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Session_manager_test():
+    print(f"=== Session_manager_test ===")
+    from app.services.session_manager import SESSION_OVERHEAD_BYTES, SessionManager
+
+    broken = 0
+    gsw = GSW(n, q)
+    ctxt = gsw.Enc(1)
+    manager = SessionManager(max_bytes=3 * SESSION_OVERHEAD_BYTES + 2 * ctxt.nbytes, ttl=60, shards=4,
+                             store_max_bytes=4 * ctxt.nbytes)
+
+    def live_bytes():
+        return sum(SessionManager.measure(session) for shard in manager._shards for session in shard.values())
+
+    # Stored ciphertexts are charged to their session
+    a, b, c = manager.create(), manager.create(), manager.create()
+    a['ciphertexts'].put(ctxt)
+    a['ciphertexts'].put(ctxt)
+    if a['bytes'] != SESSION_OVERHEAD_BYTES + 2 * ctxt.nbytes or manager.bytes_used != live_bytes():
+        broken += 1
+
+    # Over budget, the least recently used session goes first: b, since a and c were used since
+    manager.get(a['id'])
+    manager.get(c['id'])
+    d = manager.create()
+    if manager.get(b['id']) is not None or manager.get(a['id']) is None or manager.counters['evictions'] != 1:
+        broken += 1
+
+    # Evicting a session drops its ciphertext store and releases the bytes charged for it
+    manager.get(c['id'])
+    manager.get(d['id'])
+    e = manager.create()
+    if manager.get(a['id']) is not None or manager.bytes_used != live_bytes() or len(manager) != 3:
+        broken += 1
+    if manager.bytes_used > manager.max_bytes:
+        broken += 1
+
+    # Idle sessions expire when next accessed, and their bytes are released
+    e['last_activity'] -= 61
+    before = manager.bytes_used
+    if manager.get(e['id']) is not None or manager.counters['expirations'] != 1 or \
+            manager.bytes_used != before - e['bytes'] or manager.get(c['id']) is None:
+        broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Session_backend_test():
+    print(f"=== Session_backend_test ===")
+    import tempfile
+    from app.services.session_backend import InMemorySessionBackend, SQLiteSessionBackend
+
+    broken = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.db")
+        for backend in (InMemorySessionBackend(60), SQLiteSessionBackend(path, 60)):
+            # Every save bumps the version, which is what tells other workers the key changed
+            if backend.save("s", b"key1") != 1 or backend.save("s", b"key2") != 2 or \
+                    backend.version("s") != 2 or backend.load("s") != (2, b"key2"):
+                broken += 1
+            if backend.load("other") is not None or backend.version("other") is not None:
+                broken += 1
+
+        # Only the shared backend keeps ciphertexts, evicting its oldest frames past the budget
+        backend = SQLiteSessionBackend(path, 60)
+        if not backend.shared or InMemorySessionBackend(60).shared:
+            broken += 1
+        for i in range(3):
+            backend.put_ciphertext("s", f"h{i}", bytes([i]) * 100, 1.5 * i, max_bytes=250)
+        if backend.get_ciphertext("s", "h0") is not None or backend.get_ciphertext("s", "h2") != (bytes([2]) * 100, 3.0):
+            broken += 1
+        if not backend.has_ciphertext("s", "h1") or not backend.delete_ciphertext("s", "h1") or \
+                backend.has_ciphertext("s", "h1") or backend.delete_ciphertext("s", "h1"):
+            broken += 1
+
+        # Another worker sees the frames; a new key drops them, since they belong to the old key
+        other = SQLiteSessionBackend(path, 60)
+        if other.get_ciphertext("s", "h2") is None:
+            broken += 1
+        other.save("s", b"key3")
+        if backend.get_ciphertext("s", "h2") is not None or backend.version("s") != 3:
+            broken += 1
+
+        # Expired sessions are swept together with their frames
+        backend.put_ciphertext("s", "h3", b"x", None, max_bytes=250)
+        expired = SQLiteSessionBackend(path, -1)
+        if expired.load("s") is not None or expired.cleanup() != 1 or backend.get_ciphertext("s", "h3") is not None:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Online_offline_encryption_test():
+    print(f"=== Online_offline_encryption_test ===")
+    broken = 0
+    rng = np.random.default_rng()
+    for _ in range(test_num // 4):
+        msg = uniform_sample([0, 1])[0]
+        seed = int(uniform_sample(range(2**16))[0])
+
+        # Enc is exactly its offline half followed by its online half
+        gsw1, gsw2 = GSW(n, q, seed=seed), GSW(n, q, seed=seed)
+        if not np.array_equal(gsw1.Enc(msg).C, gsw2.Enc_online(msg, gsw2.Enc_offline()).C):
+            broken += 1
+
+        # Material drawn from another generator encrypts under the same key
+        gsw = GSW(n, q)
+        ctxt = gsw.Enc_online(msg, gsw.Enc_offline(rng))
+        if msg != gsw.Dec(ctxt) or not ctxt.seeded or ctxt.get_error(msg) > gsw.fresh_noise_bound:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Circuit_evaluation_test():
+    print(f"=== Circuit_evaluation_test ===")
+    broken = 0
+    gates = [
+        ("x", "Add", ["a", "b", "c"]),
+        ("y", "Not", ["x"]),
+        ("z", "Mult", ["a", "b"]),
+        ("w", "Add", ["y", "z"]),
+    ]
+    for _ in range(test_num // 4):
+        gsw = GSW(n, q)
+        msgs = {name: int(uniform_sample([0, 1])[0]) for name in "abc"}
+        inputs = {name: gsw.Enc(msg) for name, msg in msgs.items()}
+        outputs = evaluate_circuit(gsw, inputs, gates, outputs=["x", "y", "w"])
+
+        # Same gates applied one at a time through the scalar API
+        x = GSW_Ciphertext(gsw, inputs["a"].C).Add(inputs["b"]).Add(inputs["c"])
+        y = GSW_Ciphertext(gsw, x.C).Not()
+        z = GSW_Ciphertext(gsw, inputs["a"].C).Mult(inputs["b"])
+        w = GSW_Ciphertext(gsw, y.C).Add(z)
+
+        if not all(np.array_equal(outputs[k].C, v.C) for k, v in [("x", x), ("y", y), ("w", w)]):
+            broken += 1
+        if gsw.Dec(outputs["x"]) != (msgs["a"] + msgs["b"] + msgs["c"]) % 2:
+            broken += 1
+        if gsw.Dec(outputs["y"]) != 1 - gsw.Dec(outputs["x"]):
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Noise_bound_test():
+    print(f"=== Noise_bound_test ===")
+    broken = 0
+    for _ in range(test_num // 4):
+        gsw = GSW(n, q)
+        msgs = [int(m) for m in uniform_sample([0, 1], 3)]
+        ctxts = [gsw.Enc(m) for m in msgs]
+
+        added = GSW_Ciphertext(gsw, ctxts[0].C, ctxts[0].noise_bound).Add(ctxts[1]).Add(ctxts[2])
+        multiplied = GSW_Ciphertext(gsw, ctxts[0].C, ctxts[0].noise_bound).Mult(ctxts[1])
+        checks = [(ctxt, m) for ctxt, m in zip(ctxts, msgs)] + [(added, sum(msgs)), (multiplied, msgs[0] * msgs[1])]
+        for ctxt, m in checks:
+            if ctxt.noise_bound is None or ctxt.get_error(m) > ctxt.noise_bound:
+                broken += 1
+
+        if added.noise_bound != 3 * gsw.fresh_noise_bound or added.noise_budget() <= 0:
+            broken += 1
+        if GSW_Ciphertext(gsw, added.C).noise_budget() is not None:
+            broken += 1
+
+        # The circuit evaluator plans the same bounds without touching the matrices
+        outputs = evaluate_circuit(gsw, dict(zip("abc", ctxts)), [("x", "Add", ["a", "b", "c"])])
+        if outputs["x"].noise_bound != added.noise_bound:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Functional_ops_test():
+    print(f"=== Functional_ops_test ===")
+    broken = 0
+    workspace = Workspace()
+    for _ in range(test_num // 4):
+        gsw = GSW(n, q)
+        a, b = gsw.Enc(uniform_sample([0, 1])[0]), gsw.Enc(uniform_sample([0, 1])[0])
+        a_C, b_C = a.C.copy(), b.C.copy()
+
+        added, multiplied = a + b, a * b
+        if not (np.array_equal(a.C, a_C) and np.array_equal(b.C, b_C)):
+            broken += 1
+
+        # out= writes into the caller's buffer, reusing the workspace across calls
+        out = GSW_Ciphertext(gsw, np.empty_like(a.C))
+        buffer = out.C
+        if a.mult(b, out=out, workspace=workspace) is not out or out.C is not buffer:
+            broken += 1
+        if not np.array_equal(out.C, multiplied.C):
+            broken += 1
+        if not np.array_equal(a.add(b, out=out).C, added.C) or out.C is not buffer:
+            broken += 1
+
+        # The mutating forms give the same matrices
+        if not np.array_equal(GSW_Ciphertext(gsw, a_C).Mult(b).C, multiplied.C):
+            broken += 1
+        if not np.array_equal(GSW_Ciphertext(gsw, a_C).Add(b).C, added.C):
+            broken += 1
+
+    # Integer rounding agrees with the float64 np.round it replaces, ties included
+    arith = ModularArithmetic(q)
+    X = np.concatenate([np.random.randint(0, (q // 2) * q, 10000), np.arange(0, (q // 2) * q, q // 4)])
+    if not np.array_equal(arith.round_div(X, q // 2), arith.reduce(np.round(X / (q // 2)).astype(np.int64))):
+        broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Metrics_render_test():
+    print(f"=== Metrics_render_test ===")
+    broken = 0
+    metrics.reset()
+    for seconds in [2e-5, 2e-5, 3.0, 20.0]:
+        metrics.observe("test.phase", seconds)
+
+    lines = metrics.render_prometheus({"test_gauge": 7}).splitlines()
+    expected = ['gsw_phase_seconds_bucket{phase="test.phase",le="5e-05"} 2',
+                'gsw_phase_seconds_bucket{phase="test.phase",le="5"} 3',
+                'gsw_phase_seconds_bucket{phase="test.phase",le="+Inf"} 4',
+                'gsw_phase_seconds_count{phase="test.phase"} 4',
+                'test_gauge 7']
+    for line in expected:
+        if line not in lines:
+            broken += 1
+    metrics.reset()
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def Packed_bits_test():
+    print(f"=== Packed_bits_test ===")
+    broken = 0
+    for _ in range(test_num // 4):
+        gsw = GSW(n, q)
+        a, b = gsw.Enc(uniform_sample([0, 1])[0]), gsw.Enc_batch(uniform_sample([0, 1], 3))
+        G_inv = gsw.generate_G_inverse(a.C)
+        packed = gsw.generate_G_inverse_packed(a.C)
+
+        if packed.nbytes * 8 < G_inv.size or not np.array_equal(unpack_bits(packed, gsw.l), G_inv):
+            broken += 1
+
+        # The packed kernel gives the dense product, for single and batched operands and a
+        # modulus past int64 as in Mult
+        for modulus in [q, (q // 2) * q, 2**70]:
+            expected = gsw.arith.matmul(G_inv, b.C, 1, q - 1, modulus=modulus).astype(object)
+            if not np.array_equal(gsw.arith.packed_matmul(packed, b.C, q - 1, modulus=modulus).astype(object), expected):
+                broken += 1
+
+    # Keys are stored as packed bits and restored unchanged
+    gsw = GSW(n, q)
+    if gsw.s_bits.nbytes != -(-n // 8) or not np.array_equal(GSW(n, q, s=gsw.s).s, gsw.s) or gsw.s[0, 0] != 1:
+        broken += 1
+    try:
+        gsw.s = np.full((n+1, 1), 2)
+        broken += 1
+    except ValueError:
+        pass
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def RGSW_test():
+    print(f"=== RGSW_test ===")
+    broken = 0
+    rgsw_q = ntt_prime(n, 2 * logq)
+    tables = ntt_tables(n, rgsw_q)
+    for _ in range(test_num // 4):
+        a, b = np.random.randint(0, rgsw_q, (2, n))
+
+        # The NTT round-trips and multiplies negacyclically, as the schoolbook product mod X^n + 1
+        expected = np.zeros(n, dtype=object)
+        for i in range(n):
+            for j in range(n):
+                sign = 1 if i + j < n else -1
+                expected[(i + j) % n] += sign * int(a[i]) * int(b[j])
+        if not np.array_equal(tables.intt(tables.ntt(a)), a) or \
+                not np.array_equal(negacyclic_mul(a, b, tables), expected % rgsw_q):
+            broken += 1
+
+        # Enc/Dec, Mult as AND, Add while the sum stays a bit, and Not
+        rgsw = RGSW(n, rgsw_q)
+        m1, m2 = (int(m) for m in uniform_sample([0, 1], 2))
+        c1, c2 = rgsw.Enc(m1), rgsw.Enc(m2)
+        product = c1 * c2
+        if rgsw.Dec(c1) != m1 or rgsw.Dec(product) != m1 * m2 or rgsw.Dec(c1.mult(c2).Not()) != 1 - m1 * m2:
+            broken += 1
+        if m1 + m2 <= 1 and rgsw.Dec(c1 + c2) != m1 + m2:
+            broken += 1
+        if c1.get_error(m1) > rgsw.fresh_noise_bound or product.get_error(m1 * m2) > product.noise_bound:
+            broken += 1
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
+def RNS_GSW_test():
+    print(f"=== RNS_GSW_test ===")
+    broken = 0
+    rns_n, rns_q = 8, 2**100
+    for _ in range(test_num // 16):
+        gsw = RNSGSW(rns_n, rns_q)
+        if gsw.q < rns_q or gsw.L != 4:
+            broken += 1
+
+        # CRT reconstructs integers far past int64 from their residues
+        basis = RNSBasis(gsw.primes)
+        X = np.random.randint(0, 2**62, (2, 3)).astype(object) * 2**60 + np.random.randint(0, 2**60, (2, 3))
+        if not np.array_equal(basis.reconstruct(basis.to_rns(X)), X % gsw.q):
+            broken += 1
+
+        # Enc/Dec, Mult as AND, Add while the sum stays a bit, and Not, within the noise bounds
+        m1, m2 = (int(m) for m in uniform_sample([0, 1], 2))
+        c1, c2 = gsw.Enc(m1), gsw.Enc(m2)
+        product = c1 * c2
+        if gsw.Dec(c1) != m1 or gsw.Dec(product) != m1 * m2 or gsw.Dec(c1.mult(c2).Not()) != 1 - m1 * m2:
+            broken += 1
+        if m1 + m2 <= 1 and gsw.Dec(c1 + c2) != m1 + m2:
+            broken += 1
+        if c1.get_error(m1) > gsw.fresh_noise_bound or product.get_error(m1 * m2) > product.noise_bound:
+            broken += 1
+
+        # The integer matrix mod q and the key round-trip
+        restored = rns_key_from_bytes(rns_key_to_bytes(gsw))
+        if not np.array_equal(RNSGSW_Ciphertext.from_matrix(gsw, product.head().tolist()).C, product.C) or \
+                restored.q != gsw.q or restored.Dec(product) != m1 * m2:
+            broken += 1
+
+        # Binary frames: back-to-back ciphertext and key frames split and decode; malformed ones are refused
+        data = product.to_bytes()
+        frame, key = split_any_frames(data + rns_key_to_bytes(gsw))
+        if gsw.Dec(RNSGSW_Ciphertext.from_bytes(gsw, frame)) != m1 * m2 or rns_key_from_bytes(key).primes != gsw.primes:
+            broken += 1
+        wrong_shape = RNSGSW_Ciphertext(gsw, product.C[:, :2]).to_bytes()
+        too_large = RNSGSW_Ciphertext(gsw, product.C.astype(np.int64) + gsw.moduli).to_bytes()
+        for bad in (data[:-4], data[:8], wrong_shape, too_large, GSW(rns_n, 2**15).Enc(1).to_bytes()):
+            try:
+                RNSGSW_Ciphertext.from_bytes(gsw, bad)
+                broken += 1
+            except ValueError:
+                pass
+
+    if broken == 0:
+        print("Test passed!")
+    else:
+        print("Test failed with broken:", broken)
+
+
 def run_tests():
     GSW_correction_test()
     G_inverse_test()
+    G_inverse_matches_decompose_test()
+    G_inverse_base_test()
+    Gadget_operator_test()
     GSW_Ciphertext_Error_test()
+    GSW_row_error_test()
     GSW_Ciphertext_Add_test()
     GSW_Ciphertext_Mult_test()
     GSW_Ciphertext_Error_On_Single_Add_test()
     GSW_Ciphertext_Error_On_Single_Mult_test()
+    GSW_seed_reproducibility_test()
+    GSW_key_cache_test()
+    GSW_key_serialization_test()
+    Modular_arithmetic_test()
+    GSW_Ciphertext_Batch_test()
+    GSW_Ciphertext_serialization_test()
+    Seeded_ciphertext_test()
+    Malformed_frame_test()
+    Service_upload_validation_test()
+    Session_manager_test()
+    Session_backend_test()
+    Online_offline_encryption_test()
+    Circuit_evaluation_test()
+    Noise_bound_test()
+    Functional_ops_test()
+    Metrics_render_test()
+    Packed_bits_test()
+    RGSW_test()
+    RNS_GSW_test()
 
 if __name__ == "__main__":
     run_tests()
@@ -3,9 +3,72 @@ import numpy as np
 def uniform_sample(space, n = 1):
     return np.random.choice(space, n)
 
+def uniform_sample_matrix(rng, high, shape, dtype=np.int32):
+    return rng.integers(0, high, size=shape, dtype=dtype)
+
 
 def is_two_array_same_in_modq(A, B, q):
     return np.array_equal(A % q, B % q)
 
 def decompose(n, logq):
     return [(n >> i) & 1 for i in range(logq)]
+
+# Base-2^log_base digits of every entry of M, least significant first, laid out
+# as M.shape[-1] groups of ceil(logq / log_base) digits along the last axis
+def gadget_decompose(M, logq, log_base=1):
+    d = -(-logq // log_base)
+    digit_dtype = np.min_scalar_type((1 << log_base) - 1)
+
+    M = np.asarray(M) & ((1 << logq) - 1)
+    shifts = np.arange(d, dtype=M.dtype) * log_base
+    digits = (M[..., None] >> shifts) & ((1 << log_base) - 1)
+
+    return digits.astype(digit_dtype).reshape(*M.shape[:-1], M.shape[-1] * d)
+
+# Packs unsigned integers into `bits` little-endian bits each, back to back
+def pack_uints(X, bits):
+    X = np.ascontiguousarray(X)
+    le_bytes = X.astype(X.dtype.newbyteorder("<")).view(np.uint8).reshape(-1, X.dtype.itemsize)
+    bit_rows = np.unpackbits(le_bytes, axis=1, bitorder="little")[:, :bits]
+
+    return np.packbits(bit_rows, bitorder="little").tobytes()
+
+def unpack_uints(buffer, bits, count, dtype):
+    dtype = np.dtype(dtype).newbyteorder("<")
+    bit_rows = np.unpackbits(np.frombuffer(buffer, dtype=np.uint8), count=count * bits, bitorder="little").reshape(count, bits)
+    padded = np.zeros((count, dtype.itemsize * 8), dtype=np.uint8)
+    padded[:, :bits] = bit_rows
+
+    return np.packbits(padded, axis=1, bitorder="little").view(dtype).reshape(count)
+
+# 0/1 matrices stored 8 entries per byte along the last axis (little bit order, rows
+# padded with zero bits), e.g. base-2 gadget decompositions and binary secrets
+def pack_bits(M):
+    return np.packbits(np.asarray(M, dtype=np.uint8), axis=-1, bitorder="little")
+
+def unpack_bits(P, count, dtype=np.uint8):
+    return np.unpackbits(P, axis=-1, count=count, bitorder="little").astype(dtype, copy=False)
+
+# Deterministic Miller-Rabin for q < 2^64
+def is_prime(q):
+    if q < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if q % p == 0:
+            return q == p
+
+    d, r = q - 1, 0
+    while d % 2 == 0:
+        d, r = d // 2, r + 1
+    for a in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        x = pow(a, d, q)
+        if x in (1, q - 1):
+            continue
+        for _ in range(r - 1):
+            x = x * x % q
+            if x == q - 1:
+                break
+        else:
+            return False
+
+    return True